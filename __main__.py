@@ -0,0 +1,9 @@
+# Allows running the checkout as `python -m ai_tools <command>`, see cli.py
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+main()
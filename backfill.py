@@ -0,0 +1,232 @@
+# Backfill of long date ranges with date-sharded parallel crawling.
+#  1. GitHub's `since` filters issues and pull requests on their last update, not on their
+#     creation. The range is split into shards of --shard-days and each shard lists the items
+#     last updated in it (sorted by update, from the shard start until the first item updated
+#     after the shard end). Every item lands in exactly one shard, so items created before the
+#     range but active in it are captured as well.
+#  2. Items active in the range may have been updated again after its end. Tail shards from the
+#     end of the range until now, split like the range, collect them in parallel, skipping the
+#     items created after the range.
+#  3. The shards are crawled by a pool of threads, each with its own Github client. The threads
+#     share one rate-limit budget: when the remaining requests drop below the reserve, all of
+#     them wait for the reset instead of running into the limit one by one.
+#  4. The fetched items are written to the database by the calling thread (the item store
+#     and the search index are not thread-safe). Completed shards that end before the start of
+#     the backfill, tail shards included, are checkpointed in the database, so a failed or
+#     interrupted backfill only crawls the remaining shards (and the one reaching into the
+#     present) when it is run again. Items whose last update is already stored are not fetched
+#     again.
+# Example:
+#   python backfill.py --owner pytorch --repo pytorch --start-date 2024-01-01 --end-date 2024-06-30 --workers 4
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+from utils import get_tokens, is_item_key, reserved_key_prefix
+import github_replay
+import instrumentation
+import summarize_github
+
+logger = logging.getLogger(__name__)
+
+# Database key of the completed shards: {shard key: completion time}
+checkpoint_key = f"{reserved_key_prefix}backfill_checkpoints"
+
+time_format = "%Y-%m-%dT%H:%M:%SZ"
+
+def date_shards(start, end, shard_days):
+    """
+    Split [start, end] into consecutive shards of shard_days days, aligned on start. Both ends of
+    a shard are inclusive, at the second precision of GitHub's timestamps.
+    """
+    shards = []
+    shard_start = start
+    while shard_start <= end:
+        shard_end = min(shard_start + timedelta(days=shard_days, seconds=-1), end)
+        shards.append((shard_start, shard_end))
+        shard_start = shard_end + timedelta(seconds=1)
+    return shards
+
+def shard_key(shard):
+    shard_start, shard_end = shard
+    return f"{shard_start.strftime(time_format)}/{shard_end.strftime(time_format)}"
+
+class RateLimitBudget:
+    """
+    GitHub rate limit shared by the crawling threads. Each thread reports the remaining requests
+    of its client and waits before fetching an item.
+    """
+    def __init__(self, reserve=100, sleep=time.sleep):
+        self.reserve = reserve
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._remaining = None
+        self._reset_time = None
+
+    def update(self, remaining, reset_time):
+        # PyGithub reports -1 until it has seen a response
+        if remaining is None or remaining < 0:
+            return
+        with self._lock:
+            self._remaining = remaining
+            self._reset_time = reset_time
+
+    def wait(self):
+        with self._lock:
+            if self._remaining is None or self._remaining >= self.reserve:
+                return
+            delay = max(0.0, (self._reset_time or 0) - time.time()) + 1
+            logger.warning("%d GitHub requests left, pausing the backfill for %.0f seconds until the rate limit resets.", self._remaining, delay)
+            instrumentation.count("backfill_rate_limit_waits_total")
+            # Sleeping with the lock held makes the other threads wait for the same reset
+            self._sleep(delay)
+            self._remaining = None
+
+def crawl_shard(github, repo, shard, range_end, known, budget):
+    """
+    Fetch the items last updated in the shard, except the ones whose last update is in known
+    ({item key: updated_at}). A shard starting after range_end is a tail shard. Returns the
+    GitHubItems.
+    """
+    shard_start, shard_end = shard
+    fetched = []
+    for item in repo.get_issues(state='all', since=shard_start, sort='updated', direction='asc'):
+        budget.update(github.rate_limiting[0], github.rate_limiting_resettime)
+        if item.updated_at.replace(tzinfo=None) > shard_end:
+            break
+        if shard_start > range_end and item.created_at.replace(tzinfo=None) > range_end:
+            # Created after the range, so it has no activity in it
+            continue
+        if known.get(str(item.number)) == item.updated_at.isoformat():
+            instrumentation.count("backfill_items_total", status="unchanged")
+            continue
+        budget.wait()
+        fetched.append(summarize_github.fetch_item(repo, item))
+        instrumentation.count("backfill_items_total", status="fetched")
+    return fetched
+
+def _store_item(db, github_item):
+    key = str(github_item.number)
+    if key in db:
+        # Keep the cached summary, it is only reused while the summarized text is unchanged
+        stored_item = db[key]
+        github_item.summary = stored_item.summary
+        github_item.summary_key = stored_item.summary_key
+    db[key] = github_item
+
+def _updated_at(db):
+    # The item store reads the field without loading and decompressing the comments
+    if hasattr(db, 'field_values'):
+        return db.field_values('updated_at')
+    return {key: db[key].updated_at for key in db if is_item_key(key)}
+
+def backfill(github_factory, repo_name, start, end, db, workers=4, shard_days=7, reserve=100, now=None):
+    """
+    Crawl the items active between start and end (naive UTC datetimes) into db. github_factory
+    creates a Github client per thread. Returns the keys of the shards that failed.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    checkpoints = dict(db[checkpoint_key]) if checkpoint_key in db else {}
+    shards = date_shards(start, min(end, now), shard_days)
+    if end < now:
+        shards += date_shards(end + timedelta(seconds=1), now, shard_days)
+    pending = [shard for shard in shards if shard_key(shard) not in checkpoints]
+    logger.info("Backfilling %s from %s to %s: %d shards up to now, %d already completed.", repo_name, start, end, len(shards), len(shards) - len(pending))
+
+    known = _updated_at(db)
+    budget = RateLimitBudget(reserve)
+    local = threading.local()
+
+    def run(shard):
+        if not hasattr(local, 'repo'):
+            local.github = github_factory()
+            local.repo = local.github.get_repo(repo_name)
+        with instrumentation.span("backfill_shard"):
+            return crawl_shard(local.github, local.repo, shard, end, known, budget)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run, shard): shard for shard in pending}
+        for future in as_completed(futures):
+            shard = futures[future]
+            key = shard_key(shard)
+            try:
+                github_items = future.result()
+            except Exception:
+                logger.exception("Backfill of shard %s failed.", key)
+                instrumentation.count("backfill_shards_total", status="failed")
+                failed.append(key)
+                continue
+            for github_item in github_items:
+                _store_item(db, github_item)
+            # A shard reaching into the present may still get new updates, it is crawled again next time
+            if shard[1] < now:
+                checkpoints[key] = now.strftime(time_format)
+                db[checkpoint_key] = checkpoints
+            instrumentation.count("backfill_shards_total", status="completed")
+            logger.info("Backfilled shard %s: %d items fetched.", key, len(github_items))
+    if failed:
+        logger.error("%d shards failed, run the backfill again to retry them: %s", len(failed), ", ".join(sorted(failed)))
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill the item database of a GitHub repository over a date range with parallel, checkpointed crawling.")
+    parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
+    parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
+    parser.add_argument("--start-date", type=str, required=True, help="Start date of the range (YYYY-MM-DD)")
+    parser.add_argument("--end-date", type=str, default=datetime.now().strftime('%Y-%m-%d'), help="End date of the range (YYYY-MM-DD)")
+    parser.add_argument("--db-path", type=str, default=None, help="Path to the item database of summarize_github.py")
+    parser.add_argument("--workers", type=int, default=4, help="Number of shards crawled in parallel")
+    parser.add_argument("--shard-days", type=int, default=7, help="Number of days per shard")
+    parser.add_argument("--rate-limit-reserve", type=int, default=100, help="Pause all workers until the rate limit resets when fewer GitHub requests are left")
+    parser.add_argument("--no-search-index", action="store_true", help="Do not update the full-text search index (see search_index.py)")
+    parser.add_argument("--record", type=str, default=None, help="Record all GitHub API responses of this run to the given archive (see github_replay.py)")
+    parser.add_argument("--replay", type=str, default=None, help="Serve all GitHub API requests from the given archive instead of the network")
+    parser.add_argument("--run-report", type=str, default=None, help="Write a JSON report with per-stage timings and GitHub request counts to this file")
+    parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    db_path = args.db_path if args.db_path else f"{args.owner}_{args.repo}_db"
+    instrumentation.start_run("backfill", args.run_report)
+
+    token, _, _ = get_tokens()
+    if args.record:
+        github_replay.enable_recording(args.record)
+    elif args.replay:
+        github_replay.enable_replay(args.replay)
+        token = token or "replay"
+    if not token:
+        logger.error("Error: GitHub token not found in environment variables.")
+        sys.exit(1)
+    instrumentation.instrument_github()
+
+    import item_store
+    from github import Github
+    from search_index import SearchIndex, IndexedDB, index_path
+    start = datetime.strptime(args.start_date, "%Y-%m-%d")
+    end = datetime.strptime(args.end_date, "%Y-%m-%d") + timedelta(days=1, seconds=-1)
+    with item_store.open_db(db_path) as db, SearchIndex(index_path(db_path)) as index:
+        if not args.no_search_index:
+            db = IndexedDB(db, index)
+        with instrumentation.span("backfill"):
+            failed = backfill(lambda: Github(token), f"{args.owner}/{args.repo}", start, end, db,
+                              workers=args.workers, shard_days=args.shard_days, reserve=args.rate_limit_reserve)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# Benchmarks of the fetch, filter, chunk, tokenize and summarize stages on synthetic GitHub
+# activity (see synthetic.py). Every case runs in a fresh process so that its peak RSS can be
+# measured, and the results are written as JSON:
+#   {"meta": {...}, "results": [{"case", "size", "items", "seconds", "throughput", "p50_ms", "p99_ms", "peak_rss_mb",
+#                                "peak_children_rss_mb"}, ...]}
+# Examples:
+#   python benchmarks/run_benchmarks.py --sizes 1000,10000 --output bench_output.json
+#   python benchmarks/run_benchmarks.py --cases apply_rules_summarize --baseline bench_output.json --max-regression 0.2
+# The fetch case crawls a synthetic repository with summarize_github.refresh_items, replayed by
+# github_replay from an archive recorded beforehand (untimed), so it measures the client side of
+# the fetch stage without network latency.
+# The cold_start case measures the import time of the entry points with `python -X importtime`
+# in fresh interpreters; it does not depend on the size and only runs for the first one.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(bench_dir)
+sys.path.append(os.path.dirname(bench_dir))
+
+import item_store
+import synthetic
+
+def _timed(fn, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def _rules():
+    return {
+        'start_date': datetime(2024, 7, 10),
+        'end_date': datetime(2024, 7, 20),
+        'specified_user': 'EikanWang',
+        'number_of_ccer': 10,
+    }
+
+def bench_apply_rules_summarize(size, options):
+    import summarize_github
+    items = synthetic.summarize_items(size)
+    rules = _rules()
+    return size, _timed(summarize_github.apply_rules, [(item, rules) for item in items])
+
+def bench_apply_rules_highlight(size, options):
+    import highlight_github_activities
+    items = synthetic.highlight_items(size)
+    rules = _rules()
+    return size, _timed(highlight_github_activities.apply_rules, [(item, 0, rules) for item in items])
+
+def bench_filter_items_parallel(size, options):
+    import summarize_github
+    items = synthetic.summarize_items(size)
+    rules = _rules()
+    return size, _timed(summarize_github.filter_items, [(items, rules, options.filter_workers)])
+
+def bench_count_tokens(size, options):
+    import summarize_github
+    texts = [item.full_str() for item in synthetic.summarize_items(size)]
+    return size, _timed(summarize_github.count_tokens, [(text,) for text in texts])
+
+def bench_split_text_into_chunks(size, options):
+    import llm_summarize
+    text = synthetic.document(size)
+    return size, _timed(llm_summarize.split_text_into_chunks, [(text, options.max_chunk_tokens, options.overlap_tokens)])
+
+def bench_text_summarize(size, options):
+    import llm_backends
+    import summarize_github
+    from mock_llm_server import MockLLMServer
+    texts = [item.full_str() for item in synthetic.summarize_items(size)]
+    latencies = []
+    summarize_chunk = summarize_github.summarize_chunk
+
+    def timed_summarize_chunk(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return summarize_chunk(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    with MockLLMServer(latency=options.llm_latency, latency_jitter=options.llm_latency_jitter) as server:
+        llm_backends.configure_backend("Local", base_url=server.url, max_concurrency=options.llm_concurrency)
+        summarize_github.summarize_chunk = timed_summarize_chunk
+        summarize_github.text_summarize(texts, serving="Local")
+    return size, latencies
+
+def bench_fetch(size, options):
+    import github_replay
+    import summarize_github
+    from github import Github
+    synthetic.SyntheticGitHubConnection.items = {fields["number"]: fields for fields in synthetic.generate_item_fields(size)}
+    connect = lambda: Github(seconds_between_requests=0, seconds_between_writes=0).get_repo("o/r")
+    latencies = []
+    fetch_item = summarize_github.fetch_item
+
+    def timed_fetch_item(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch_item(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # record the crawl of the synthetic repository once, untimed, and replay it
+        archive_path = os.path.join(tmp_dir, "fetch.jsonl.gz")
+        connection_classes = (synthetic.SyntheticGitHubConnection, synthetic.SyntheticGitHubConnection)
+        with item_store.open_db(os.path.join(tmp_dir, "recorded")) as db:
+            archive = github_replay.enable_recording(archive_path, connection_classes)
+            summarize_github.refresh_items(connect(), "2024-07-01T00:00:00Z", "2024-12-31T00:00:00Z", db)
+            archive.close()
+        synthetic.SyntheticGitHubConnection.items = {}
+        github_replay.enable_replay(archive_path)
+        summarize_github.fetch_item = timed_fetch_item
+        with item_store.open_db(os.path.join(tmp_dir, "replayed")) as db:
+            summarize_github.refresh_items(connect(), "2024-07-01T00:00:00Z", "2024-12-31T00:00:00Z", db)
+        github_replay.disable()
+    return size, latencies
+
+def bench_store_write(size, options):
+    items = synthetic.summarize_items(size)
+    with tempfile.TemporaryDirectory() as tmp_dir, item_store.open_db(os.path.join(tmp_dir, "db")) as db:
+        return size, _timed(db.__setitem__, [(str(item.number), item) for item in items])
+
+def bench_store_read(size, options):
+    items = synthetic.summarize_items(size)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "db")
+        with item_store.open_db(db_path) as db:
+            for item in items:
+                db[str(item.number)] = item
+        del items
+        with item_store.open_db(db_path, readonly=True) as db:
+            return size, _timed(db.__getitem__, [(key,) for key in list(db.keys())])
+
+entry_points = ["cli", "summarize_github", "highlight_github_activities", "llm_summarize", "search_index"]
+_importtime_pattern = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| (\S+)$")
+
+def import_time(module):
+    """
+    Cumulative import time in seconds of the module in a fresh interpreter, as reported by -X importtime.
+    """
+    code = f"import sys; sys.path.insert(0, {os.path.dirname(bench_dir)!r}); import {module}"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True).stderr
+    for line in stderr.splitlines():
+        match = _importtime_pattern.match(line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1e6
+    raise RuntimeError(f"No import time reported for {module}")
+
+def bench_cold_start(size, options):
+    latencies = []
+    import_seconds = {}
+    for module in entry_points:
+        runs = [import_time(module) for _ in range(options.startup_runs)]
+        import_seconds[module] = round(_percentile(runs, 50), 6)
+        latencies += runs
+    return len(latencies), latencies, {"import_seconds_p50": import_seconds}
+
+size_independent_cases = {"cold_start"}
+
+cases = {
+    "apply_rules_summarize": bench_apply_rules_summarize,
+    "apply_rules_highlight": bench_apply_rules_highlight,
+    "filter_items_parallel": bench_filter_items_parallel,
+    "count_tokens": bench_count_tokens,
+    "split_text_into_chunks": bench_split_text_into_chunks,
+    "text_summarize": bench_text_summarize,
+    "fetch": bench_fetch,
+    "store_write": bench_store_write,
+    "store_read": bench_store_read,
+    "cold_start": bench_cold_start,
+}
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+def _peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(who).ru_maxrss
+    return round(peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024, 1)
+
+def _run_case(name, size, options):
+    """
+    Run a single case. Executed in a fresh worker process.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    start = time.perf_counter()
+    items, latencies, *extra = cases[name](size, options)
+    seconds = time.perf_counter() - start
+    busy = sum(latencies)
+    result = {
+        "case": name,
+        "size": size,
+        "items": items,
+        "ops": len(latencies),
+        "seconds": round(seconds, 4),
+        "throughput": round(items / busy, 2) if busy else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 4),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        # largest subprocess of the case, e.g. the interpreters of cold_start
+        "peak_children_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    for fields in extra:
+        result.update(fields)
+    return result
+
+def compare_with_baseline(results, baseline, max_regression):
+    """
+    Return the (case, size) pairs whose throughput dropped by more than max_regression
+    (a fraction) compared with the baseline results.
+    """
+    baseline_throughput = {(r["case"], r["size"]): r["throughput"] for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_throughput.get((result["case"], result["size"]))
+        if reference and result["throughput"] is not None and result["throughput"] < reference * (1 - max_regression):
+            regressions.append((result["case"], result["size"], reference, result["throughput"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GitHub summarization pipeline on synthetic data.")
+    parser.add_argument("--cases", type=str, default=",".join(cases), help=f"Comma-separated cases to run ({', '.join(cases)})")
+    parser.add_argument("--sizes", type=str, default="1000,10000,100000", help="Comma-separated numbers of synthetic items")
+    parser.add_argument("--filter-workers", type=int, default=0, help="Processes for the filter_items_parallel case, 0 for one per CPU core")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latency in seconds of the mock LLM endpoint")
+    parser.add_argument("--llm-latency-jitter", type=float, default=0.0, help="Maximum random extra latency in seconds of the mock LLM endpoint")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="Maximum concurrent requests to the mock LLM endpoint")
+    parser.add_argument("--max-chunk-tokens", type=int, default=2000, help="Maximum tokens per chunk for split_text_into_chunks")
+    parser.add_argument("--overlap-tokens", type=int, default=200, help="Overlapping tokens between chunks for split_text_into_chunks")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per entry point for the cold_start case")
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON results of a previous run to compare the throughput with")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Maximum tolerated throughput drop compared with the baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    for name in args.cases.split(","):
+        for size in sizes[:1] if name in size_independent_cases else sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                result = executor.submit(_run_case, name, size, args).result()
+            print(f"{name} size={size}: {result['throughput']} items/s, p50 {result['p50_ms']} ms, "
+                  f"p99 {result['p99_ms']} ms, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "llm_latency": args.llm_latency,
+            "llm_concurrency": args.llm_concurrency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.max_regression)
+        for case, size, reference, throughput in regressions:
+            print(f"Regression in {case} size={size}: {throughput} items/s vs. {reference} items/s in the baseline", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Synthetic GitHub activity at realistic scale for the benchmarks.
+# Items mimic pytorch traffic: mostly short titles, template-heavy descriptions, long comment
+# threads with bot comments, CI logs and quoted replies, and a fraction of XPU/Intel related
+# items so that the highlight rules take both branches.
+
+import json
+import random
+from itertools import islice
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+_authors = [f"user{i}" for i in range(400)] + ["pytorchmergebot", "pytorch-bot[bot]", "facebook-github-bot", "EikanWang", "etaf"]
+_labels = ["module: xpu", "module: inductor", "module: dynamo", "triaged", "open source", "ciflow/trunk", "release notes: nn", "oncall: distributed"]
+_words = ("tensor kernel compile graph inductor dynamo fusion backward forward cuda xpu mkldnn oneDNN triton "
+          "regression fix add support test flaky failure memory layout stride dtype shape benchmark").split()
+_log_line = "[2024-07-01 12:00:00] INFO test_ops.py::TestCommonCPU::test_variant_consistency_eager_{} PASSED"
+
+def _sentence(rng, length=12):
+    return ' '.join(rng.choice(_words) for _ in range(length)).capitalize() + '.'
+
+def _paragraph(rng, sentences=4):
+    return ' '.join(_sentence(rng) for _ in range(sentences))
+
+def _body(rng):
+    kind = rng.random()
+    if kind < 0.2:
+        return "\n".join(_log_line.format(i) for i in range(rng.randint(20, 200)))
+    if kind < 0.35:
+        return "> " + _sentence(rng) + "\n\n" + _paragraph(rng, 2)
+    return _paragraph(rng, rng.randint(1, 6))
+
+def _comments(rng, start, count):
+    comments = []
+    for i in range(count):
+        author = rng.choice(_authors)
+        comments.append({
+            "author": author,
+            "body": _body(rng) if not author.endswith("bot") else "Merge started. Your change will be merged once all checks pass.",
+            "created_at": (start + timedelta(hours=i, minutes=rng.randint(0, 59))).isoformat(),
+        })
+    return comments
+
+def generate_item_fields(count, seed=0, start_date=datetime(2024, 7, 1), mean_comments=20):
+    """
+    Yield dicts with the fields of summarize_github.GitHubItem for count synthetic items.
+    """
+    rng = random.Random(seed)
+    for number in range(1, count + 1):
+        created_at = start_date + timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        is_pr = rng.random() < 0.6
+        title = _sentence(rng, rng.randint(4, 10))[:-1]
+        if rng.random() < 0.05:
+            title = "DISABLED " + title
+        description = "<!-- Please read the contribution guide -->\n" + _paragraph(rng, rng.randint(2, 8))
+        if rng.random() < 0.3:
+            description += "\ncc @" + " @".join(rng.sample(_authors, rng.randint(1, 15)))
+        yield {
+            "number": number,
+            "title": title,
+            "url": f"https://github.com/pytorch/pytorch/{'pull' if is_pr else 'issues'}/{number}",
+            "description": description,
+            "submitter": rng.choice(_authors),
+            "tags": rng.sample(_labels, rng.randint(0, 3)),
+            "assignees": rng.sample(_authors, rng.randint(0, 2)),
+            "reviewers": rng.sample(_authors, rng.randint(0, 4)) if is_pr else [],
+            "created_at": created_at.isoformat(),
+            "comments": _comments(rng, created_at, int(rng.expovariate(1 / mean_comments))),
+            "review_comments": _comments(rng, created_at, int(rng.expovariate(2 / mean_comments))) if is_pr else [],
+            "state": rng.choice(["open", "closed"]),
+        }
+
+def summarize_items(count, seed=0, **kwargs):
+    """
+    Synthetic summarize_github.GitHubItem objects.
+    """
+    from summarize_github import GitHubItem
+    return [GitHubItem(**fields) for fields in generate_item_fields(count, seed, **kwargs)]
+
+def highlight_items(count, seed=0, **kwargs):
+    """
+    Synthetic highlight_github_activities.GitHubItem objects, with an email for every author.
+    """
+    from highlight_github_activities import GitHubItem, GithubUser
+    items = []
+    for fields in generate_item_fields(count, seed, **kwargs):
+        for comment in fields["comments"] + fields["review_comments"]:
+            comment["author_github_user"] = GithubUser(comment["author"], f"{comment['author']}@example.com")
+        items.append(GitHubItem(fields["number"], fields["title"], fields["url"], fields["description"], fields["submitter"],
+                                f"{fields['submitter']}@example.com", fields["tags"], fields["assignees"], fields["reviewers"],
+                                fields["created_at"], fields["comments"], fields["review_comments"], fields["state"]))
+    return items
+
+def document(num_items, seed=0):
+    """
+    A large text document like the concatenated GitHub dumps fed to llm_summarize.py.
+    """
+    return "\n\n".join(item.full_str() for item in summarize_items(num_items, seed))
+
+class SyntheticGitHubConnection:
+    """
+    PyGithub connection class serving the synthetic items of repository o/r as a GitHub API
+    (repository, issue list, issue, pull request, comments and reviews), to record archives for
+    github_replay. Set items to {number: fields} of generate_item_fields before use.
+    """
+    items = {}
+    per_page = 100
+
+    def __init__(self, host, port=None, *args, **kwargs):
+        self.protocol = "https"
+        self.host = host
+
+    def request(self, verb, url, input, headers, stream=False):
+        self.url = url
+
+    @staticmethod
+    def _time(timestamp):
+        return timestamp + "Z"
+
+    def _comments(self, comments):
+        return [{"id": i, "user": {"login": comment["author"]}, "body": comment["body"], "created_at": self._time(comment["created_at"])}
+                for i, comment in enumerate(comments)]
+
+    def _issue(self, fields):
+        number = fields["number"]
+        return {
+            "id": number, "number": number, "title": fields["title"], "body": fields["description"],
+            "html_url": fields["url"], "url": f"https://api.github.com/repos/o/r/issues/{number}",
+            "user": {"login": fields["submitter"]}, "labels": [{"name": label} for label in fields["tags"]],
+            "assignees": [{"login": login} for login in fields["assignees"]], "state": fields["state"],
+            "created_at": self._time(fields["created_at"]), "updated_at": self._time(fields["created_at"]),
+        }
+
+    def _route(self, path, query):
+        parts = path.strip("/").split("/")[3:]
+        if not parts:
+            return {"id": 1, "name": "r", "full_name": "o/r", "url": "https://api.github.com/repos/o/r"}, None
+        if parts == ["issues"]:
+            page = int(query.get("page", ["1"])[0])
+            issues = list(islice(self.items.values(), (page - 1) * self.per_page, page * self.per_page))
+            link = None
+            if page * self.per_page < len(self.items):
+                link = f'<https://api.github.com{path}?{urlencode(dict(query, page=[str(page + 1)]), doseq=True)}>; rel="next"'
+            return [self._issue(fields) for fields in issues], link
+        kind, number, *rest = parts
+        fields = self.items[int(number)]
+        if not rest:
+            data = self._issue(fields)
+            if kind == "pulls":
+                data["url"] = f"https://api.github.com/repos/o/r/pulls/{fields['number']}"
+            return data, None
+        if rest == ["reviews"]:
+            return [{"id": i, "user": {"login": login}} for i, login in enumerate(fields["reviewers"])], None
+        return self._comments(fields["review_comments"] if kind == "pulls" else fields["comments"]), None
+
+    def getresponse(self):
+        url = urlsplit(self.url)
+        data, link = self._route(url.path, parse_qs(url.query))
+        headers = {"Content-Type": "application/json"}
+        if link:
+            headers["Link"] = link
+        return _SyntheticResponse(200, headers, json.dumps(data))
+
+    def close(self):
+        pass
+
+class _SyntheticResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self._headers = headers
+        self._body = body
+
+    def getheaders(self):
+        return self._headers.items()
+
+    def read(self):
+        return self._body
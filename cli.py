@@ -0,0 +1,136 @@
+# Single entry point for the tools in this repository. Examples:
+#   python cli.py summarize --owner pytorch --repo pytorch --dedup
+#   python cli.py highlight --interval 24
+#   python cli.py llm-summarize --input-file dump.txt
+#   python cli.py search "oneDNN AND conv"
+#   python cli.py backfill --start-date 2024-01-01 --end-date 2024-06-30
+#   python cli.py batch jobs.txt
+# The checkout can also be run as `python -m ai_tools` (or `python path/to/ai_tools`).
+#  1. A subcommand only imports its own module, and the modules defer their heavy dependencies
+#     (PyGithub, openai, tiktoken, nltk) to the code paths that need them.
+#  2. batch runs one command per line of a file (or stdin) in the same process, so imports,
+#     HTTP clients, tokenizers and LLM request coalescing stay warm across commands. A failing
+#     command does not stop the batch. The LLM backend overrides, the resilience policy and the
+#     circuit breakers of a command are restored afterwards, so they do not leak into the next.
+
+import argparse
+import importlib
+import logging
+import os
+import shlex
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+logger = logging.getLogger(__name__)
+
+# Subcommand: (module, description)
+commands = {
+    "summarize": ("summarize_github", "Fetch, filter and summarize GitHub issues and pull requests"),
+    "highlight": ("highlight_github_activities", "Highlight the GitHub activities of Intel contributors"),
+    "llm-summarize": ("llm_summarize", "Chunk-based summarization of a long text"),
+    "search": ("search_index", "Query the full-text search index of collected items"),
+    "backfill": ("backfill", "Crawl a long date range into the item database with parallel, checkpointed shards"),
+    "store": ("item_store", "Show, compact or vacuum the item store, or migrate a shelve database into it"),
+    "export": ("export_parquet", "Export collected items to partitioned Parquet datasets"),
+    "mock-llm": ("mock_llm_server", "Run a local mock of an OpenAI-compatible endpoint"),
+}
+
+def run_command(argv):
+    """
+    Run a subcommand given as an argument list, e.g. ["search", "--state", "open", "xpu"].
+    """
+    name, args = argv[0], argv[1:]
+    if name not in commands:
+        raise SystemExit(f"Unknown command '{name}', available commands: {', '.join(commands)}, batch")
+    module = importlib.import_module(commands[name][0])
+    # Show "ai_tools <command>" in the usage of the command
+    prog = sys.argv[0]
+    sys.argv[0] = f"ai_tools {name}"
+    try:
+        module.main(args)
+    finally:
+        sys.argv[0] = prog
+
+def _save_state():
+    # Commands override the LLM backends (e.g. --llm-concurrency, --base-url) and the resilience
+    # policy for their run
+    import llm_backends
+    import llm_resilience
+    return dict(llm_backends.backends), llm_resilience.default_policy
+
+def _finish_command(state):
+    # Write the run report of the command and restore PyGithub's connection classes, so that
+    # the next command does not count its requests twice
+    if "instrumentation" in sys.modules:
+        sys.modules["instrumentation"].finish_run()
+    if "github" in sys.modules:
+        import github_replay
+        github_replay.disable()
+    # Restore the LLM settings, and forget the circuit breakers and the clients created with
+    # the settings of the command
+    import llm_backends
+    import llm_resilience
+    backends, policy = state
+    llm_backends.restore_backends(backends)
+    llm_resilience.default_policy = policy
+    llm_resilience.reset()
+
+def run_batch(lines):
+    """
+    Run one command per line, skipping empty lines and # comments. Returns the number of
+    failed commands.
+    """
+    failures = 0
+    for line_number, line in enumerate(lines, 1):
+        argv = shlex.split(line, comments=True)
+        if not argv:
+            continue
+        logger.info("Running batch command %d: %s", line_number, ' '.join(argv))
+        state = _save_state()
+        try:
+            run_command(argv)
+        except SystemExit as e:
+            if e.code:
+                failures += 1
+                logger.error("Batch command %d exited with %s", line_number, e.code)
+        except Exception:
+            failures += 1
+            logger.exception("Batch command %d failed", line_number)
+        finally:
+            _finish_command(state)
+    return failures
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog="ai_tools",
+        description="Tools to collect, search and summarize GitHub activities.",
+        epilog="Commands: " + "; ".join(f"{name}: {description}" for name, (_, description) in commands.items())
+               + "; batch: run one command per line of a file in the same process. Use '<command> --help' for its options.",
+    )
+    parser.add_argument("command", choices=list(commands) + ["batch"], help="Command to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments of the command")
+    # Only parse the command name, the command parses its own arguments
+    if argv and argv[0] in commands:
+        return run_command(argv)
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        batch_parser = argparse.ArgumentParser(prog="ai_tools batch", description="Run one command per line in the same process.")
+        batch_parser.add_argument("file", nargs="?", default="-", help="File with one command per line, '-' for stdin")
+        batch_parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+        batch_args = batch_parser.parse_args(args.args)
+        logging.basicConfig(level=getattr(logging, batch_args.log_level.upper(), logging.INFO), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+        if batch_args.file == "-":
+            failures = run_batch(sys.stdin)
+        else:
+            with open(batch_args.file, 'r') as f:
+                failures = run_batch(f.readlines())
+        if failures:
+            sys.exit(1)
+    else:
+        run_command([args.command] + args.args)
+
+if __name__ == "__main__":
+    main()
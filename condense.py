@@ -0,0 +1,220 @@
+# Condensation of GitHub item texts before LLM summarization.
+#  1. Descriptions and comments are passed through a chain of rules, each a function mapping a
+#     text to a shorter text: HTML comments of PR templates, quoted replies, bot commands, long
+#     code/log blocks and tracebacks (collapsed to their first and last lines), blank lines.
+#     A comment left empty by the rules is dropped.
+#  2. Every comment is then capped to max_comment_tokens and every rendered item to
+#     max_item_tokens, keeping the head and the tail of the text (resp. the first and the last
+#     comments), where the problem statement and the outcome usually are.
+#  3. The tokens removed by every rule are accumulated, so report() can log and record how many
+#     prompt tokens the condensation saved. Tokens are estimated at 4 characters per token,
+#     which is precise enough for caps and reports and much cheaper than running the tokenizer.
+# Custom rules are added with register_rule(name, fn) and selected by name.
+
+import copy
+import logging
+import re
+from collections import Counter
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+def _collapse_lines(lines, head, tail):
+    if len(lines) <= head + tail + 1:
+        return lines
+    return lines[:head] + [f"... ({len(lines) - head - tail} lines omitted) ..."] + lines[-tail:]
+
+_html_comment_pattern = re.compile(r"<!--.*?-->", re.DOTALL)
+
+def strip_html_comments(text):
+    """
+    Drop HTML comments, e.g. the hints of PR and issue templates.
+    """
+    return _html_comment_pattern.sub("", text)
+
+_quoted_line_pattern = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+
+def strip_quoted_replies(text):
+    """
+    Drop the lines quoting earlier comments ("> ..."), the quoted comment is already in the text.
+    """
+    return _quoted_line_pattern.sub("", text)
+
+_bot_command_pattern = re.compile(r"^[ \t]*@\w*bot\b.*(?:\n|$)", re.MULTILINE | re.IGNORECASE)
+
+def strip_bot_commands(text):
+    """
+    Drop the lines that are commands to bots, e.g. "@pytorchbot merge".
+    """
+    return _bot_command_pattern.sub("", text)
+
+_fenced_block_pattern = re.compile(r"^([ \t]*)(```|~~~)[^\n]*\n(.*?)^[ \t]*\2[ \t]*$", re.DOTALL | re.MULTILINE)
+_details_pattern = re.compile(r"(<details[^>]*>)(.*?)(</details>)", re.DOTALL | re.IGNORECASE)
+
+def collapse_blocks(text, head=8, tail=8):
+    """
+    Collapse fenced code blocks and <details> sections to their first and last lines. Pasted CI
+    logs and stack traces are mostly noise except for the command and the final error.
+    """
+    def collapse_fenced(match):
+        lines = _collapse_lines(match.group(3).rstrip('\n').split('\n'), head, tail)
+        return f"{match.group(1)}{match.group(2)}\n" + '\n'.join(lines) + f"\n{match.group(1)}{match.group(2)}"
+
+    def collapse_details(match):
+        lines = _collapse_lines(match.group(2).strip('\n').split('\n'), head, tail)
+        return match.group(1) + '\n' + '\n'.join(lines) + '\n' + match.group(3)
+
+    return _details_pattern.sub(collapse_details, _fenced_block_pattern.sub(collapse_fenced, text))
+
+# Lines of unfenced logs and tracebacks: timestamps, Python/C++ frames, numbered frames, CI prefixes
+_log_line_pattern = re.compile(
+    r"^\s*(?:\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}|\[\d{2}:\d{2}|File \".*\", line \d+|at \S+\(|#\d+\s+0x|frame #\d+|##\[)"
+)
+
+def collapse_log_runs(text, min_lines=12, head=4, tail=4):
+    """
+    Collapse runs of at least min_lines log or traceback lines pasted outside of code blocks.
+    """
+    lines = text.split('\n')
+    result = []
+    run = []
+    for line in lines + [None]:
+        # Indented lines (source excerpts of traceback frames) continue a run
+        if line is not None and (_log_line_pattern.match(line) or (run and line.startswith((' ', '\t')) and line.strip())):
+            run.append(line)
+            continue
+        result.extend(_collapse_lines(run, head, tail) if len(run) >= min_lines else run)
+        run = []
+        if line is not None:
+            result.append(line)
+    return '\n'.join(result)
+
+_blank_lines_pattern = re.compile(r"\n[ \t]*(?:\n[ \t]*)+\n")
+_trailing_spaces_pattern = re.compile(r"[ \t]+$", re.MULTILINE)
+
+def collapse_blank_lines(text):
+    return _blank_lines_pattern.sub("\n\n", _trailing_spaces_pattern.sub("", text)).strip()
+
+# Rule name: function mapping a text to its condensed text, applied in this order
+rules = {
+    "html_comments": strip_html_comments,
+    "quoted_replies": strip_quoted_replies,
+    "bot_commands": strip_bot_commands,
+    "code_blocks": collapse_blocks,
+    "log_runs": collapse_log_runs,
+    "blank_lines": collapse_blank_lines,
+}
+
+def register_rule(name, fn):
+    """
+    Add or replace a condensation rule. New rules are applied after the built-in ones.
+    """
+    rules[name] = fn
+
+def cap_text(text, max_tokens, marker="\n... ({} characters omitted) ...\n"):
+    """
+    Cap a text to about max_tokens by keeping its head and its tail.
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return text[:head] + marker.format(len(text) - head - tail) + text[-tail:]
+
+class Condenser:
+    """
+    Condense the texts of GitHubItems with the selected rules (all by default) and caps, and
+    account for the tokens saved.
+    """
+    def __init__(self, rule_names=None, max_comment_tokens=500, max_item_tokens=4000):
+        unknown = [name for name in rule_names or [] if name not in rules]
+        if unknown:
+            raise ValueError(f"Unknown condensation rules {unknown}, available rules: {', '.join(rules)}")
+        self.rule_names = list(rule_names) if rule_names is not None else list(rules)
+        self.max_comment_tokens = max_comment_tokens
+        self.max_item_tokens = max_item_tokens
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.saved = Counter()
+
+    def _account(self, name, before, after):
+        self.saved[name] += estimate_tokens(before) - estimate_tokens(after)
+
+    def condense_text(self, text, max_tokens=None):
+        for name in self.rule_names:
+            condensed = rules[name](text)
+            self._account(name, text, condensed)
+            text = condensed
+        if max_tokens:
+            capped = cap_text(text, max_tokens)
+            self._account("comment_cap", text, capped)
+            text = capped
+        return text
+
+    def _condense_comments(self, comments):
+        condensed = []
+        for comment in comments:
+            body = self.condense_text(comment['body'] or "", self.max_comment_tokens)
+            if body:
+                condensed.append({**comment, 'body': body})
+        return condensed
+
+    def condense(self, item, need_comments=True):
+        """
+        Shallow copy of a GitHubItem with a condensed description and, with need_comments,
+        condensed comments.
+        """
+        condensed = copy.copy(item)
+        condensed.description = self.condense_text(item.description or "")
+        if need_comments:
+            condensed.comments = self._condense_comments(item.comments)
+            condensed.review_comments = self._condense_comments(item.review_comments)
+        return condensed
+
+    def render(self, item, need_comments=True):
+        """
+        Condensed replacement of item.full_str(need_comments).
+        """
+        original = item.full_str(need_comments=need_comments)
+        condensed = self.condense(item, need_comments)
+        text = condensed.full_str(need_comments=need_comments)
+        # Over the item cap, keep halving the comments in the middle of the discussion
+        comments = condensed.comments
+        keep = len(comments)
+        while need_comments and estimate_tokens(text) > self.max_item_tokens and keep > 2:
+            keep //= 2
+            marker = {'author': "...", 'created_at': "...", 'body': f"({len(comments) - keep} comments omitted)"}
+            condensed.comments = comments[:keep // 2] + [marker] + comments[len(comments) - (keep - keep // 2):]
+            dropped = condensed.full_str(need_comments=need_comments)
+            self._account("item_cap", text, dropped)
+            text = dropped
+        capped = cap_text(text, self.max_item_tokens)
+        self._account("item_cap", text, capped)
+        self.tokens_before += estimate_tokens(original)
+        self.tokens_after += estimate_tokens(capped)
+        return capped
+
+    def report(self):
+        """
+        Log and record the estimated tokens saved, in total and per rule. Returns the report.
+        """
+        saved = self.tokens_before - self.tokens_after
+        report = {
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'tokens_saved': saved,
+            'saved_by_rule': {name: tokens for name, tokens in self.saved.items() if tokens},
+        }
+        for name, tokens in report['saved_by_rule'].items():
+            instrumentation.count("condense_tokens_saved_total", tokens, rule=name)
+        instrumentation.count("condense_tokens_before_total", self.tokens_before)
+        instrumentation.count("condense_tokens_after_total", self.tokens_after)
+        ratio = saved / self.tokens_before if self.tokens_before else 0.0
+        logger.info("Condensed the items from about %d to %d tokens (%.0f%% saved): %s", self.tokens_before, self.tokens_after,
+                    100 * ratio, ", ".join(f"{name} {tokens}" for name, tokens in report['saved_by_rule'].items()))
+        return report
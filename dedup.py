@@ -0,0 +1,143 @@
+# Near-duplicate detection and clustering of GitHub items before LLM summarization.
+#  1. Near-duplicates (e.g. DISABLED test variants or bot PRs that only differ by a test name
+#     or a commit hash) are detected with SimHash over the title and the description. Each
+#     group of near-duplicates is collapsed into its first item.
+#  2. Related items are detected with MinHash over the title words and the labels. Groups of
+#     related items are put next to each other, so they are summarized together.
+# Both stages use LSH banding to find candidate pairs, so the cost is roughly linear in the
+# number of items instead of quadratic.
+
+import hashlib
+import logging
+import re
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+_word_pattern = re.compile(r"[a-z][a-z_]+")
+_mersenne_prime = (1 << 61) - 1
+
+def _hash64(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def tokenize(text, max_tokens=2000):
+    """
+    Lowercase the text and split it into words. Numbers, hashes and punctuation are dropped so
+    that items only differing by an ID, a commit or a line number produce the same tokens.
+    """
+    return _word_pattern.findall(text.lower())[:max_tokens]
+
+def simhash(tokens, shingle_size=3):
+    """
+    Compute the 64-bit SimHash of a token list using word shingles as features.
+    """
+    if len(tokens) < shingle_size:
+        shingles = [' '.join(tokens)]
+    else:
+        shingles = [' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    weights = [0] * 64
+    for shingle in set(shingles):
+        h = _hash64(shingle)
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def minhash(tokens, num_perm=32):
+    """
+    Compute the MinHash signature of a token set with num_perm universal hash permutations.
+    """
+    hashes = {_hash64(token) for token in tokens} or {0}
+    signature = []
+    for i in range(num_perm):
+        a, b = 2 * i + 1, _hash64(f"perm{i}")
+        signature.append(min((a * h + b) % _mersenne_prime for h in hashes))
+    return signature
+
+def _candidate_pairs(band_keys):
+    buckets = defaultdict(list)
+    for index, keys in enumerate(band_keys):
+        for key in keys:
+            buckets[key].append(index)
+    pairs = set()
+    for members in buckets.values():
+        for i in range(1, len(members)):
+            pairs.add((members[0], members[i]))
+            pairs.add((members[i - 1], members[i]))
+    return pairs
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        # Keep the smallest index as root so that groups are ordered by first appearance
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+    def groups(self):
+        groups = defaultdict(list)
+        for i in range(len(self.parent)):
+            groups[self.find(i)].append(i)
+        return [groups[root] for root in sorted(groups)]
+
+def find_near_duplicates(texts, max_distance=3):
+    """
+    Group texts whose SimHash differs by at most max_distance bits. Returns groups of indices,
+    each sorted, ordered by the first index.
+    """
+    fingerprints = [simhash(tokenize(text)) for text in texts]
+    # Split the fingerprint into max_distance + 1 bands. By the pigeonhole principle two
+    # fingerprints within max_distance bits share at least one identical band.
+    num_bands = max_distance + 1
+    band_bits = 64 // num_bands
+    mask = (1 << band_bits) - 1
+    band_keys = [[(band, (fp >> (band * band_bits)) & mask) for band in range(num_bands)] for fp in fingerprints]
+    union_find = _UnionFind(len(texts))
+    for i, j in _candidate_pairs(band_keys):
+        if (fingerprints[i] ^ fingerprints[j]).bit_count() <= max_distance:
+            union_find.union(i, j)
+    return union_find.groups()
+
+def find_related(token_sets, min_similarity=0.5, num_perm=32, rows_per_band=2):
+    """
+    Group token sets whose estimated Jaccard similarity is at least min_similarity. Returns
+    groups of indices, each sorted, ordered by the first index.
+    """
+    signatures = [minhash(tokens, num_perm) for tokens in token_sets]
+    band_keys = [
+        [(start, tuple(signature[start:start + rows_per_band])) for start in range(0, num_perm, rows_per_band)]
+        for signature in signatures
+    ]
+    union_find = _UnionFind(len(token_sets))
+    for i, j in _candidate_pairs(band_keys):
+        similarity = sum(x == y for x, y in zip(signatures[i], signatures[j])) / num_perm
+        if similarity >= min_similarity:
+            union_find.union(i, j)
+    return union_find.groups()
+
+def cluster_items(items, max_distance=3, min_similarity=0.5):
+    """
+    Collapse near-duplicate GitHub items and cluster related ones.
+
+    Returns a list of clusters. Each cluster is a list of near-duplicate groups of related items,
+    and each group is a list of items whose first item represents the whole group. Clusters,
+    groups and items keep the order in which they first appear in the input.
+    """
+    texts = [f"{item.title}\n{item.description}" for item in items]
+    duplicate_groups = [[items[i] for i in group] for group in find_near_duplicates(texts, max_distance)]
+
+    token_sets = [
+        set(tokenize(group[0].title)) | {f"label:{tag.lower()}" for tag in group[0].tags}
+        for group in duplicate_groups
+    ]
+    clusters = [[duplicate_groups[i] for i in cluster] for cluster in find_related(token_sets, min_similarity)]
+
+    logger.info("Collapsed %d items into %d near-duplicate groups and %d clusters.", len(items), len(duplicate_groups), len(clusters))
+    return clusters
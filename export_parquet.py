@@ -0,0 +1,211 @@
+# Columnar export of the collected GitHub activity for analytics.
+#  1. Items, comments, review comments (reviews) and labels are written as four Parquet datasets
+#     under the output directory, hive-partitioned by repository and date:
+#       <output>/items/repo=pytorch__pytorch/date=2024-07-10/part-<run>-0.parquet
+#     Items and labels are partitioned by the creation date of the item, comments and reviews by
+#     their own creation date, so that queries over a time range only read the needed files.
+#  2. The export is incremental: <output>/_export_state.json remembers a hash of every exported
+#     item and how many comments and review comments were exported. A run only appends the items
+#     that are new or changed, and the comments added since the last export. Every row carries
+#     the exported_at time of its run; the latest row of an item is its current state.
+#  3. pyarrow is only needed when exporting (pip install pyarrow). Example query:
+#       pyarrow.dataset.dataset("export/items", partitioning="hive").to_table(
+#           columns=["number", "state"], filter=pyarrow.compute.field("date") >= "2024-07-01")
+#
+# Both the GitHubItem objects of summarize_github.py and the serialized items of
+# highlight_github_activities.py can be exported.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+import instrumentation
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+state_file_name = "_export_state.json"
+
+def _get(item, name, default=None):
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+def _labels(item):
+    # GitHubItem.tags are names, serialized items carry {"name": ...} dicts
+    labels = _get(item, 'tags')
+    if labels is None:
+        labels = [label['name'] if isinstance(label, dict) else label for label in _get(item, 'labels', [])]
+    return list(labels)
+
+def _date(timestamp):
+    return timestamp[:10] if timestamp else "unknown"
+
+def _parse_time(timestamp):
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).replace(tzinfo=None)
+
+def item_hash(item):
+    """
+    Hash of the exported fields of an item, to detect changes between runs.
+    """
+    fields = [_get(item, 'title'), _get(item, 'state'), _get(item, 'description', _get(item, 'body')), _labels(item),
+              _get(item, 'assignees', []), _get(item, 'reviewers', []), _get(item, 'summary')]
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def item_rows(repo, item, exported_at, comments_from=0, review_comments_from=0):
+    """
+    Flatten an item into rows of the items, comments, reviews and labels tables. Only the
+    comments and review comments from the given positions on are included.
+    """
+    number = _get(item, 'number')
+    url = _get(item, 'url', '')
+    created_at = _get(item, 'created_at')
+    comments = _get(item, 'comments', [])
+    review_comments = _get(item, 'review_comments', [])
+    base = {'repo': repo, 'number': number, 'exported_at': exported_at}
+
+    def comment_rows(entries, start):
+        return [
+            {**base, 'position': start + i, 'author': comment.get('author'), 'created_at': _parse_time(comment.get('created_at')),
+             'body': comment.get('body'), 'date': _date(comment.get('created_at'))}
+            for i, comment in enumerate(entries[start:])
+        ]
+
+    return {
+        'items': [{
+            **base,
+            'kind': 'pr' if '/pull/' in url else 'issue',
+            'title': _get(item, 'title'),
+            'url': url,
+            'state': _get(item, 'state'),
+            'submitter': _get(item, 'submitter'),
+            'created_at': _parse_time(created_at),
+            'body': _get(item, 'description', _get(item, 'body')),
+            'assignees': list(_get(item, 'assignees', [])),
+            'reviewers': list(_get(item, 'reviewers', [])),
+            'num_comments': len(comments),
+            'num_review_comments': len(review_comments),
+            'summary': _get(item, 'summary'),
+            'date': _date(created_at),
+        }],
+        'comments': comment_rows(comments, comments_from),
+        'reviews': comment_rows(review_comments, review_comments_from),
+        'labels': [{**base, 'label': label, 'date': _date(created_at)} for label in _labels(item)],
+    }
+
+def _schemas():
+    import pyarrow as pa
+    base = [('repo', pa.string()), ('number', pa.int64()), ('exported_at', pa.timestamp('s'))]
+    comment = base + [('position', pa.int32()), ('author', pa.string()), ('created_at', pa.timestamp('s')), ('body', pa.string()), ('date', pa.string())]
+    return {
+        'items': pa.schema(base + [
+            ('kind', pa.string()), ('title', pa.string()), ('url', pa.string()), ('state', pa.string()), ('submitter', pa.string()),
+            ('created_at', pa.timestamp('s')), ('body', pa.string()), ('assignees', pa.list_(pa.string())),
+            ('reviewers', pa.list_(pa.string())), ('num_comments', pa.int32()), ('num_review_comments', pa.int32()),
+            ('summary', pa.string()), ('date', pa.string()),
+        ]),
+        'comments': pa.schema(comment),
+        'reviews': pa.schema(comment),
+        'labels': pa.schema(base + [('label', pa.string()), ('date', pa.string())]),
+    }
+
+def load_state(output_dir):
+    path = os.path.join(output_dir, state_file_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(output_dir, state):
+    with atomic_write(os.path.join(output_dir, state_file_name)) as f:
+        json.dump(state, f)
+
+def export_items(items, output_dir, owner, repo, full=False):
+    """
+    Append the new and changed items to the Parquet datasets under output_dir. With full, all
+    items are exported again. Returns the number of exported rows per table.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("Exporting to Parquet requires pyarrow, install it with 'pip install pyarrow'") from e
+
+    repo_key = f"{owner}/{repo}"
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    repo_state = {} if full else state.get(repo_key, {})
+    exported_at = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    rows = {table: [] for table in ('items', 'comments', 'reviews', 'labels')}
+    new_repo_state = dict(repo_state)
+
+    for item in items:
+        key = str(_get(item, 'number'))
+        previous = repo_state.get(key, {})
+        digest = item_hash(item)
+        num_comments = len(_get(item, 'comments', []))
+        num_review_comments = len(_get(item, 'review_comments', []))
+        # Comment lists only grow, so the comments before the exported counts are already exported
+        comments_from = min(previous.get('comments', 0), num_comments)
+        review_comments_from = min(previous.get('review_comments', 0), num_review_comments)
+        if previous.get('hash') == digest and comments_from == num_comments and review_comments_from == num_review_comments:
+            continue
+        item_tables = item_rows(f"{owner}__{repo}", item, exported_at, comments_from, review_comments_from)
+        for table, table_rows in item_tables.items():
+            rows[table].extend(table_rows)
+        new_repo_state[key] = {'hash': digest, 'comments': num_comments, 'review_comments': num_review_comments}
+
+    schemas = _schemas()
+    run_id = f"{exported_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    partitioning = ds.partitioning(pa.schema([('repo', pa.string()), ('date', pa.string())]), flavor='hive')
+    counts = {}
+    for table, table_rows in rows.items():
+        counts[table] = len(table_rows)
+        if not table_rows:
+            continue
+        with instrumentation.span(f"export_parquet_{table}"):
+            ds.write_dataset(
+                pa.Table.from_pylist(table_rows, schema=schemas[table]),
+                os.path.join(output_dir, table),
+                format='parquet',
+                partitioning=partitioning,
+                basename_template=f"part-{run_id}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore',
+            )
+        instrumentation.count("parquet_rows_exported_total", len(table_rows), table=table)
+
+    state[repo_key] = new_repo_state
+    save_state(output_dir, state)
+    logger.info("Exported %s rows of %s to %s.", counts, repo_key, output_dir)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the collected GitHub items of a repository to partitioned Parquet datasets.")
+    parser.add_argument("output_dir", type=str, help="Directory of the Parquet datasets")
+    parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
+    parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
+    parser.add_argument("--db-path", type=str, default=None, help="Path to the item database of summarize_github.py")
+    parser.add_argument("--full", action="store_true", help="Export all items again instead of only the new and changed ones")
+    parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    import item_store
+    import summarize_github
+    db_path = args.db_path if args.db_path else f"{args.owner}_{args.repo}_db"
+    with item_store.open_db(db_path, readonly=True) as db:
+        export_items(summarize_github.iter_items(db), args.output_dir, args.owner, args.repo, full=args.full)
+
+if __name__ == "__main__":
+    main()
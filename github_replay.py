@@ -0,0 +1,182 @@
+# Record and replay of the GitHub API responses of a collector run.
+#  1. Record mode wraps PyGithub's connection classes and appends every request and its
+#     response to a gzip-compressed JSON lines archive.
+#  2. Replay mode serves the responses from the archive through the same connection interface,
+#     so the collectors run offline and deterministically, without a token or network access.
+# Requests are matched by verb and URL (including the query string), so a run must be replayed
+# with the same arguments (dates, owner, repo, ...) it was recorded with. The archive can be
+# shared by threads, e.g. the shard crawlers of backfill.py. Example:
+#   python summarize_github.py --start-date 2024-07-01 --end-date 2024-07-01 --record july1.jsonl.gz
+#   python summarize_github.py --start-date 2024-07-01 --end-date 2024-07-01 --replay july1.jsonl.gz --no-summarize
+
+import atexit
+import gzip
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# Response headers that PyGithub or the instrumentation read. Everything else is dropped to keep
+# archives compact.
+_kept_headers = {"content-type", "link", "location", "etag", "last-modified", "x-ratelimit-limit",
+                 "x-ratelimit-remaining", "x-ratelimit-reset", "x-ratelimit-used", "x-ratelimit-resource", "retry-after"}
+
+class RecordedResponse:
+    # mimic the httplib response object like github.Requester.RequestsResponse
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.body
+
+    def iter_content(self, chunk_size=1):
+        data = self.body.encode('utf-8')
+        chunk_size = chunk_size or len(data) or 1
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+class ReplayArchive:
+    """
+    Gzip-compressed JSON lines file with one {"verb", "url", "status", "headers", "body"} entry
+    per response.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._responses = None
+        # Guards the lazy open and the writes of the archive, and the recorded responses
+        self._lock = threading.Lock()
+
+    def record(self, verb, url, response):
+        entry = {"verb": verb, "url": url, "status": response.status, "headers": response.headers, "body": response.body}
+        line = json.dumps(entry, separators=(',', ':')) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+                atexit.register(self.close)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def load(self):
+        self._responses = defaultdict(deque)
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                self._responses[(entry["verb"], entry["url"])].append(
+                    RecordedResponse(entry["status"], entry["headers"], entry["body"]))
+        logger.info("Loaded %d recorded responses from %s.", sum(len(responses) for responses in self._responses.values()), self.path)
+
+    def next_response(self, verb, url):
+        """
+        Return the next recorded response of a request in recording order. The last response is
+        repeated if the request is issued more often than it was recorded.
+        """
+        with self._lock:
+            if self._responses is None:
+                self.load()
+            responses = self._responses.get((verb, url))
+            if not responses:
+                raise KeyError(f"No recorded response for {verb} {url} in {self.path}")
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+def _request_key(connection, url):
+    # PyGithub passes paths for the API host and absolute URLs for other hosts
+    return url if "://" in url else f"{connection.protocol}://{connection.host}{url}"
+
+class RecordingConnection:
+    # mimic the httplib connection object. Subclasses set archive and connection_class.
+    archive = None
+    connection_class = None
+
+    def __init__(self, host, port=None, *args, **kwargs):
+        self._connection = self.connection_class(host, port, *args, **kwargs)
+        self.protocol = self._connection.protocol
+        self.host = host
+
+    def request(self, verb, url, input, headers, stream=False):
+        self.verb = verb
+        self.url = url
+        self._connection.request(verb, url, input, headers, stream)
+
+    def getresponse(self):
+        response = self._connection.getresponse()
+        headers = {key: value for key, value in response.getheaders() if key.lower() in _kept_headers}
+        recorded = RecordedResponse(response.status, headers, response.read())
+        self.archive.record(self.verb, _request_key(self, self.url), recorded)
+        return recorded
+
+    def close(self):
+        self._connection.close()
+
+class ReplayConnection:
+    # mimic the httplib connection object. Subclasses set archive and protocol.
+    archive = None
+    protocol = "https"
+
+    def __init__(self, host, port=None, *args, **kwargs):
+        self.host = host
+
+    def request(self, verb, url, input, headers, stream=False):
+        self.verb = verb
+        self.url = url
+
+    def getresponse(self):
+        return self.archive.next_response(self.verb, _request_key(self, self.url))
+
+    def close(self):
+        pass
+
+def _default_connection_classes():
+    from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+    return HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+def enable_recording(path, connection_classes=None):
+    """
+    Record all GitHub API responses of the following requests to the archive at path.
+    """
+    from github.Requester import Requester
+    http_class, https_class = connection_classes or _default_connection_classes()
+    archive = ReplayArchive(path)
+    Requester.injectConnectionClasses(
+        type("RecordingHTTPConnection", (RecordingConnection,), {"archive": archive, "connection_class": http_class}),
+        type("RecordingHTTPSConnection", (RecordingConnection,), {"archive": archive, "connection_class": https_class}),
+    )
+    logger.info("Recording GitHub API responses to %s.", path)
+    return archive
+
+def enable_replay(path):
+    """
+    Serve all following GitHub API requests from the archive at path.
+    """
+    from github.Requester import Requester
+    archive = ReplayArchive(path)
+    archive.load()
+    Requester.injectConnectionClasses(
+        type("ReplayHTTPConnection", (ReplayConnection,), {"archive": archive, "protocol": "http"}),
+        type("ReplayHTTPSConnection", (ReplayConnection,), {"archive": archive, "protocol": "https"}),
+    )
+    logger.info("Replaying GitHub API responses from %s.", path)
+    return archive
+
+def disable():
+    """
+    Restore PyGithub's default connection classes.
+    """
+    from github.Requester import Requester
+    Requester.resetConnectionClasses()
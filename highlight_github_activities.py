@@ -1,21 +1,21 @@
 from dataclasses import dataclass
 import re
 import sys
-from github import Github
 from datetime import datetime, timedelta
 import os
 import argparse
+import functools
 import logging
-from dotenv import load_dotenv
 import json
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(script_dir)
 
-from mail_util import send_email_with_attachment
-from utils import get_tokens
-
-load_dotenv()
+from utils import get_tokens, intel_upstreaming_key_words
+import github_replay
+import instrumentation
+import parallel_filter
+import user_profiles
 
 logger = logging.getLogger(__name__)
 
@@ -99,7 +99,9 @@ class GitHubItem:
         }
 
 # Inquire GitHub activities
-def inquire_github_activities(repo, start_date, end_date, interval, rules):
+def inquire_github_activities(repo, start_date, end_date, interval, rules, workers=1, profiles=None):
+    if profiles is None:
+        profiles = user_profiles.UserProfileCache()
     start_date_dt = datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ")
     end_date_dt = datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%SZ")
 
@@ -118,7 +120,7 @@ def inquire_github_activities(repo, start_date, end_date, interval, rules):
             item.html_url,
             item.body if item.body else "No description available",
             item.user.login if item.user else "Unknown",
-            item.user.email if item.user and item.user.email else "Unknown",
+            profiles.email(item.user),
             [label.name for label in item.labels],
             [assignee.login for assignee in item.assignees],
             [],
@@ -136,7 +138,7 @@ def inquire_github_activities(repo, start_date, end_date, interval, rules):
             for review_comment in pr.get_review_comments():
                 github_item.review_comments.append({
                     "author": review_comment.user.login,
-                    "author_github_user": GithubUser(review_comment.user.login, review_comment.user.email if review_comment.user.email else "Unknown"),
+                    "author_github_user": GithubUser(review_comment.user.login, profiles.email(review_comment.user)),
                     "body": review_comment.body,
                     "created_at": review_comment.created_at.isoformat()
                 })
@@ -145,20 +147,64 @@ def inquire_github_activities(repo, start_date, end_date, interval, rules):
         for comment in item.get_comments():
             github_item.comments.append({
                 "author": comment.user.login,
-                "author_github_user": GithubUser(comment.user.login, comment.user.email if comment.user.email else "Unknown"),
+                "author_github_user": GithubUser(comment.user.login, profiles.email(comment.user)),
                 "body": comment.body,
                 "created_at": comment.created_at.isoformat()
             })
 
-        if apply_rules(github_item, interval, rules):
-            github_items.append(github_item.serialize())
+        github_items.append(github_item)
+
+    return [github_item.serialize() for github_item in filter_items(github_items, interval, rules, workers)]
 
-    return github_items
+def filter_items(items, interval, rules, workers=1):
+    """
+    Apply the filtering rules to the GitHub items. With more than one worker (0 for one per CPU
+    core), the rules are evaluated in a process pool.
+    """
+    from search_index import keyword_matches
+    with instrumentation.span("keyword_matches"):
+        # The keyword rules test membership in the items matched once through a search index
+        rules = dict(rules, keyword_matches=keyword_matches(items))
+    with instrumentation.span("apply_rules"):
+        if parallel_filter.resolve_workers(workers) > 1:
+            decisions = parallel_filter.evaluate(functools.partial(_evaluate_shard, interval, rules), [_compact_item(item) for item in items], workers)
+        else:
+            decisions = [evaluate_rules(item, interval, rules) for item in items]
+    parallel_filter.record_reasons(decisions)
+    return [item for item, (keep, _) in zip(items, decisions) if keep]
+
+def _compact_comments(comments):
+    return [(comment['author'], comment['author_github_user'].email, comment['created_at'], comment['body']) for comment in comments]
+
+def _compact_item(item):
+    # Only the fields used by the rules, as plain values that pickle compactly
+    return (item.number, item.title, item.description, item.submitter, item.submitter_github_user.email, item.tags,
+            item.reviewers, item.created_at, _compact_comments(item.comments), _compact_comments(item.review_comments))
+
+def _expand_comments(comments):
+    return [{'author': author, 'author_github_user': GithubUser(author, email), 'created_at': created_at, 'body': body}
+            for author, email, created_at, body in comments]
+
+def _evaluate_shard(interval, rules, compact_items):
+    decisions = []
+    for number, title, description, submitter, email, tags, reviewers, created_at, comments, review_comments in compact_items:
+        item = GitHubItem(number, title, "", description, submitter, email, tags, [], reviewers, created_at,
+                          _expand_comments(comments), _expand_comments(review_comments), "")
+        decisions.append(evaluate_rules(item, interval, rules))
+    return decisions
 
 def apply_rules(item: GitHubItem, interval, rules):
     """
     Check if a GitHub item satisfies the given filtering rules.
     """
+    keep, _ = evaluate_rules(item, interval, rules)
+    return keep
+
+def evaluate_rules(item: GitHubItem, interval, rules):
+    """
+    Evaluate the filtering rules on a GitHub item. Returns whether to keep the item and the
+    reason of the decision.
+    """
     # Filter by start and end dates
     created_at = datetime.fromisoformat(item.created_at.replace('Z', '+00:00')).replace(tzinfo=None)
     comment_dates = [datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00')).replace(tzinfo=None) for comment in item.comments + item.review_comments]
@@ -167,14 +213,16 @@ def apply_rules(item: GitHubItem, interval, rules):
     # If interval is set, filter out items outside of the date range
     if interval > 0:
         if not any(rules['start_date'] <= date for date in all_dates):
-            logger.info(f"Filtering out '{item.title}' because it is outside of the date range.")
-            return False
+            logger.info("Filtering out '%s' because it is outside of the date range.", item.title)
+            return False, "outside date range"
     else:
         if not any(rules['start_date'] <= date <= rules['end_date'] for date in all_dates):
-            logger.info(f"Filtering out '{item.title}' because neither its creation time nor any comment time is within the date range.")
-            return False
+            logger.info("Filtering out '%s' because neither its creation time nor any comment time is within the date range.", item.title)
+            return False, "outside date range"
 
-    _intel_upstreaming_key_words = ["xpu", "xccl", "gpu_type", "ntel.*GPU", "ntel.*distributed", "ntel.*Triton", "mkl", "oneDNN", "mkldnn"]
+    _intel_upstreaming_key_words = intel_upstreaming_key_words
+    # Items matching the keywords by field, see search_index.keyword_matches
+    _keyword_matches = rules.get('keyword_matches')
 
     # Define a utility function to check if the item contains a given a regex pattern. The pattern is a string
     # and the item is a string. The function returns True if the pattern is found in the item, otherwise False.
@@ -184,9 +232,9 @@ def apply_rules(item: GitHubItem, interval, rules):
     # Comments containing tags of the specified user
     _specified_users = rules.get('specified_user', ['EikanWang', 'etaf', 'xytintel', 'chuanqi129', 'ZhiweiYan-96', 'guangyey', 'liangan1', 'ZhaoqiongZ', 'zhangxiaoli73', 'dvrogozh', 'jansel'])
     # Lambda function to check if a given keywork is in the title
-    _keyword_in_title = lambda : any(_contains_pattern(keyword, item.title.lower()) for keyword in _intel_upstreaming_key_words)
+    _keyword_in_title = lambda : item.number in _keyword_matches['title'] if _keyword_matches is not None else any(_contains_pattern(keyword, item.title.lower()) for keyword in _intel_upstreaming_key_words)
     # Lambda function to check if a given keywork is in the description
-    _keyword_in_desc = lambda : any(_contains_pattern(keyword, item.description.lower()) for keyword in _intel_upstreaming_key_words)
+    _keyword_in_desc = lambda : item.number in _keyword_matches['description'] if _keyword_matches is not None else any(_contains_pattern(keyword, item.description.lower()) for keyword in _intel_upstreaming_key_words)
     # Lambda function to check if the specified user is not in the description
     _user_in_desc = lambda : any(specified_user.lower() in item.description.lower() for specified_user in _specified_users)
     # Lambda function to check if each specified user is not in the comments
@@ -204,8 +252,8 @@ def apply_rules(item: GitHubItem, interval, rules):
 
     # Ignore titles starting with "DISABLED"
     if item.title.startswith("DISABLED"):
-        logger.info(f"Filtering out '{item.title}' because the title starts with 'DISABLED'.")
-        return False
+        logger.info("Filtering out '%s' because the title starts with 'DISABLED'.", item.title)
+        return False, "DISABLED title"
 
     # Comment out the code snippet below to monitor all github activities
 
@@ -220,46 +268,46 @@ def apply_rules(item: GitHubItem, interval, rules):
 
     # The title contains XPU
     if _keyword_in_title():
-        logger.info(f"Filtering out '{item.title}' because it contains XPU keywords {_intel_upstreaming_key_words}")
-        return True
+        logger.info("Filtering out '%s' because it contains XPU keywords %s", item.title, _intel_upstreaming_key_words)
+        return True, "keyword in title"
 
     # The description contains XPU
     if _keyword_in_desc():
-        logger.info(f"Filtering out '{item.description}' because it contains XPU keywords {_intel_upstreaming_key_words}")
-        return True
+        logger.info("Filtering out '%s' because it contains XPU keywords %s", item.description, _intel_upstreaming_key_words)
+        return True, "keyword in description"
 
     if _xpu_label():
-        logger.info(f"Filtering out '{item.title}' because it is labeled with XPU.")
-        return True
+        logger.info("Filtering out '%s' because it is labeled with XPU.", item.title)
+        return True, "XPU label"
 
     if _is_commented_by_intel_folks():
-        logger.info(f"Filtering out '{item.title}' because it is commented by Intel folks.")
-        return True
+        logger.info("Filtering out '%s' because it is commented by Intel folks.", item.title)
+        return True, "commented by Intel folks"
 
     if _is_submitted_by_intel_folks():
-        logger.info(f"Filtering out '{item.title}' because it is submitted by Intel folks.")
-        return True
+        logger.info("Filtering out '%s' because it is submitted by Intel folks.", item.title)
+        return True, "submitted by Intel folks"
 
     # Filter by the number of CCed users in the description
     if _user_in_desc():
         if item.description.count('@') > rules['number_of_ccer']:
-            logger.info(f"Filtering out '{item.title}' because the description contains more than {rules['number_of_ccer']} CCed users.")
-            return False
+            logger.info("Filtering out '%s' because the description contains more than %d CCed users.", item.title, rules['number_of_ccer'])
+            return False, "too many CCed users"
         else:
-            logger.info(f"Filtering out '{item.title}' because the description contains the specified user.")
-            return True
+            logger.info("Filtering out '%s' because the description contains the specified user.", item.title)
+            return True, "specified user in description"
         
     if _user_in_comments():
-        logger.info(f"Filtering out '{item.title}' because the comments contain the specified user.")
-        return True
+        logger.info("Filtering out '%s' because the comments contain the specified user.", item.title)
+        return True, "specified user in comments"
     
     if _user_in_reviewers():
-        logger.info(f"Filtering out '{item.title}' because the reviewers contain the specified user.")
-        return True
+        logger.info("Filtering out '%s' because the reviewers contain the specified user.", item.title)
+        return True, "specified user in reviewers"
 
-    return False
+    return False, "no Intel involvement"
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Fetch, filter, and display GitHub issues and pull requests for a specified repository.")
     parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
     parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
@@ -270,12 +318,32 @@ def main():
     parser.add_argument("--only-issues", action="store_true", help="Dump only issues (default: dump both issues and PRs)")
     parser.add_argument("--send-email", action="store_true", help="Send email with the filtered items")
     parser.add_argument("--only-prs", action="store_true", help="Dump only pull requests (default: dump both issues and PRs)")
+    parser.add_argument("--record", type=str, default=None, help="Record all GitHub API responses of this run to the given archive (see github_replay.py)")
+    parser.add_argument("--replay", type=str, default=None, help="Serve all GitHub API requests from the given archive instead of the network")
+    parser.add_argument("--run-report", type=str, default=None, help="Write a JSON report with per-stage timings and GitHub request counts to this file")
+    parser.add_argument("--prometheus-textfile", type=str, default=None, help="Write the run metrics to this Prometheus textfile")
+    parser.add_argument("--filter-workers", type=int, default=1, help="Processes evaluating the filtering rules, 0 for one per CPU core (useful for backfills)")
+    parser.add_argument("--export-parquet", type=str, default=None, help="Append the new and changed highlighted items to the partitioned Parquet datasets in this directory (see export_parquet.py)")
+    parser.add_argument("--user-profiles", type=str, default=user_profiles.default_path, help="JSON file caching the email of GitHub users across runs")
+    parser.add_argument("--user-profile-ttl-days", type=float, default=user_profiles.default_ttl_days, help="Days after which a cached user profile is fetched again")
     parser.add_argument("--log-level", type=str, default="WARNING", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
 
-    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    instrumentation.start_run("highlight_github_activities", args.run_report, args.prometheus_textfile)
 
     token, _, _ = get_tokens()
+    if args.record:
+        github_replay.enable_recording(args.record)
+    elif args.replay:
+        github_replay.enable_replay(args.replay)
+        # No token is needed to serve recorded responses
+        token = token or "replay"
+    instrumentation.instrument_github()
 
     # Get current date and time
     now = datetime.now()
@@ -300,6 +368,7 @@ def main():
     if not token:
         logger.error("Error: GitHub token not found in environment variables.")
     else:
+        from github import Github
         g = Github(token)
         repo = g.get_repo(f"{args.owner}/{args.repo}")
 
@@ -311,7 +380,14 @@ def main():
             'end_date': filter_end_date,
             'number_of_ccer': args.number_of_ccer
         }
-        github_items = inquire_github_activities(repo, start_date, end_date, args.interval, rules)
+        with instrumentation.span("inquire_github_activities"), \
+                user_profiles.UserProfileCache(args.user_profiles, args.user_profile_ttl_days * 86400) as profiles:
+            github_items = inquire_github_activities(repo, start_date, end_date, args.interval, rules, args.filter_workers, profiles)
+
+        if args.export_parquet:
+            import export_parquet
+            with instrumentation.span("export_parquet"):
+                export_parquet.export_items(github_items, args.export_parquet, args.owner, args.repo)
 
         # Serialize all the github_items to a well-formatted and pretty-printed JSON string
         # and save the JSON string to a file with full path and the file name is
@@ -334,6 +410,7 @@ def main():
             json.dump(github_items, f, indent=4)
 
         if args.send_email:
+            from mail_util import send_email_with_attachment
             send_email_with_attachment(
                 file_path=json_file_path,
                 subject=f"{args.owner}/{args.repo} - {cur_file_name}",
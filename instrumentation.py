@@ -0,0 +1,270 @@
+# Run instrumentation shared by the collectors and the summarizers.
+#  1. span(name) measures the wall time of a pipeline stage. Spans are aggregated by name, so a
+#     stage entered once per item (e.g. "process_item") reports its number of calls and total time.
+#  2. count(name, value, **labels) and set_gauge(name, value, **labels) record metrics such as
+#     GitHub requests by endpoint or LLM tokens.
+#  3. instrument_github() counts every GitHub API request by endpoint and status and tracks the
+#     rate limit consumed, by wrapping PyGithub's connection classes.
+#  4. start_run(job, report_path, prometheus_path) writes a JSON run report and/or a Prometheus
+#     textfile (for node_exporter's textfile collector) when the process exits.
+
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_job = None
+_started_at = None
+_start_time = time.perf_counter()
+_stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+_counters = defaultdict(float)
+_gauges = {}
+_llm_latencies = []
+_rate_limit = {}
+
+def reset():
+    """
+    Drop all recorded metrics.
+    """
+    global _start_time
+    with _lock:
+        _start_time = time.perf_counter()
+        _stages.clear()
+        _counters.clear()
+        _gauges.clear()
+        _llm_latencies.clear()
+        _rate_limit.clear()
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        with _lock:
+            stage = _stages[name]
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+
+def count(name, value=1, **labels):
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+def cached_prompt_tokens(usage):
+    """
+    Number of prompt tokens served from the provider's prompt cache, reported by DeepSeek as
+    prompt_cache_hit_tokens and by OpenAI as prompt_tokens_details.cached_tokens.
+    """
+    if usage is None:
+        return 0
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return cached or 0
+
+def observe_llm_call(model, seconds, usage=None, success=True):
+    """
+    Record an LLM request, its latency and its token usage (the usage object of the response).
+    """
+    status = "ok" if success else "error"
+    count("llm_requests_total", model=model, status=status)
+    count("llm_latency_seconds_total", seconds, model=model)
+    if usage is not None:
+        count("llm_prompt_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, model=model)
+        count("llm_cached_prompt_tokens_total", cached_prompt_tokens(usage), model=model)
+        count("llm_completion_tokens_total", getattr(usage, "completion_tokens", 0) or 0, model=model)
+    with _lock:
+        _llm_latencies.append(seconds)
+
+_number_pattern = re.compile(r"/\d+(?=/|$)")
+_repo_pattern = re.compile(r"^/repos/[^/]+/[^/]+")
+_owner_pattern = re.compile(r"^/(users|orgs)/[^/]+")
+# commits are addressed by (abbreviated) shas or refs, compare by "base...head"
+_sha_pattern = re.compile(r"/(commits|statuses|trees|blobs|compare)/[^/]+|/[0-9a-f]{40}(?=/|$)")
+
+def github_endpoint(url):
+    """
+    Normalize a GitHub API URL into an endpoint, e.g.
+    "/repos/pytorch/pytorch/pulls/123/reviews?per_page=100" -> "/repos/{owner}/{repo}/pulls/{number}/reviews",
+    "/users/EikanWang" -> "/users/{login}" and "/repos/pytorch/pytorch/commits/1a2b3c/status" -> "/repos/{owner}/{repo}/commits/{sha}/status".
+    """
+    path = url
+    if "://" in path:
+        path = path.split("://", 1)[1]
+        path = path[path.find("/"):]
+    path = path.split("?", 1)[0]
+    path = _repo_pattern.sub("/repos/{owner}/{repo}", path)
+    path = _owner_pattern.sub(lambda match: f"/{match.group(1)}/{{login}}", path)
+    path = _sha_pattern.sub(lambda match: f"/{match.group(1)}/{{sha}}" if match.group(1) else "/{sha}", path)
+    return _number_pattern.sub("/{number}", path)
+
+def _observe_rate_limit(resource, remaining):
+    # Accumulate the decrements of the remaining requests, so that a reset of the rate limit
+    # window during the run does not hide the consumption before it.
+    with _lock:
+        previous = _rate_limit.get(resource)
+        _rate_limit[resource] = remaining
+    if previous is not None and remaining < previous:
+        count("github_rate_limit_consumed_total", previous - remaining, resource=resource)
+    set_gauge("github_rate_limit_remaining", remaining, resource=resource)
+
+class InstrumentedConnection:
+    # mimic the httplib connection object. Subclasses set connection_class.
+    connection_class = None
+
+    def __init__(self, host, port=None, *args, **kwargs):
+        self._connection = self.connection_class(host, port, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def request(self, verb, url, input, headers, stream=False):
+        self._verb = verb
+        self._url = url
+        self._start = time.perf_counter()
+        self._connection.request(verb, url, input, headers, stream)
+
+    def getresponse(self):
+        response = self._connection.getresponse()
+        endpoint = github_endpoint(self._url)
+        count("github_requests_total", verb=self._verb, endpoint=endpoint, status=response.status)
+        count("github_request_seconds_total", time.perf_counter() - self._start, endpoint=endpoint)
+        headers = {key.lower(): value for key, value in response.getheaders()}
+        if "x-ratelimit-remaining" in headers:
+            _observe_rate_limit(headers.get("x-ratelimit-resource", "core"), int(headers["x-ratelimit-remaining"]))
+        return response
+
+    def close(self):
+        self._connection.close()
+
+def instrument_github():
+    """
+    Count all following GitHub API requests. Wraps the connection classes currently used by
+    PyGithub, so call it after github_replay.enable_recording/enable_replay.
+    """
+    from github.Requester import Requester
+    # There is no public getter for the injected connection classes
+    http_class = Requester._Requester__httpConnectionClass
+    https_class = Requester._Requester__httpsConnectionClass
+    Requester.injectConnectionClasses(
+        type("InstrumentedHTTPConnection", (InstrumentedConnection,), {"connection_class": http_class}),
+        type("InstrumentedHTTPSConnection", (InstrumentedConnection,), {"connection_class": https_class}),
+    )
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))]
+
+def _prompt_cache_hit_ratio():
+    prompt_tokens = sum(value for (name, _), value in _counters.items() if name == "llm_prompt_tokens_total")
+    cached_tokens = sum(value for (name, _), value in _counters.items() if name == "llm_cached_prompt_tokens_total")
+    return round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None
+
+def _labels_dict(labels):
+    return {key: str(value) for key, value in labels}
+
+def report():
+    """
+    The run report as a JSON-serializable dict.
+    """
+    with _lock:
+        return {
+            "job": _job,
+            "started_at": _started_at,
+            "duration_seconds": round(time.perf_counter() - _start_time, 6),
+            "stages": {name: dict(stage) for name, stage in _stages.items()},
+            "counters": [{"name": name, "labels": _labels_dict(labels), "value": value} for (name, labels), value in sorted(_counters.items())],
+            "gauges": [{"name": name, "labels": _labels_dict(labels), "value": value} for (name, labels), value in sorted(_gauges.items())],
+            "llm_latency_seconds": {"p50": _percentile(_llm_latencies, 50), "p99": _percentile(_llm_latencies, 99)},
+            "llm_prompt_cache_hit_ratio": _prompt_cache_hit_ratio(),
+        }
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def prometheus_text(prefix="ai_tools"):
+    """
+    The run report in the Prometheus text exposition format.
+    """
+    data = report()
+    job = data["job"] or "unknown"
+    samples = defaultdict(list)
+    for name, stage in data["stages"].items():
+        samples[("stage_calls_total", "counter")].append(({"stage": name}, stage["calls"]))
+        samples[("stage_seconds_total", "counter")].append(({"stage": name}, stage["seconds"]))
+    for kind, entries in (("counter", data["counters"]), ("gauge", data["gauges"])):
+        for entry in entries:
+            samples[(entry["name"], kind)].append((entry["labels"], entry["value"]))
+    samples[("run_duration_seconds", "gauge")].append(({}, data["duration_seconds"]))
+    samples[("run_last_finished_timestamp_seconds", "gauge")].append(({}, time.time()))
+
+    lines = []
+    for (name, kind), values in samples.items():
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in values:
+            labels = {"job": job, **labels}
+            label_str = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_str}}} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_json(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=4)
+
+def write_prometheus(path):
+    # The textfile collector must never read a partial file
+    with atomic_write(path) as f:
+        f.write(prometheus_text())
+
+_pending_write = None
+
+def finish_run():
+    """
+    Write the reports of the current run now instead of at exit. Used when several runs share
+    a process (see cli.py batch).
+    """
+    global _pending_write
+    if _pending_write is not None:
+        atexit.unregister(_pending_write)
+        _pending_write, write = None, _pending_write
+        write()
+
+def start_run(job, report_path=None, prometheus_path=None):
+    """
+    Start recording a run of the given job. The JSON report and the Prometheus textfile are
+    written when the process exits, also if it fails, or when the next run starts.
+    """
+    global _job, _started_at, _pending_write
+    finish_run()
+    reset()
+    _job = job
+    _started_at = datetime.now().isoformat()
+
+    def _write():
+        if report_path:
+            write_json(report_path)
+        if prometheus_path:
+            write_prometheus(prometheus_path)
+
+    if report_path or prometheus_path:
+        _pending_write = _write
+        atexit.register(_write)
@@ -0,0 +1,477 @@
+# SQLite item store with compressed, content-addressed comment bodies.
+#  1. The store ("{db_path}.sqlite") replaces the shelve database of pickled GitHubItems. Item
+#     fields are a JSON row per item, comments a row per comment referencing the body by its
+#     hash, and bodies are stored once in a blob table, compressed with zstd (zlib when the
+#     zstandard package is not installed). Repetitive bot comments are stored once.
+#  2. Writing an item only upserts its fields and the comments whose author, time or body
+#     changed, instead of pickling the whole item again.
+#  3. compact trains a zstd dictionary on a sample of the bodies, recompresses all blobs with it
+#     and drops the blobs no comment references anymore; vacuum gives the freed pages back to
+#     the file system. stats shows the sizes.
+#  4. An existing shelve database is migrated when the store is opened for the first time (or
+#     explicitly with the migrate command). The shelve files are left in place.
+#  5. Several processes (e.g. the hourly highlight job, the nightly summarizer and ad-hoc queries)
+#     can use the same store at once. The store runs in WAL mode, so readers never block the
+#     writer and are not blocked by it. Every read of an item, or a whole snapshot() block,
+#     sees one consistent state. Writers take the write lock with BEGIN IMMEDIATE and wait for
+#     each other up to busy_timeout. Comment bodies are compressed before the lock is taken, so
+#     that write transactions stay short, and compact commits in batches. update_fields changes
+#     only the fields of an item (e.g. its summary), keeping the comments another process added,
+#     append_comment adds a single comment row, and field_values reads one field of all items
+#     without their comments.
+#     The migration of a shelve database writes a temporary file linked into place once done.
+# The store is a MutableMapping of item keys (str(number)) to GitHubItems like the shelve
+# database. Reserved keys (see utils.is_item_key) hold JSON metadata such as backfill checkpoints.
+# Example:
+#   python item_store.py compact --db-path pytorch_pytorch_db && python item_store.py vacuum --db-path pytorch_pytorch_db
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import zlib
+from collections.abc import MutableMapping
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+from utils import is_item_key
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_schema = '''
+    CREATE TABLE IF NOT EXISTS items (
+        key TEXT PRIMARY KEY,
+        fields TEXT
+    );
+    CREATE TABLE IF NOT EXISTS comments (
+        item_key TEXT,
+        is_review INTEGER,
+        position INTEGER,
+        author TEXT,
+        created_at TEXT,
+        body_hash BLOB,
+        PRIMARY KEY (item_key, is_review, position)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS comments_body_hash ON comments (body_hash);
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash BLOB PRIMARY KEY,
+        codec TEXT,
+        dictionary INTEGER,
+        data BLOB
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS dictionaries (
+        id INTEGER PRIMARY KEY,
+        data BLOB
+    );
+    CREATE TABLE IF NOT EXISTS metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+'''
+
+# Bodies shorter than this are stored uncompressed
+min_compressed_size = 64
+zstd_level = 3
+dictionary_size = 112640
+# Seconds to wait for the write lock held by another process
+busy_timeout = 60.0
+
+def store_path(db_path):
+    """
+    Path of the item store belonging to the given database path.
+    """
+    return f"{db_path}.sqlite"
+
+def body_hash(body):
+    return hashlib.blake2b(body.encode('utf-8'), digest_size=16).digest()
+
+class ItemStore(MutableMapping):
+    def __init__(self, path, readonly=False, item_class=None, timeout=None) -> None:
+        self._path = path
+        self._readonly = readonly
+        self._item_class = item_class
+        self._timeout = busy_timeout if timeout is None else timeout
+        self._compressors = {}
+        self._decompressors = {}
+
+    def __enter__(self):
+        # Transactions are explicit (see _read and _write), the connection is in autocommit mode
+        if self._readonly:
+            self._db = sqlite3.connect(f"file:{self._path}?mode=ro", uri=True, timeout=self._timeout, isolation_level=None)
+        else:
+            self._db = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # With WAL, NORMAL only syncs at checkpoints and never corrupts the database
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            # executescript would commit the transaction, run the statements one by one
+            with self._write():
+                for statement in _schema.split(';'):
+                    self._db.execute(statement)
+        self._dictionary_id = self._db.execute('SELECT MAX(id) FROM dictionaries').fetchone()[0]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    @contextlib.contextmanager
+    def _read(self):
+        # Reads of several statements see one snapshot, unless already in a transaction
+        if self._db.in_transaction:
+            yield
+            return
+        self._db.execute('BEGIN')
+        try:
+            yield
+        finally:
+            self._db.execute('COMMIT')
+
+    @contextlib.contextmanager
+    def _write(self):
+        # IMMEDIATE takes the write lock upfront, a deferred transaction could fail to upgrade
+        # its read lock without waiting for the busy timeout
+        if self._db.in_transaction:
+            raise RuntimeError("Writes to the item store are not allowed in a snapshot")
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def snapshot(self):
+        """
+        Context manager in which all reads see the same state of the store, e.g. to load all
+        items while collectors keep writing.
+        """
+        return self._read()
+
+    def _new_item(self, fields, comments, review_comments):
+        if self._item_class is None:
+            from summarize_github import GitHubItem
+            self._item_class = GitHubItem
+        item = self._item_class.__new__(self._item_class)
+        item.__dict__.update(fields)
+        item.comments = comments
+        item.review_comments = review_comments
+        return item
+
+    # Compression
+
+    def _compressor(self, dictionary_id):
+        if dictionary_id not in self._compressors:
+            dict_data = None
+            if dictionary_id is not None:
+                data = self._db.execute('SELECT data FROM dictionaries WHERE id = ?', (dictionary_id,)).fetchone()[0]
+                dict_data = zstandard.ZstdCompressionDict(data)
+            self._compressors[dictionary_id] = zstandard.ZstdCompressor(level=zstd_level, dict_data=dict_data)
+        return self._compressors[dictionary_id]
+
+    def _decompressor(self, dictionary_id):
+        if zstandard is None:
+            raise RuntimeError("The item store contains zstd-compressed comments, install zstandard with 'pip install zstandard'")
+        if dictionary_id not in self._decompressors:
+            dict_data = None
+            if dictionary_id is not None:
+                data = self._db.execute('SELECT data FROM dictionaries WHERE id = ?', (dictionary_id,)).fetchone()[0]
+                dict_data = zstandard.ZstdCompressionDict(data)
+            self._decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return self._decompressors[dictionary_id]
+
+    def _encode(self, body, dictionary_id):
+        data = body.encode('utf-8')
+        if len(data) < min_compressed_size:
+            return 'raw', None, data
+        if zstandard is not None:
+            return 'zstd', dictionary_id, self._compressor(dictionary_id).compress(data)
+        return 'zlib', None, zlib.compress(data, 6)
+
+    def _decode(self, codec, dictionary_id, data):
+        if codec == 'zstd':
+            data = self._decompressor(dictionary_id).decompress(data)
+        elif codec == 'zlib':
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def _missing_hashes(self, hashes):
+        missing = set(hashes)
+        batches = list(missing)
+        for start in range(0, len(batches), 500):
+            batch = batches[start:start + 500]
+            missing.difference_update(row[0] for row in self._db.execute(
+                f"SELECT hash FROM blobs WHERE hash IN ({', '.join('?' * len(batch))})", batch))
+        return missing
+
+    # Mapping interface
+
+    def __getitem__(self, key):
+        with self._read():
+            return self._get(key)
+
+    def _get(self, key):
+        if not is_item_key(key):
+            row = self._db.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return json.loads(row[0])
+        row = self._db.execute('SELECT fields FROM items WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        comments = ([], [])
+        for is_review, author, created_at, codec, dictionary_id, data in self._db.execute('''
+            SELECT is_review, author, created_at, codec, dictionary, data FROM comments
+            JOIN blobs ON blobs.hash = comments.body_hash
+            WHERE item_key = ? ORDER BY is_review, position
+        ''', (key,)):
+            comments[is_review].append({"author": author, "body": self._decode(codec, dictionary_id, data), "created_at": created_at})
+        return self._new_item(json.loads(row[0]), *comments)
+
+    def __setitem__(self, key, github_item):
+        if not is_item_key(key):
+            with self._write():
+                self._db.execute('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', (key, json.dumps(github_item)))
+            return
+        fields = {name: value for name, value in vars(github_item).items() if name not in ('comments', 'review_comments')}
+        rows = []
+        bodies = {}
+        for is_review, comments in enumerate((github_item.comments, github_item.review_comments)):
+            for position, comment in enumerate(comments):
+                body = comment['body'] or ""
+                digest = body_hash(body)
+                bodies[digest] = body
+                rows.append((is_review, position, comment['author'], comment['created_at'], digest))
+        # Compress the new bodies before taking the write lock
+        blobs = {digest: self._encode(bodies[digest], self._dictionary_id) for digest in self._missing_hashes(bodies)}
+        with self._write():
+            # A concurrent compact may have dropped a body no comment referenced anymore
+            for digest in self._missing_hashes(bodies.keys() - blobs.keys()):
+                blobs[digest] = self._encode(bodies[digest], self._dictionary_id)
+            self._db.executemany('INSERT OR IGNORE INTO blobs (hash, codec, dictionary, data) VALUES (?, ?, ?, ?)',
+                                 [(digest, *blob) for digest, blob in blobs.items()])
+            self._db.execute('INSERT OR REPLACE INTO items (key, fields) VALUES (?, ?)', (key, json.dumps(fields)))
+            # Only write the comments that changed
+            stored = {(is_review, position): (author, created_at, digest) for is_review, position, author, created_at, digest in self._db.execute(
+                'SELECT is_review, position, author, created_at, body_hash FROM comments WHERE item_key = ?', (key,))}
+            changed = [(key, *row) for row in rows if stored.pop(row[:2], None) != row[2:]]
+            self._db.executemany('INSERT OR REPLACE INTO comments (item_key, is_review, position, author, created_at, body_hash) VALUES (?, ?, ?, ?, ?, ?)', changed)
+            self._db.executemany('DELETE FROM comments WHERE item_key = ? AND is_review = ? AND position = ?',
+                                 [(key, is_review, position) for is_review, position in stored])
+
+    def update_fields(self, key, **fields):
+        """
+        Update fields of a stored item (e.g. its cached summary) without writing its comments,
+        so that comments added by a concurrent writer are kept.
+        """
+        with self._write():
+            row = self._db.execute('SELECT fields FROM items WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            self._db.execute('UPDATE items SET fields = ? WHERE key = ?', (json.dumps({**json.loads(row[0]), **fields}), key))
+
+    def append_comment(self, key, comment, is_review=False):
+        """
+        Append a comment to a stored item without reading or rewriting its other comments.
+        Returns False if the item already has a comment of the same author and creation time.
+        """
+        body = comment['body'] or ""
+        digest = body_hash(body)
+        # Compress the body before taking the write lock
+        blob = self._encode(body, self._dictionary_id) if self._missing_hashes([digest]) else None
+        with self._write():
+            if self._db.execute('SELECT 1 FROM items WHERE key = ?', (key,)).fetchone() is None:
+                raise KeyError(key)
+            if self._db.execute('SELECT 1 FROM comments WHERE item_key = ? AND is_review = ? AND author = ? AND created_at = ?',
+                                (key, int(is_review), comment['author'], comment['created_at'])).fetchone():
+                return False
+            # A concurrent compact may have dropped the body
+            if blob is None and self._missing_hashes([digest]):
+                blob = self._encode(body, self._dictionary_id)
+            if blob is not None:
+                self._db.execute('INSERT OR IGNORE INTO blobs (hash, codec, dictionary, data) VALUES (?, ?, ?, ?)', (digest, *blob))
+            self._db.execute('''
+                INSERT INTO comments (item_key, is_review, position, author, created_at, body_hash)
+                SELECT ?, ?, COALESCE(MAX(position) + 1, 0), ?, ?, ? FROM comments WHERE item_key = ? AND is_review = ?
+            ''', (key, int(is_review), comment['author'], comment['created_at'], digest, key, int(is_review)))
+        return True
+
+    def field_values(self, name):
+        """
+        {item key: value} of one field of all items, e.g. field_values('updated_at'), read without
+        loading the comments. Items stored without the field map to None.
+        """
+        with self._read():
+            return dict(self._db.execute('SELECT key, json_extract(fields, ?) FROM items', (f'$.{name}',)))
+
+    def __delitem__(self, key):
+        with self._write():
+            if not is_item_key(key):
+                deleted = self._db.execute('DELETE FROM metadata WHERE key = ?', (key,)).rowcount
+            else:
+                deleted = self._db.execute('DELETE FROM items WHERE key = ?', (key,)).rowcount
+                self._db.execute('DELETE FROM comments WHERE item_key = ?', (key,))
+        if not deleted:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        table = 'items' if is_item_key(key) else 'metadata'
+        return self._db.execute(f'SELECT 1 FROM {table} WHERE key = ?', (key,)).fetchone() is not None
+
+    def __iter__(self):
+        with self._read():
+            keys = [row[0] for row in self._db.execute('SELECT key FROM metadata')]
+            keys += [row[0] for row in self._db.execute('SELECT key FROM items ORDER BY rowid')]
+        return iter(keys)
+
+    def __len__(self):
+        with self._read():
+            return sum(self._db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('items', 'metadata'))
+
+    # Maintenance
+
+    def stats(self):
+        """
+        Number of items, comments and distinct bodies, and the stored and uncompressed sizes.
+        """
+        with self._read():
+            num_items = self._db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            num_comments = self._db.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+            num_blobs, blob_bytes = self._db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        page_count = self._db.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self._db.execute('PRAGMA page_size').fetchone()[0]
+        free_pages = self._db.execute('PRAGMA freelist_count').fetchone()[0]
+        return {
+            'items': num_items,
+            'comments': num_comments,
+            'blobs': num_blobs,
+            'blob_bytes': blob_bytes,
+            'file_bytes': page_count * page_size,
+            'free_bytes': free_pages * page_size,
+            'dictionary': self._dictionary_id,
+        }
+
+    def compact(self, train_dictionary=True, sample_size=20000):
+        """
+        Drop the blobs no comment references and, with zstandard installed, recompress all blobs
+        with a dictionary trained on a sample of them. Returns the number of dropped blobs.
+        """
+        with self._write():
+            dropped = self._db.execute('DELETE FROM blobs WHERE hash NOT IN (SELECT body_hash FROM comments)').rowcount
+        logger.info("Dropped %d unreferenced comment bodies.", dropped)
+        if not train_dictionary or zstandard is None:
+            return dropped
+        samples = [self._decode(*row).encode('utf-8') for row in self._db.execute(
+            'SELECT codec, dictionary, data FROM blobs WHERE codec != ? ORDER BY RANDOM() LIMIT ?', ('raw', sample_size))]
+        try:
+            dictionary = zstandard.train_dictionary(dictionary_size, samples)
+        except zstandard.ZstdError as e:
+            logger.warning("Not enough comment bodies to train a compression dictionary: %s", e)
+            return dropped
+        hashes = [row[0] for row in self._db.execute('SELECT hash FROM blobs WHERE codec != ?', ('raw',))]
+        # Older dictionaries are kept, other processes may still compress new bodies with them
+        with self._write():
+            dictionary_id = self._db.execute('INSERT INTO dictionaries (data) VALUES (?)', (dictionary.as_bytes(),)).lastrowid
+        compressor = self._compressor(dictionary_id)
+        # Recompress in batches, compressing outside of the write transactions to keep them short
+        for start in range(0, len(hashes), 1000):
+            batch = hashes[start:start + 1000]
+            rows = self._db.execute(f"SELECT hash, codec, dictionary, data FROM blobs WHERE hash IN ({', '.join('?' * len(batch))})", batch).fetchall()
+            updates = [('zstd', dictionary_id, compressor.compress(self._decode(codec, old_dictionary_id, data).encode('utf-8')), digest)
+                       for digest, codec, old_dictionary_id, data in rows]
+            with self._write():
+                self._db.executemany('UPDATE blobs SET codec = ?, dictionary = ?, data = ? WHERE hash = ?', updates)
+        self._dictionary_id = dictionary_id
+        logger.info("Recompressed %d comment bodies with a %d-byte dictionary.", len(hashes), len(dictionary.as_bytes()))
+        return dropped
+
+    def vacuum(self):
+        """
+        Rebuild the file without its free pages.
+        """
+        self._db.execute('VACUUM')
+
+def migrate(shelve_path, store):
+    """
+    Copy all entries of a shelve database into the store. Returns the number of copied entries.
+    """
+    import shelve
+    import __main__
+    import summarize_github
+    # Items pickled by running summarize_github.py as a script refer to __main__.GitHubItem
+    if not hasattr(__main__, "GitHubItem"):
+        __main__.GitHubItem = summarize_github.GitHubItem
+    count = 0
+    with shelve.open(shelve_path, flag='r') as db:
+        for key in db:
+            store[key] = db[key]
+            count += 1
+    logger.info("Migrated %d entries from the shelve database %s to %s.", count, shelve_path, store._path)
+    return count
+
+def open_db(db_path, readonly=False):
+    """
+    Open the item store of db_path, migrating the shelve database at db_path first if the store
+    does not exist yet. Use it as a context manager.
+    """
+    import dbm
+    path = store_path(db_path)
+    if not os.path.exists(path) and dbm.whichdb(db_path):
+        logger.warning("Migrating the shelve database %s to the item store %s.", db_path, path)
+        # Migrate into a temporary file, so that other processes never see a partial store
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with ItemStore(tmp_path) as store:
+                migrate(db_path, store)
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                logger.info("The store was migrated by another process in the meantime.")
+        finally:
+            # Also drop the partial store of a failed migration, it is started over next time
+            for tmp_file in (tmp_path, f"{tmp_path}-wal", f"{tmp_path}-shm"):
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+    elif readonly and not os.path.exists(path):
+        # Nothing to read yet, create an empty store
+        with ItemStore(path):
+            pass
+    return ItemStore(path, readonly=readonly)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the item store of collected GitHub items.")
+    parser.add_argument("command", choices=["stats", "compact", "vacuum", "migrate"], help="stats: show sizes; compact: drop unreferenced bodies and recompress with a trained dictionary; vacuum: shrink the file; migrate: copy the shelve database into the store")
+    parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
+    parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
+    parser.add_argument("--db-path", type=str, default=None, help="Path to the item database")
+    parser.add_argument("--no-dictionary", action="store_true", help="Do not train a compression dictionary when compacting")
+    parser.add_argument("--log-level", type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    db_path = args.db_path if args.db_path else f"{args.owner}_{args.repo}_db"
+    if args.command == "migrate":
+        with ItemStore(store_path(db_path)) as store:
+            migrate(db_path, store)
+        return
+    with open_db(db_path) as store:
+        if args.command == "compact":
+            store.compact(train_dictionary=not args.no_dictionary)
+        elif args.command == "vacuum":
+            store.vacuum()
+        print(json.dumps(store.stats(), indent=4))
+
+if __name__ == "__main__":
+    main()
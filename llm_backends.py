@@ -0,0 +1,266 @@
+# Registry of the LLM backends (servings) used for summarization.
+#  1. Every backend describes an OpenAI-compatible endpoint: its model, context window, maximum
+#     output, pricing, concurrency and rate limit. The packing, concurrency and retries of the
+#     summarizers are derived from it instead of being hard-coded.
+#  2. Built-in backends can be overridden and new ones (e.g. a local vLLM or llama.cpp server)
+#     added in an optional llm_backends.json file in the same directory as this file:
+#     {
+#       "Local": {"base_url": "http://127.0.0.1:8000/v1", "model": "qwen2.5-7b-instruct", "context_window": 32768},
+#       "DeepSeek": {"max_concurrency": 16}
+#     }
+#  3. The "Local" backend talks to LOCAL_LLM_BASE_URL (default http://127.0.0.1:8000), e.g. the
+#     mock server in mock_llm_server.py for load tests.
+#  4. chat() sends the fixed instruction as a system message ahead of the varying text, so that
+#     the providers' prompt caching (DeepSeek context caching, OpenAI prompt caching) serves the
+#     repeated prefix. Identical requests in flight at the same time are coalesced into one.
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+import instrumentation
+from utils import get_token
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class LLMBackend:
+    name: str
+    base_url: str
+    api_key_name: str            # Key in token_config.json or environment variable
+    model: str
+    context_window: int          # Tokens of prompt and completion
+    max_output_tokens: int       # Tokens reserved for the completion
+    temperature: float = 0.7
+    input_price: float = 0.0     # USD per million prompt tokens
+    cached_input_price: float = None # USD per million prompt tokens served from the prompt cache, defaults to input_price
+    output_price: float = 0.0    # USD per million completion tokens
+    max_concurrency: int = 1     # Requests in flight
+    requests_per_minute: int = 0 # 0 for no client-side rate limit
+    max_retries: int = 3         # Retries of transient errors (connection errors, timeouts, 429 and 5xx)
+    timeout: float = 600.0       # Seconds per request
+    fallback: str = None         # Backend to fail over to when this one is unavailable
+
+    @property
+    def prompt_budget(self):
+        """
+        Maximum number of prompt tokens that still leaves room for the completion.
+        """
+        return self.context_window - self.max_output_tokens
+
+    def cost(self, prompt_tokens, completion_tokens, cached_tokens=0):
+        cached_input_price = self.input_price if self.cached_input_price is None else self.cached_input_price
+        uncached_tokens = prompt_tokens - cached_tokens
+        return (uncached_tokens * self.input_price + cached_tokens * cached_input_price + completion_tokens * self.output_price) / 1e6
+
+    def estimate_cost(self, prefix_tokens, text_tokens, num_requests, completion_tokens=0):
+        """
+        Estimated cost of num_requests requests sharing a prefix of prefix_tokens tokens, assuming
+        the prefix is served from the prompt cache after the first request.
+        """
+        prompt_tokens = prefix_tokens * num_requests + text_tokens
+        cached_tokens = prefix_tokens * max(num_requests - 1, 0)
+        return self.cost(prompt_tokens, completion_tokens, cached_tokens)
+
+backends = {
+    "DeepSeek": LLMBackend(
+        name="DeepSeek", base_url="https://api.deepseek.com", api_key_name="DEEPSEEK_API_KEY", model="deepseek-chat",
+        context_window=64000, max_output_tokens=8000, input_price=0.27, cached_input_price=0.07, output_price=1.10,
+        max_concurrency=8, fallback="OpenAI",
+    ),
+    "OpenAI": LLMBackend(
+        name="OpenAI", base_url="https://api.openai.com/v1", api_key_name="OPENAI_API_KEY", model="gpt-4o-mini",
+        context_window=128000, max_output_tokens=16000, input_price=0.15, cached_input_price=0.075, output_price=0.60,
+        max_concurrency=8, requests_per_minute=500, fallback="DeepSeek",
+    ),
+    "Local": LLMBackend(
+        name="Local", base_url=os.environ.get("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8000"), api_key_name="LOCAL_LLM_API_KEY",
+        model="local", context_window=32000, max_output_tokens=4000, max_concurrency=4,
+    ),
+}
+
+def load_backends(path=os.path.join(script_dir, 'llm_backends.json')):
+    """
+    Override or add backends from a JSON file mapping backend names to LLMBackend fields.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as file:
+        data = json.load(file)
+    field_names = {field.name for field in fields(LLMBackend)}
+    for name, overrides in data.items():
+        unknown = set(overrides) - field_names
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)} for backend '{name}' in {path}")
+        if name in backends:
+            backends[name] = replace(backends[name], **overrides)
+        else:
+            backends[name] = LLMBackend(name=name, **overrides)
+
+load_backends()
+
+def register_backend(backend):
+    backends[backend.name] = backend
+    _rate_limiters.pop(backend.name, None)
+
+def configure_backend(name, **overrides):
+    """
+    Override fields of a registered backend, e.g. configure_backend("DeepSeek", max_concurrency=16).
+    """
+    register_backend(replace(get_backend(name), **overrides))
+    return backends[name]
+
+def restore_backends(saved):
+    """
+    Restore the registry to a copy saved with dict(backends), e.g. after a command of a batch
+    overrode backends for its run.
+    """
+    for name in set(backends) | set(saved):
+        if backends.get(name) is not saved.get(name):
+            _rate_limiters.pop(name, None)
+    backends.clear()
+    backends.update(saved)
+
+def get_backend(name):
+    if name not in backends:
+        raise ValueError(f"Unknown LLM backend '{name}', available backends: {', '.join(backends)}")
+    return backends[name]
+
+def create_client(backend):
+    """
+    Create an OpenAI-compatible client for the backend.
+    """
+    import openai
+    # Local servers usually do not check the key, but the client requires one
+    api_key = get_token(backend.api_key_name) or "none"
+    return openai.OpenAI(api_key=api_key, base_url=backend.base_url, timeout=backend.timeout, max_retries=backend.max_retries)
+
+class RateLimiter:
+    """
+    Spaces requests evenly to stay within requests_per_minute, across threads.
+    """
+    def __init__(self, requests_per_minute):
+        self._interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def _rate_limiter(backend):
+    with _rate_limiters_lock:
+        if backend.name not in _rate_limiters:
+            _rate_limiters[backend.name] = RateLimiter(backend.requests_per_minute)
+        return _rate_limiters[backend.name]
+
+def build_messages(prompt, system=None):
+    messages = [{'role': 'user', 'content': prompt}]
+    if system:
+        messages.insert(0, {'role': 'system', 'content': system})
+    return messages
+
+def complete(client, backend, messages, max_tokens=None, timeout=None):
+    """
+    Send a single chat completion request and return the reply. Latency, token usage, prompt
+    cache hits and cost are recorded in the run report.
+    """
+    max_tokens = min(max_tokens or backend.max_output_tokens, backend.max_output_tokens)
+    if timeout is not None:
+        client = client.with_options(timeout=timeout)
+    _rate_limiter(backend).acquire()
+    start = time.perf_counter()
+    try:
+        with instrumentation.span("llm_request"):
+            response = client.chat.completions.create(
+                model=backend.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=backend.temperature,
+            )
+    except Exception:
+        instrumentation.observe_llm_call(backend.model, time.perf_counter() - start, success=False)
+        raise
+    usage = response.usage
+    instrumentation.observe_llm_call(backend.model, time.perf_counter() - start, usage)
+    if usage is not None:
+        cost = backend.cost(usage.prompt_tokens, usage.completion_tokens, instrumentation.cached_prompt_tokens(usage))
+        instrumentation.count("llm_cost_usd_total", cost, model=backend.model)
+    return response.choices[0].message.content.strip()
+
+# Requests in flight, by request key. Completed ones are dropped, so that the replies of a long
+# run or of a batch of commands are not held in memory.
+_requests = {}
+_requests_lock = threading.Lock()
+
+def request_key(backend, messages, max_tokens=None):
+    digest = hashlib.sha256(f"{backend.name}\0{backend.model}\0{max_tokens}".encode('utf-8'))
+    for message in messages:
+        digest.update(b"\0" + message['role'].encode('utf-8') + b"\0" + message['content'].encode('utf-8'))
+    return digest.hexdigest()
+
+def coalesce(key, fn, model=None):
+    """
+    Return fn(), unless a call with the same key is in flight, in which case its result is
+    returned instead.
+    """
+    with _requests_lock:
+        future = _requests.get(key)
+        owner = future is None
+        if owner:
+            future = _requests[key] = Future()
+    if not owner:
+        instrumentation.count("llm_coalesced_requests_total", model=model)
+        return future.result()
+
+    try:
+        result = fn()
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        with _requests_lock:
+            del _requests[key]
+    return result
+
+def chat(client, backend, prompt, max_tokens=None, system=None):
+    """
+    Send a chat completion request to the backend and return the reply. The fixed instruction
+    should be passed as system, so that it forms a stable prefix that the provider can cache.
+    An identical request that is in flight is not sent again. See llm_resilience.chat for
+    retries and failover.
+    """
+    messages = build_messages(prompt, system)
+    key = request_key(backend, messages, max_tokens)
+    return coalesce(key, lambda: complete(client, backend, messages, max_tokens), model=backend.model)
+
+def map_concurrently(backend, fn, items):
+    """
+    Apply fn to all items with up to backend.max_concurrency calls in flight and return the
+    results in the order of the items.
+    """
+    items = list(items)
+    if backend.max_concurrency <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(backend.max_concurrency, len(items))) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,294 @@
+# Resilience layer around the LLM requests of llm_backends.py.
+#  1. Errors are classified: connection errors, timeouts, 408, 409, 429 and 5xx responses are
+#     transient and retried with exponential backoff and full jitter (or after Retry-After),
+#     other errors (e.g. 400 or 401) are permanent and raised immediately.
+#  2. Every call has a deadline that bounds all its attempts, retries and backoff included.
+#  3. Optionally, a hedged request is sent when the first one did not answer within
+#     hedge_after seconds, and the first reply wins. This cuts the tail latency.
+#  4. A circuit breaker per backend stops calling a backend after consecutive transient
+#     failures, and requests fail over to its fallback backend (DeepSeek <-> OpenAI) until the
+#     breaker lets a trial request through again. A fallback whose prompt budget is smaller than
+#     the prompt is skipped.
+# Failures are raised as LLMError instead of being swallowed. The summarizers catch them per
+# chunk, then log, count and report the missing parts, so that a digest never silently misses a
+# section.
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+import instrumentation
+import llm_backends
+from utils import get_token
+
+logger = logging.getLogger(__name__)
+
+class LLMError(Exception):
+    pass
+
+class TransientLLMError(LLMError):
+    pass
+
+class PermanentLLMError(LLMError):
+    pass
+
+class DeadlineExceededError(TransientLLMError):
+    pass
+
+class CircuitOpenError(TransientLLMError):
+    pass
+
+@dataclass
+class ResiliencePolicy:
+    base_delay: float = 1.0        # Seconds before the first retry
+    max_delay: float = 30.0        # Maximum seconds between retries
+    deadline: float = 900.0        # Seconds for a call, all attempts included
+    hedge_after: float = None      # Seconds before sending a hedged request, None to disable hedging
+    failure_threshold: int = 5     # Consecutive transient failures that open the circuit breaker
+    reset_timeout: float = 60.0    # Seconds before an open circuit breaker lets a trial request through
+    failover: bool = True          # Fail over to the fallback backend of an unavailable backend
+
+default_policy = ResiliencePolicy()
+
+def configure(**overrides):
+    """
+    Override fields of the default policy, e.g. configure(hedge_after=20.0).
+    """
+    global default_policy
+    default_policy = replace(default_policy, **overrides)
+    return default_policy
+
+_transient_status_codes = {408, 409, 429}
+
+def classify(error):
+    """
+    Wrap an exception raised by the OpenAI client into a TransientLLMError or a PermanentLLMError.
+    """
+    import openai
+    if isinstance(error, LLMError):
+        return error
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return TransientLLMError(str(error))
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None and (status_code in _transient_status_codes or status_code >= 500):
+        return TransientLLMError(str(error))
+    return PermanentLLMError(str(error))
+
+def _retry_after(error):
+    response = getattr(error.__cause__, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def backoff_delay(attempt, policy):
+    """
+    Full-jitter exponential backoff: a random delay up to base_delay * 2**attempt.
+    """
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+
+class CircuitBreaker:
+    """
+    Closed: requests pass. Open after failure_threshold consecutive transient failures: requests
+    are rejected for reset_timeout seconds. Then half-open: one trial request passes and closes
+    the breaker on success or opens it again on failure.
+    """
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "open" if time.monotonic() - self._opened_at < self.reset_timeout else "half-open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def release(self):
+        # End a half-open trial without a verdict, e.g. when the request itself was malformed
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    logger.warning("Opening the circuit breaker of %s after %d consecutive failures.", self.name, self._failures)
+                    instrumentation.count("llm_circuit_opened_total", backend=self.name)
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+_breakers = {}
+_clients = {}
+_lock = threading.Lock()
+_hedge_executor = None
+
+def circuit_breaker(backend, policy=None):
+    policy = policy or default_policy
+    with _lock:
+        if backend.name not in _breakers:
+            _breakers[backend.name] = CircuitBreaker(backend.name, policy.failure_threshold, policy.reset_timeout)
+        return _breakers[backend.name]
+
+def reset():
+    """
+    Forget the state of all circuit breakers and the cached clients.
+    """
+    with _lock:
+        _breakers.clear()
+        _clients.clear()
+
+def _client(backend):
+    with _lock:
+        if backend.name not in _clients:
+            _clients[backend.name] = llm_backends.create_client(backend)
+        return _clients[backend.name]
+
+def _hedged(fn, hedge_after):
+    # Run fn, and a second fn in parallel if the first one is still running after hedge_after
+    # seconds. Return the first successful result, or raise the last error.
+    global _hedge_executor
+    with _lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+    futures = {_hedge_executor.submit(fn)}
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        instrumentation.count("llm_hedged_requests_total")
+        futures.add(_hedge_executor.submit(fn))
+    pending = futures
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        if not pending:
+            return done.pop().result()
+
+def _attempt(client, backend, messages, max_tokens, timeout):
+    try:
+        return llm_backends.complete(client.with_options(max_retries=0), backend, messages, max_tokens, timeout)
+    except Exception as e:
+        raise classify(e) from e
+
+def _call(client, backend, messages, max_tokens, deadline, policy):
+    # Call one backend with retries until it answers, fails permanently, runs out of retries or
+    # the deadline passes.
+    breaker = circuit_breaker(backend, policy)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(f"The circuit breaker of {backend.name} is open")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"No reply from {backend.name} before the deadline")
+        timeout = min(backend.timeout, remaining)
+        request = lambda: _attempt(client, backend, messages, max_tokens, timeout)
+        try:
+            reply = _hedged(request, policy.hedge_after) if policy.hedge_after else request()
+        except TransientLLMError as e:
+            breaker.record_failure()
+            if attempt >= backend.max_retries:
+                raise
+            delay = _retry_after(e)
+            delay = backoff_delay(attempt, policy) if delay is None else delay
+            if time.monotonic() + delay >= deadline:
+                raise DeadlineExceededError(f"No reply from {backend.name} before the deadline: {e}") from e
+            logger.warning("Transient error from %s, retrying in %.1f seconds: %s", backend.name, delay, e)
+            instrumentation.count("llm_retries_total", model=backend.model)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except PermanentLLMError:
+            # A permanent error is a problem of the request, it proves nothing about the backend
+            breaker.release()
+            raise
+        breaker.record_success()
+        return reply
+
+def _fallbacks(backend):
+    # The backend followed by its chain of fallbacks with a configured API key
+    chain = [backend]
+    while chain[-1].fallback and chain[-1].fallback in llm_backends.backends:
+        fallback = llm_backends.get_backend(chain[-1].fallback)
+        if fallback in chain:
+            break
+        if get_token(fallback.api_key_name):
+            chain.append(fallback)
+        else:
+            logger.debug("Skipping fallback %s without %s.", fallback.name, fallback.api_key_name)
+            break
+    return chain
+
+def prompt_tokens(messages):
+    """
+    Number of tokens of the messages, counted like the summarizers do when packing prompts.
+    """
+    import tiktoken
+    encoding = tiktoken.get_encoding('gpt2')
+    return sum(len(encoding.encode(message['content'], disallowed_special=())) for message in messages)
+
+def chat(client, backend, prompt, max_tokens=None, system=None, policy=None):
+    """
+    Like llm_backends.chat, with retries, deadline, hedging, circuit breaking and failover.
+    Raises a TransientLLMError or a PermanentLLMError when no reply can be obtained.
+    """
+    policy = policy or default_policy
+    messages = llm_backends.build_messages(prompt, system)
+    key = llm_backends.request_key(backend, messages, max_tokens)
+    deadline = time.monotonic() + policy.deadline
+
+    def call():
+        chain = _fallbacks(backend) if policy.failover else [backend]
+        error = None
+        num_tokens = None
+        for candidate in chain:
+            if error is not None:
+                # The prompt was packed for the prompt budget of the primary backend, a fallback
+                # with a smaller context window would reject it
+                if num_tokens is None:
+                    num_tokens = prompt_tokens(messages)
+                if num_tokens > candidate.prompt_budget:
+                    logger.warning("Not failing over to %s, the prompt of %d tokens exceeds its prompt budget of %d tokens.",
+                                   candidate.name, num_tokens, candidate.prompt_budget)
+                    continue
+                logger.warning("%s is unavailable, failing over to %s: %s", source.name, candidate.name, error)
+                instrumentation.count("llm_failovers_total", source=source.name, target=candidate.name)
+            candidate_client = client if candidate is backend else _client(candidate)
+            try:
+                return _call(candidate_client, candidate, messages, max_tokens, deadline, policy)
+            except TransientLLMError as e:
+                error, source = e, candidate
+        raise error
+
+    return llm_backends.coalesce(key, call, model=backend.model)
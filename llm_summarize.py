@@ -1,87 +1,242 @@
-import openai
-import nltk
+# nltk, tiktoken and dotenv are imported where they are used, to keep the startup fast
 import math
-import tiktoken
-from nltk.tokenize import sent_tokenize
 import sys
 import os
 import argparse
-from dotenv import load_dotenv
+import logging
+import json
+import mmap
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-load_dotenv()
+import instrumentation
+import llm_backends
+import llm_resilience
+from utils import get_token
+
+logger = logging.getLogger(__name__)
+
+# Sentence tokenizer, loaded once per process by load_punkt
+_punkt = None
+
+def load_punkt(language='english'):
+    """
+    Loads the punkt sentence tokenizer from the local NLTK data, once per process. Nothing is
+    downloaded; run with --download-punkt once to install the model.
+    """
+    global _punkt
+    if _punkt is None:
+        try:
+            from nltk.tokenize.punkt import PunktTokenizer
+            _punkt = PunktTokenizer(language)
+        except ImportError:
+            # NLTK < 3.8.2 ships the pickled model only
+            import nltk
+            _punkt = nltk.data.load(f'tokenizers/punkt/{language}.pickle')
+    return _punkt
+
+def download_punkt():
+    import nltk
+    nltk.download('punkt', quiet=True)
+    nltk.download('punkt_tab', quiet=True)
 
 def count_tokens(text, encoding_name='gpt2'):
     """
     Counts the number of tokens in a text string using the specified encoding.
     """
-    print(f"Counting tokens for text: {text[:50]}...")
-    encoding = tiktoken.get_encoding(encoding_name)
-    tokens = encoding.encode(text)
-    print(f"Token count: {len(tokens)}")
+    logger.debug("Counting tokens for text: %s...", text[:50])
+    with instrumentation.span("count_tokens"):
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        tokens = encoding.encode(text)
+    logger.debug("Token count: %d", len(tokens))
     return len(tokens)
 
-def split_text_into_chunks(text, max_tokens, overlap_tokens):
+def iter_paragraph_blocks(stream, block_size=1 << 20):
     """
-    Splits text into chunks of approximately max_tokens tokens, with overlap.
+    Reads a text stream incrementally and yields blocks of roughly block_size characters that end
+    at a paragraph boundary (an empty line), or at a line boundary if a paragraph is too long.
     """
-    print("Splitting text into chunks...")
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    sentences = sent_tokenize(text)
-    chunks = []
-    current_chunk = ''
+    buffer = ''
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        buffer += data
+        if len(buffer) < block_size:
+            continue
+        cut = buffer.rfind('\n\n')
+        cut = cut + 2 if cut != -1 else buffer.rfind('\n') + 1
+        if cut == 0:
+            continue
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+    if buffer.strip():
+        yield buffer
+
+def iter_file_blocks(path, block_size=1 << 20):
+    """
+    Memory-maps a UTF-8 text file and yields (path, start, end) byte ranges of roughly block_size
+    bytes that end at a paragraph boundary, or at a line boundary if a paragraph is too long.
+    Only the offsets are passed around; each block is decoded where it is segmented.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start, size = 0, len(mapped)
+            while start < size:
+                end = start + block_size
+                if end >= size:
+                    end = size
+                else:
+                    cut = mapped.rfind(b'\n\n', start, end)
+                    cut = cut + 2 if cut != -1 else mapped.rfind(b'\n', start, end) + 1
+                    if cut <= start:
+                        # No line break within the block, extend it to the next one
+                        cut = mapped.find(b'\n', end) + 1 or size
+                    end = cut
+                yield (path, start, end)
+                start = end
+
+def read_file_block(path, start, end):
+    # The file is mapped per block rather than kept mapped, so that no map or descriptor
+    # outlives the block in the segmentation workers. Mapping is cheap next to segmenting.
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return mapped[start:end].decode('utf-8', errors='replace')
+
+def segment_block(block):
+    """
+    Splits a block of text into sentences and counts the tokens of each sentence. The block is
+    either a string or a (path, start, end) byte range produced by iter_file_blocks.
+    """
+    if isinstance(block, tuple):
+        block = read_file_block(*block)
+    return [(sentence, count_tokens(sentence)) for sentence in load_punkt().tokenize(block)]
+
+def _ordered_imap(executor, fn, iterable, max_in_flight):
+    # Like executor.map, but only consumes the iterable as results are taken, so at most
+    # max_in_flight inputs are held in memory.
+    futures = deque()
+    for item in iterable:
+        futures.append(executor.submit(fn, item))
+        if len(futures) >= max_in_flight:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+def iter_sentences(blocks, workers=1):
+    """
+    Yields (sentence, token count) pairs of the given text blocks in order. With more than one
+    worker, blocks are segmented in a process pool.
+    """
+    if workers <= 1:
+        for block in blocks:
+            yield from segment_block(block)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_punkt) as executor:
+        for sentences in _ordered_imap(executor, segment_block, blocks, max_in_flight=2 * workers):
+            yield from sentences
+
+def iter_chunks(sentences, max_tokens, overlap_tokens):
+    """
+    Groups (sentence, token count) pairs into chunks of approximately max_tokens tokens, with
+    overlap, and yields the chunks as soon as they are complete.
+    """
+    current_chunk = []
     current_tokens = 0
-    overlap = []
+    overlap = deque()
     overlap_token_count = 0
 
-    for sentence in sentences:
-        token_count = count_tokens(sentence)
+    for sentence, token_count in sentences:
         if current_tokens + token_count <= max_tokens:
-            current_chunk += ' ' + sentence
+            current_chunk.append(sentence)
             current_tokens += token_count
         else:
             if current_chunk:
-                chunks.append(current_chunk.strip())
-                print(f"Created chunk of length {current_tokens} tokens.")
-            current_chunk = ' '.join(overlap) + ' ' + sentence
+                logger.debug("Created chunk of length %d tokens.", current_tokens)
+                yield ' '.join(current_chunk).strip()
+            current_chunk = [sentence for sentence, _ in overlap] + [sentence]
             current_tokens = overlap_token_count + token_count
-            overlap = []
+            overlap.clear()
+            overlap_token_count = 0
 
-        # Maintain overlap
-        overlap.append(sentence)
-        overlap_token_count = count_tokens(' '.join(overlap))
-        while overlap_token_count > overlap_tokens:
-            overlap.pop(0)
-            overlap_token_count = count_tokens(' '.join(overlap))
+        # Maintain overlap. Token counts of sentences are summed instead of re-counting the
+        # joined overlap text for every sentence.
+        overlap.append((sentence, token_count))
+        overlap_token_count += token_count
+        while overlap_token_count > overlap_tokens and overlap:
+            overlap_token_count -= overlap.popleft()[1]
 
     if current_chunk:
-        chunks.append(current_chunk.strip())
-        print(f"Created final chunk of length {current_tokens} tokens.")
+        logger.debug("Created final chunk of length %d tokens.", current_tokens)
+        yield ' '.join(current_chunk).strip()
+
+class SummarySpill:
+    """
+    Append-only store of chunk summaries in a temporary file, so that the summaries of a large
+    input are not all held in memory. Iterating reads them back one by one.
+    """
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self.count = 0
+        self.num_tokens = 0
+
+    def append(self, summary):
+        self._file.write(json.dumps(summary) + '\n')
+        self.count += 1
+        self.num_tokens += count_tokens(summary)
 
-    print(f"Total number of chunks: {len(chunks)}")
+    def __iter__(self):
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+        self._file.seek(0, os.SEEK_END)
+
+    def write_to(self, file, separator=' '):
+        for i, summary in enumerate(self):
+            file.write(separator + summary if i else summary)
+
+    def close(self):
+        self._file.close()
+
+def split_text_into_chunks(text, max_tokens, overlap_tokens):
+    """
+    Splits text into chunks of approximately max_tokens tokens, with overlap.
+    """
+    logger.info("Splitting text into chunks...")
+    chunks = list(iter_chunks(segment_block(text), max_tokens, overlap_tokens))
+    logger.info("Total number of chunks: %d", len(chunks))
     return chunks
 
-def summarize_chunk(client, chunk, prompt_instructions="", max_summary_tokens=None):
+def summarize_chunk(client, chunk, prompt_instructions="", max_summary_tokens=None, backend=None):
+    """
+    Summarizes a text chunk using the model of the given LLM backend.
+    """
+    if backend is None:
+        backend = llm_backends.get_backend("DeepSeek")
+    logger.info("Summarizing chunk: %s...", chunk[:50])
+    # The instructions go into the system message, so all chunks share a cacheable prefix
+    prompt = f"Text:\n{chunk}\n\n"
+    summary = llm_resilience.chat(client, backend, prompt, max_summary_tokens, system=prompt_instructions)
+    logger.info("Summary generated: %s...", summary[:50])
+    return summary
+
+def summarize_chunk_or_none(client, chunk, prompt_instructions="", max_summary_tokens=None, backend=None):
     """
-    Summarizes a text chunk using OpenAI's GPT-3.5 Turbo model.
+    Like summarize_chunk, but an LLMError is logged and counted and None is returned, so that
+    a single failed request does not discard the summaries of the other chunks.
     """
-    print(f"Summarizing chunk: {chunk[:50]}...")
-    prompt = f"{prompt_instructions}\n\nText:\n{chunk}\n\n"
     try:
-        response = client.chat.completions.create(
-            model='deepseek-chat',  # You can switch to 'gpt-4' if you have access
-            messages=[{'role': 'user', 'content': prompt}],
-            max_tokens=max_summary_tokens,
-            temperature=0.7,
-        )
-        summary = response.choices[0].message.content.strip()
-        print(f"Summary generated: {summary[:50]}...")
-        return summary
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return ""
-
-def main():
+        return summarize_chunk(client, chunk, prompt_instructions, max_summary_tokens, backend)
+    except llm_resilience.LLMError as e:
+        logger.error("Failed to summarize chunk %s...: %s", chunk[:50], e)
+        instrumentation.count("llm_failed_summaries_total", model=backend.model if backend else None)
+        return None
+
+def main(argv=None):
     # Command line arguments
     parser = argparse.ArgumentParser(description="Chunk-based text summarization script.")
     parser.add_argument('--max-chunk-tokens', type=int, default=2000, help="Maximum tokens per chunk.")
@@ -91,10 +246,28 @@ def main():
     parser.add_argument('--prompt-instructions', type=str, default="Please provide a concise summary of the following text.", help="Prompt instructions for the summarization model.")
     parser.add_argument('--second-level-summarization', type=bool, default=True, help="Whether to perform a second-level summarization.")
     parser.add_argument('--second-level-prompt', type=str, help="Prompt instructions for the second-level summarization.")
-    parser.add_argument('--base-url', type=str, default="https://api.deepseek.com", help="Base URL for the API endpoint.")
+    parser.add_argument('--serving', type=str, choices=list(llm_backends.backends), default="DeepSeek", help="LLM backend to call (see llm_backends.py).")
+    parser.add_argument('--base-url', type=str, help="Override the base URL of the backend's API endpoint.")
+    parser.add_argument('--llm-concurrency', type=int, help="Override the maximum number of concurrent requests to the backend.")
+    parser.add_argument('--llm-deadline', type=float, default=llm_resilience.default_policy.deadline, help="Seconds to get a reply for an LLM request, retries included.")
+    parser.add_argument('--llm-hedge-after', type=float, help="Send a hedged LLM request when no reply arrived within this many seconds.")
+    parser.add_argument('--no-llm-failover', action='store_true', help="Do not fail over to the fallback backend when the backend is unavailable.")
     parser.add_argument('--output-file', type=str, default='final_summary.txt', help="Output file name for the final summary.")
     parser.add_argument('--dump-combined-summary', type=str, help="File name to dump the combined summary before second-level summarization.")
-    args = parser.parse_args()
+    parser.add_argument('--input-file', type=str, help="Memory-map and summarize this file instead of reading the input from stdin.")
+    parser.add_argument('--segment-workers', type=int, default=os.cpu_count(), help="Number of processes for sentence segmentation of the input.")
+    parser.add_argument('--block-size', type=int, default=1 << 20, help="Size of a segmentation block: characters read from stdin, or bytes of the --input-file.")
+    parser.add_argument('--download-punkt', action='store_true', help="Download the NLTK punkt sentence tokenizer model before running.")
+    parser.add_argument('--run-report', type=str, help="Write a JSON report with per-stage timings and LLM token usage to this file.")
+    parser.add_argument('--prometheus-textfile', type=str, help="Write the run metrics to this Prometheus textfile.")
+    parser.add_argument('--log-level', type=str, default="INFO", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL).")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+    instrumentation.start_run("llm_summarize", args.run_report, args.prometheus_textfile)
 
     # Parameters
     max_chunk_tokens = args.max_chunk_tokens           # Adjust based on the model's token limit
@@ -104,66 +277,110 @@ def main():
     prompt_instructions = args.prompt_instructions     # Instructions for the summarization
     second_level_summarization = args.second_level_summarization # Set to False if you don't want a second-level summary
     second_level_prompt = args.second_level_prompt if args.second_level_prompt else prompt_instructions # Second-level prompt instructions
-    base_url = args.base_url                           # API base URL
     output_file = args.output_file                     # Output file name for the final summary
     dump_combined_summary = args.dump_combined_summary # File name to dump the combined summary
 
-    # Set up OpenAI API key
-    print("Loading OpenAI API key from environment...")
-    client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'), base_url=base_url)
-
-    # Read the long document from stdin
-    print("Reading input text from stdin...")
-    text = sys.stdin.read()
-    print(f"Input text length: {len(text)} characters.")
-
-    # Split the text into chunks
-    chunks = split_text_into_chunks(text, max_chunk_tokens, overlap_tokens)
+    # Set up the LLM backend. OPENAI_API_KEY is still honored for any backend.
+    overrides = {}
+    if args.base_url:
+        overrides['base_url'] = args.base_url
+    if args.llm_concurrency:
+        overrides['max_concurrency'] = args.llm_concurrency
+    backend = llm_backends.configure_backend(args.serving, **overrides)
+    if not get_token(backend.api_key_name) and os.getenv('OPENAI_API_KEY'):
+        backend = llm_backends.configure_backend(args.serving, api_key_name='OPENAI_API_KEY', fallback=None)
+    client = llm_backends.create_client(backend)
+    llm_resilience.configure(deadline=args.llm_deadline, hedge_after=args.llm_hedge_after, failover=not args.no_llm_failover)
+    if max_chunk_tokens + count_tokens(prompt_instructions) > backend.prompt_budget:
+        logger.warning("--max-chunk-tokens=%d exceeds the prompt budget of %s, reducing it.", max_chunk_tokens, backend.name)
+        max_chunk_tokens = backend.prompt_budget - count_tokens(prompt_instructions)
 
-    print(f"Total chunks created: {len(chunks)}\n")
+    if args.download_punkt:
+        download_punkt()
+    load_punkt()
 
-    # Summarize each chunk
-    summaries = []
-    for i, chunk in enumerate(chunks):
-        print(f"Summarizing chunk {i+1}/{len(chunks)}...")
-        summary = summarize_chunk(client, chunk, prompt_instructions, max_summary_tokens)
-        summaries.append(summary)
+    # Read the long document incrementally, segment it into sentences in a process pool and chunk
+    # it on the fly, so that summarization starts before the input is read. A file input is
+    # memory-mapped and passed to the workers as byte offsets.
+    if args.input_file:
+        logger.info("Reading input text from '%s'...", args.input_file)
+        blocks = iter_file_blocks(args.input_file, args.block_size)
+    else:
+        logger.info("Reading input text from stdin...")
+        blocks = iter_paragraph_blocks(sys.stdin, args.block_size)
+    chunks = iter_chunks(iter_sentences(blocks, args.segment_workers), max_chunk_tokens, overlap_tokens)
 
-    # Combine summaries
-    combined_summary = ' '.join(summaries)
-    print("Combined all chunk summaries.")
+    # Summarize the chunks with up to max_concurrency requests in flight. Summaries are spilled to
+    # disk in order to bound the memory usage.
+    # A chunk whose request fails is left out of the summary; the run exits with an error after
+    # the outputs are written.
+    summaries = SummarySpill()
+    failed_chunks = []
+    with instrumentation.span("summarize_chunks"), ThreadPoolExecutor(max_workers=backend.max_concurrency) as executor:
+        summarize = lambda chunk: summarize_chunk_or_none(client, chunk, prompt_instructions, max_summary_tokens, backend)
+        for i, summary in enumerate(_ordered_imap(executor, summarize, chunks, max_in_flight=backend.max_concurrency)):
+            if summary is None:
+                failed_chunks.append(i + 1)
+                continue
+            logger.info("Summarized chunk %d.", i + 1)
+            summaries.append(summary)
+    logger.info("Total chunks created: %d", summaries.count + len(failed_chunks))
 
     # Dump the combined summary if specified
     if dump_combined_summary:
         with open(dump_combined_summary, 'w', encoding='utf-8') as file:
-            print(f"Dumping the combined summary to '{dump_combined_summary}'...")
-            file.write(combined_summary)
+            logger.info("Dumping the combined summary to '%s'...", dump_combined_summary)
+            summaries.write_to(file)
 
     # Optional: Second-level summarization
+    failed_combined_chunks = []
     if second_level_summarization:
-        print("\nPerforming second-level summarization...\n")
-        if count_tokens(combined_summary) > second_level_max_chunk_tokens:
-            print("Combined summary exceeds max chunk tokens, splitting into smaller chunks...")
-            combined_chunks = split_text_into_chunks(combined_summary, second_level_max_chunk_tokens, overlap_tokens)
-            combined_summaries = []
-            for i, chunk in enumerate(combined_chunks):
-                print(f"Summarizing combined chunk {i+1}/{len(combined_chunks)}...")
-                summary = summarize_chunk(client, chunk, second_level_prompt, max_summary_tokens)
-                combined_summaries.append(summary)
-            final_summary = ' '.join(combined_summaries)
-        else:
-            final_summary = summarize_chunk(client, combined_summary, second_level_prompt, max_summary_tokens)
+        logger.info("Performing second-level summarization...")
+        with instrumentation.span("second_level_summarization"):
+            if summaries.num_tokens > second_level_max_chunk_tokens:
+                logger.info("Combined summary exceeds max chunk tokens, splitting into smaller chunks...")
+                # Stream the spilled summaries back through the chunker
+                combined_sentences = (sentence for summary in summaries for sentence in segment_block(summary))
+                combined_summaries = []
+                for i, chunk in enumerate(iter_chunks(combined_sentences, second_level_max_chunk_tokens, overlap_tokens)):
+                    logger.info("Summarizing combined chunk %d...", i + 1)
+                    summary = summarize_chunk_or_none(client, chunk, second_level_prompt, max_summary_tokens, backend)
+                    if summary is None:
+                        failed_combined_chunks.append(i + 1)
+                        continue
+                    combined_summaries.append(summary)
+                final_summary = ' '.join(combined_summaries)
+            else:
+                final_summary = summarize_chunk_or_none(client, ' '.join(summaries), second_level_prompt, max_summary_tokens, backend)
+                if final_summary is None:
+                    # Fall back to the combined summary rather than writing nothing
+                    failed_combined_chunks.append(1)
+                    final_summary = ' '.join(summaries)
+        final_summaries = [final_summary]
     else:
-        final_summary = combined_summary
+        final_summaries = summaries
 
     # Output the final summary
     print("\nFinal Summary:\n")
-    print(final_summary)
+    for i, summary in enumerate(final_summaries):
+        print(' ' + summary if i else summary, end='')
+    print()
 
     # Save the summary to a file
     with open(output_file, 'w', encoding='utf-8') as file:
-        print(f"Saving the final summary to '{output_file}'...")
-        file.write(final_summary)
+        logger.info("Saving the final summary to '%s'...", output_file)
+        for i, summary in enumerate(final_summaries):
+            file.write(' ' + summary if i else summary)
+    summaries.close()
+
+    if failed_chunks or failed_combined_chunks:
+        if failed_chunks:
+            logger.error("%d chunk(s) could not be summarized and are missing from the summary: %s",
+                         len(failed_chunks), ', '.join(map(str, failed_chunks)))
+        if failed_combined_chunks:
+            logger.error("%d combined chunk(s) could not be summarized in the second level: %s",
+                         len(failed_combined_chunks), ', '.join(map(str, failed_combined_chunks)))
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
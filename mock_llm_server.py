@@ -0,0 +1,139 @@
+# Local stand-in for an OpenAI-compatible chat completions endpoint.
+# It answers every POST to /chat/completions (or /v1/chat/completions) after a configurable
+# latency with a short canned summary and an estimated token usage, so the summarization
+# pipeline can be benchmarked and tested without an API key or network access. Like DeepSeek,
+# it reports the tokens of a previously seen system message as prompt_cache_hit_tokens.
+# Faults can be injected to test retries and failover: a list of per-request faults (an HTTP
+# status to answer with, or extra seconds of latency) consumed in order, and/or a random error
+# rate. Example:
+#   python mock_llm_server.py --port 8000 --latency 0.5 --error-rate 0.1 --error-status 503
+#   LOCAL_LLM_BASE_URL=http://127.0.0.1:8000 python llm_summarize.py --serving Local < input.txt
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server.mock
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        messages = request.get('messages', [])
+        system = ''.join(message.get('content') or '' for message in messages if message.get('role') == 'system')
+        with server.lock:
+            server.requests.append(request)
+            fault = server.faults.pop(0) if server.faults else None
+            if fault is None and server.error_rate and random.random() < server.error_rate:
+                fault = server.error_status
+            if not isinstance(fault, int):
+                cache_hit = bool(system) and system in server.prompt_prefixes
+                server.prompt_prefixes.add(system)
+        latency = server.latency + random.uniform(0, server.latency_jitter)
+        if isinstance(fault, float):
+            latency += fault
+        if latency > 0:
+            time.sleep(latency)
+        if isinstance(fault, int):
+            self._send(fault, {"error": {"message": f"Injected fault {fault}", "type": "mock_error"}}, {"Retry-After": "0"} if fault == 429 else None)
+            return
+
+        prompt = ''.join(message.get('content') or '' for message in messages)
+        # Roughly 4 characters per token
+        prompt_tokens = max(1, len(prompt) // 4)
+        content = server.reply or f"Summary of {len(prompt)} characters: {prompt[-80:].strip()}"
+        completion_tokens = max(1, len(content) // 4)
+        cache_hit_tokens = min(len(system) // 4, prompt_tokens) if cache_hit else 0
+        self._send(200, {
+            "id": f"mock-{len(server.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'mock'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_cache_hit_tokens": cache_hit_tokens,
+                "prompt_cache_miss_tokens": prompt_tokens - cache_hit_tokens,
+            },
+        })
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockLLMServer:
+    """
+    Background mock server. Use it as a context manager; url is the base URL to pass to the
+    OpenAI client and requests records every received request body. faults is a list of
+    per-request faults consumed in order: an int answers with that HTTP status, a float adds
+    that many seconds of latency and None answers normally.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, latency_jitter=0.0, reply=None, faults=None, error_rate=0.0, error_status=503):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.reply = reply
+        self.faults = list(faults or [])
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+        self.prompt_prefixes = set()
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of an OpenAI-compatible chat completions endpoint.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency in seconds added to every response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Maximum random latency in seconds added on top of --latency")
+    parser.add_argument("--reply", type=str, default=None, help="Fixed reply content (default: echo a summary of the prompt)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of the injected errors")
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(args.host, args.port, args.latency, args.latency_jitter, args.reply, error_rate=args.error_rate, error_status=args.error_status)
+    print(f"Serving mock chat completions at {server.url}")
+    server._httpd.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Parallel evaluation of the filtering rules over large item sets, e.g. a year-long backfill.
+#  1. The items are converted into compact tuples of plain values (no PyGithub objects or class
+#     instances), split into shards and evaluated in a process pool. Each shard is one task, so
+#     the pickling overhead is per shard rather than per item.
+#  2. The evaluation function returns a (keep, reason) pair per item. The decisions are merged
+#     back in the original order of the items.
+#  3. The reasons are aggregated into statistics: logged, and recorded as the
+#     items_kept_total / items_filtered_total counters labeled by reason.
+
+import logging
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Below this number of items, starting a process pool costs more than it saves
+min_parallel_items = 256
+
+def resolve_workers(workers):
+    """
+    0 or a negative number means one worker per CPU core.
+    """
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+def shards(values, workers, shard_size=None):
+    """
+    Split values into shards, about four per worker so that uneven shards balance out.
+    """
+    if shard_size is None:
+        shard_size = max(64, math.ceil(len(values) / (workers * 4)))
+    return [values[i:i + shard_size] for i in range(0, len(values), shard_size)]
+
+def evaluate(evaluate_shard, compact_items, workers=1, shard_size=None):
+    """
+    Evaluate the compact items with evaluate_shard, a picklable function mapping a list of compact
+    items to a list of (keep, reason) pairs. Returns the pairs in the order of the items.
+    """
+    workers = resolve_workers(workers)
+    if workers <= 1 or len(compact_items) < min_parallel_items:
+        return evaluate_shard(compact_items)
+    item_shards = shards(compact_items, workers, shard_size)
+    logger.info("Evaluating %d items in %d shards with %d processes.", len(compact_items), len(item_shards), workers)
+    decisions = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(item_shards))) as executor:
+        for shard_decisions in executor.map(evaluate_shard, item_shards):
+            decisions.extend(shard_decisions)
+    return decisions
+
+def record_reasons(decisions):
+    """
+    Log and count the decisions by reason. Returns the counts keyed by (keep, reason).
+    """
+    stats = Counter(decisions)
+    for (keep, reason), count in sorted(stats.items(), key=lambda entry: -entry[1]):
+        instrumentation.count("items_kept_total" if keep else "items_filtered_total", count, reason=reason)
+        logger.info("%s %d items: %s", "Kept" if keep else "Filtered out", count, reason)
+    return stats
@@ -0,0 +1,136 @@
+# Relevance ranking of the filtered items and their selection under a token budget.
+#  1. Every item gets a score from weighted signals: matches of the filtering rules (the
+#     specified user involved, upstreaming keywords in the title, description or labels),
+#     comment velocity in the window, reviewer involvement, labels and state.
+#  2. The items are ordered by score and their rendered texts are taken in that order until the
+#     token budget is used up. The following items are only listed by title and URL while the
+#     budget allows, the rest are counted. The digest prompt, and so its cost and latency, is
+#     bounded whatever the activity of the window.
+#  3. A cost budget in dollars is converted into a token budget for the serving backend, the
+#     completion of every request included. It does not limit a free backend.
+#  4. With summarize_github --incremental, the texts are the cached per-item summaries, so the
+#     budget bounds the digest requests only. The requests summarizing new or changed items
+#     individually are not included in it.
+# Weights are module-level dicts, so they can be tuned without touching the scoring code. The
+# keyword signals of a batch are looked up once with search_index.keyword_matches.
+
+import logging
+import math
+import re
+from datetime import datetime
+
+from utils import intel_upstreaming_key_words
+from condense import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Signal: weight
+weights = {
+    "specified_user": 3.0,
+    "keyword_in_title": 2.0,
+    "keyword_in_description": 1.0,
+    "keyword_in_labels": 2.0,
+    "comment_velocity": 1.5,
+    "reviewers": 0.5,
+    "created_in_window": 1.0,
+    "open": 0.5,
+    "closed_in_window": 0.5,
+}
+
+# Label pattern (case-insensitive): weight added when an item has a matching label
+label_weights = {
+    r"high priority|critical|blocker": 2.0,
+    r"regression": 1.5,
+    r"bc-breaking|release notes": 1.0,
+    r"^skip|ci-no-td|^stale": -1.0,
+}
+
+def _parse_time(timestamp):
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).replace(tzinfo=None)
+
+def _matches(text, patterns=intel_upstreaming_key_words):
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+
+def signals(item, rules):
+    """
+    Unweighted signals of an item. rules are the filtering rules of summarize_github
+    (start_date, end_date, specified_user), with the keyword_matches of the batch if known.
+    """
+    start, end = rules['start_date'], rules['end_date']
+    comment_dates = [_parse_time(comment['created_at']) for comment in item.comments + item.review_comments]
+    window_comments = sum(1 for date in comment_dates if start <= date <= end)
+    window_days = max((end - start).total_seconds() / 86400, 1.0)
+    specified_user = rules.get('specified_user')
+    matches = rules.get('keyword_matches')
+    if matches is not None:
+        in_title, in_description, in_labels = (item.number in matches[field] for field in ('title', 'description', 'labels'))
+    else:
+        in_title, in_description = _matches(item.title), _matches(item.description or "")
+        in_labels = any(_matches(tag) for tag in item.tags)
+    return {
+        "specified_user": float(bool(specified_user) and (
+            specified_user in item.description or specified_user in item.reviewers
+            or any(specified_user in comment['body'] for comment in item.comments))),
+        "keyword_in_title": float(in_title),
+        "keyword_in_description": float(in_description),
+        "keyword_in_labels": float(in_labels),
+        # Comments per day in the window, log-scaled so that a flame war does not dominate
+        "comment_velocity": math.log1p(window_comments / window_days),
+        "reviewers": float(min(len(item.reviewers), 4)),
+        "created_in_window": float(start <= _parse_time(item.created_at) <= end),
+        "open": float(item.state == "open"),
+        "closed_in_window": float(item.state == "closed" and window_comments > 0),
+    }
+
+def score(item, rules):
+    value = sum(weights[name] * signal for name, signal in signals(item, rules).items())
+    for pattern, weight in label_weights.items():
+        if any(re.search(pattern, tag, re.IGNORECASE) for tag in item.tags):
+            value += weight
+    return value
+
+def brief(item):
+    return f"- {item.title} ({item.url})"
+
+def select(items, texts, rules, token_budget, count_tokens=estimate_tokens):
+    """
+    Order the items with their rendered texts by score and select them under token_budget.
+    Returns the selected items, their texts and the brief lines of the items listed by title.
+    """
+    from search_index import keyword_matches
+    rules = dict(rules, keyword_matches=keyword_matches(items, fields=('title', 'description', 'labels')))
+    scores = [score(item, rules) for item in items]
+    order = sorted(range(len(items)), key=lambda i: -scores[i])
+    selected = []
+    briefs = []
+    used = 0
+    for i in order:
+        num_tokens = count_tokens(texts[i])
+        # Once an item is listed by title, the lower ranked ones are as well
+        if not briefs and used + num_tokens <= token_budget:
+            selected.append(i)
+            used += num_tokens
+            continue
+        line = brief(items[i])
+        num_tokens = count_tokens(line)
+        if used + num_tokens > token_budget:
+            break
+        briefs.append(line)
+        used += num_tokens
+    omitted = len(items) - len(selected) - len(briefs)
+    if omitted:
+        briefs.append(f"- ... and {omitted} more items")
+    logger.info("Selected %d of %d items under a budget of %d tokens, %d listed by title, %d omitted.",
+                len(selected), len(items), token_budget, len(briefs) - bool(omitted), omitted)
+    return [items[i] for i in selected], [texts[i] for i in selected], briefs
+
+def token_budget_for_cost(backend, cost_budget):
+    """
+    Number of item text tokens that can be summarized with backend for cost_budget dollars,
+    counting a full completion per prompt_budget tokens. None for a free backend (e.g. a local
+    server), for which the cost does not limit the tokens.
+    """
+    cost_per_token = (backend.input_price + backend.max_output_tokens * backend.output_price / backend.prompt_budget) / 1e6
+    if cost_per_token <= 0:
+        return None
+    return int(cost_budget / cost_per_token)
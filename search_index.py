@@ -0,0 +1,390 @@
+# Local full-text search index over the GitHub items collected by summarize_github.py.
+#  1. The index is an SQLite database next to the item database ("{db_path}.index") with FTS5
+#     tables over titles, descriptions, labels and comment bodies.
+#  2. It is maintained incrementally: summarize_github and backfill write items through
+#     IndexedDB, which upserts the item row and its comments, re-indexing edited comment bodies.
+#     highlight_github_activities keeps no item database, so its items are not indexed.
+#  3. FTS5 uses the trigram tokenizer, so regex keyword rules like intel_upstreaming_key_words
+#     are evaluated by looking up the literal parts of each pattern in the index first and only
+#     running the regex on the candidate items. keyword_matches does so for a batch of items in
+#     an in-memory index, so that the filtering rules of the collectors and the ranking test
+#     membership in the candidate sets instead of scanning every item for every keyword.
+# Example:
+#   python search_index.py --db-path pytorch_pytorch_db --since 2024-07-01 --only-issues --label xpu oneDNN
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from collections.abc import MutableMapping
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+from utils import intel_upstreaming_key_words, is_item_key
+
+logger = logging.getLogger(__name__)
+
+_schema = '''
+    CREATE TABLE IF NOT EXISTS items (
+        number INTEGER PRIMARY KEY,
+        kind TEXT,
+        url TEXT,
+        state TEXT,
+        submitter TEXT,
+        created_at TEXT,
+        title TEXT,
+        description TEXT,
+        labels TEXT
+    );
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY,
+        number INTEGER,
+        is_review INTEGER,
+        author TEXT,
+        created_at TEXT,
+        body TEXT,
+        UNIQUE (number, is_review, author, created_at)
+    );
+    CREATE INDEX IF NOT EXISTS comments_number ON comments (number);
+    CREATE INDEX IF NOT EXISTS comments_created_at ON comments (created_at);
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        title, description, labels, content='items', content_rowid='number', tokenize='trigram'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+        body, content='comments', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts (rowid, title, description, labels) VALUES (new.number, new.title, new.description, new.labels);
+    END;
+    CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, title, description, labels) VALUES ('delete', old.number, old.title, old.description, old.labels);
+    END;
+    CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
+        INSERT INTO items_fts (items_fts, rowid, title, description, labels) VALUES ('delete', old.number, old.title, old.description, old.labels);
+        INSERT INTO items_fts (rowid, title, description, labels) VALUES (new.number, new.title, new.description, new.labels);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, body) VALUES (new.id, new.body);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_au AFTER UPDATE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO comments_fts (rowid, body) VALUES (new.id, new.body);
+    END;
+'''
+
+# Characters that make the surrounding text of a regex something else than a literal
+_regex_special = re.compile(r"\.\*|\.\+|\.\?|[\\\[\](){}|^$?*+.]")
+
+def index_path(db_path):
+    """
+    Path of the search index belonging to the given item database.
+    """
+    return f"{db_path}.index"
+
+def pattern_literals(pattern):
+    """
+    Split a regex into the literal substrings that any match must contain. Returns None if the
+    pattern contains constructs other than literals joined by wildcards, or if a literal is too
+    short to be looked up in the trigram index.
+    """
+    parts = re.split(r"\.\*|\.\+", pattern)
+    if any(_regex_special.search(part) for part in parts):
+        return None
+    literals = [part for part in parts if part]
+    if not literals or any(len(literal) < 3 for literal in literals):
+        return None
+    return literals
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+class SearchIndex:
+    def __init__(self, db_path) -> None:
+        self._db_path = db_path
+
+    def __enter__(self):
+        # Like the item store, WAL lets searches run while a collector updates the index, and
+        # concurrent writers wait for each other instead of failing with "database is locked"
+        self._db = sqlite3.connect(self._db_path, timeout=60.0)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_schema)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._db.commit()
+        self._db.close()
+
+    def index_item(self, github_item, commit=True):
+        """
+        Add or update an item. Comments are keyed by kind, author and creation time, so only
+        new comments are inserted and only edited ones are re-indexed.
+        """
+        self.index_items([github_item], commit=commit)
+
+    def index_items(self, github_items, commit=True, comments=True):
+        """
+        Add or update items in one batch. With comments=False only the item fields are indexed.
+        """
+        github_items = list(github_items)
+        self._db.executemany('''
+            INSERT INTO items (number, kind, url, state, submitter, created_at, title, description, labels)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (number) DO UPDATE SET
+                kind = excluded.kind, url = excluded.url, state = excluded.state, submitter = excluded.submitter,
+                created_at = excluded.created_at, title = excluded.title, description = excluded.description,
+                labels = excluded.labels
+            WHERE title IS NOT excluded.title OR description IS NOT excluded.description
+                OR labels IS NOT excluded.labels OR state IS NOT excluded.state
+        ''', [(
+            int(github_item.number),
+            'pr' if '/pull/' in github_item.url else 'issue',
+            github_item.url,
+            github_item.state,
+            github_item.submitter,
+            github_item.created_at,
+            github_item.title,
+            github_item.description,
+            '\n'.join(github_item.tags),
+        ) for github_item in github_items])
+        if comments:
+            self._index_comments(
+                (int(github_item.number), is_review, comment)
+                for github_item in github_items
+                for is_review, comments in ((0, github_item.comments), (1, github_item.review_comments))
+                for comment in comments
+            )
+        if commit:
+            self._db.commit()
+
+    def index_comment(self, number, comment, is_review=False, commit=True):
+        """
+        Add or update a single comment of an item.
+        """
+        self._index_comments([(int(number), int(is_review), comment)])
+        if commit:
+            self._db.commit()
+
+    def _index_comments(self, comments):
+        # comments are (number, is_review, comment) triples
+        self._db.executemany('''
+            INSERT INTO comments (number, is_review, author, created_at, body) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (number, is_review, author, created_at) DO UPDATE SET body = excluded.body
+            WHERE body IS NOT excluded.body
+        ''', [(number, is_review, comment['author'], comment['created_at'], comment['body'] or '') for number, is_review, comment in comments])
+
+    def remove_item(self, number):
+        self._db.execute('DELETE FROM items WHERE number = ?', (int(number),))
+        self._db.execute('DELETE FROM comments WHERE number = ?', (int(number),))
+        self._db.commit()
+
+    def _filters(self, since=None, until=None, state=None, kind=None, labels=None):
+        """
+        Build the SQL conditions on the items table. An item is active in [since, until] if it
+        was created or commented in the range.
+        """
+        conditions, params = [], []
+        if since or until:
+            since = since or ''
+            until = until or '9999-12-31'
+            conditions.append('''(items.created_at BETWEEN ? AND ? OR EXISTS (
+                SELECT 1 FROM comments c WHERE c.number = items.number AND c.created_at BETWEEN ? AND ?))''')
+            params += [since, until, since, until]
+        if state:
+            conditions.append('items.state = ?')
+            params.append(state)
+        if kind:
+            conditions.append('items.kind = ?')
+            params.append(kind)
+        for label in labels or []:
+            conditions.append("items.labels LIKE ?")
+            params.append(f"%{label}%")
+        return conditions, params
+
+    def _matching_numbers(self, fts_query, fields):
+        """
+        Numbers of the items whose given fields ('title', 'description', 'labels', 'comments')
+        match the FTS5 query.
+        """
+        numbers = set()
+        item_fields = [field for field in fields if field != 'comments']
+        if item_fields:
+            column_filter = '{' + ' '.join(item_fields) + '}'
+            cursor = self._db.execute('SELECT rowid FROM items_fts WHERE items_fts MATCH ?', (f"{column_filter} : ({fts_query})",))
+            numbers.update(row[0] for row in cursor)
+        if 'comments' in fields:
+            cursor = self._db.execute('''
+                SELECT DISTINCT comments.number FROM comments_fts JOIN comments ON comments.id = comments_fts.rowid
+                WHERE comments_fts MATCH ?
+            ''', (fts_query,))
+            numbers.update(row[0] for row in cursor)
+        return numbers
+
+    def _field_texts(self, number, fields):
+        texts = []
+        row = self._db.execute('SELECT title, description, labels FROM items WHERE number = ?', (number,)).fetchone()
+        if row:
+            texts += [text for field, text in zip(('title', 'description', 'labels'), row) if field in fields]
+        if 'comments' in fields:
+            texts += [body for (body,) in self._db.execute('SELECT body FROM comments WHERE number = ?', (number,))]
+        return texts
+
+    def match_patterns(self, patterns, fields=('title', 'description')):
+        """
+        Numbers of the items whose fields match any of the regex patterns (case-insensitive).
+        Candidates are looked up in the index by the literal parts of each pattern and then
+        verified with the regex. Patterns without usable literals fall back to a full scan.
+        """
+        matches = set()
+        for pattern in patterns:
+            literals = pattern_literals(pattern)
+            if literals is None:
+                logger.info("Pattern '%s' cannot be looked up in the index, scanning all items.", pattern)
+                candidates = {row[0] for row in self._db.execute('SELECT number FROM items')}
+            else:
+                candidates = self._matching_numbers(' AND '.join(_fts_phrase(literal) for literal in literals), fields)
+            regex = re.compile(pattern, re.IGNORECASE)
+            matches.update(number for number in candidates - matches
+                           if any(regex.search(text) for text in self._field_texts(number, fields)))
+        return matches
+
+    def search(self, query=None, patterns=None, fields=('title', 'description', 'comments'), since=None, until=None,
+               state=None, kind=None, labels=None, limit=None):
+        """
+        Search items. query is an FTS5 query over the given fields and patterns is a list of
+        regexes of which any must match. Returns dicts ordered by descending creation time.
+        """
+        conditions, params = self._filters(since, until, state, kind, labels)
+        numbers = None
+        if query:
+            numbers = self._matching_numbers(query, fields)
+        if patterns:
+            pattern_numbers = self.match_patterns(patterns, fields)
+            numbers = pattern_numbers if numbers is None else numbers & pattern_numbers
+        if numbers is not None:
+            if not numbers:
+                return []
+            conditions.append(f"items.number IN ({', '.join('?' * len(numbers))})")
+            params += sorted(numbers)
+        sql = 'SELECT number, kind, url, state, submitter, created_at, title FROM items'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY created_at DESC'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        columns = ('number', 'kind', 'url', 'state', 'submitter', 'created_at', 'title')
+        return [dict(zip(columns, row)) for row in self._db.execute(sql, params)]
+
+def keyword_matches(items, patterns=intel_upstreaming_key_words, fields=('title', 'description')):
+    """
+    Numbers of the items whose field matches any of the regex patterns, by field. The items are
+    indexed in memory, so that each pattern is looked up once for all of them.
+    """
+    with SearchIndex(":memory:") as index:
+        index.index_items(items, commit=False, comments='comments' in fields)
+        return {field: index.match_patterns(patterns, fields=(field,)) for field in fields}
+
+class IndexedDB(MutableMapping):
+    """
+    Item database wrapper that keeps a SearchIndex up to date with every write.
+    """
+    def __init__(self, db, index) -> None:
+        self._db = db
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._db[key]
+
+    def __setitem__(self, key, github_item):
+        self._db[key] = github_item
+        if is_item_key(key):
+            self._index.index_item(github_item)
+
+    def __delitem__(self, key):
+        del self._db[key]
+        if is_item_key(key):
+            self._index.remove_item(key)
+
+    def __contains__(self, key):
+        return key in self._db
+
+    def append_comment(self, key, comment, is_review=False):
+        appended = self._db.append_comment(key, comment, is_review)
+        if appended:
+            self._index.index_comment(key, comment, is_review)
+        return appended
+
+    def field_values(self, name):
+        return self._db.field_values(name)
+
+    def __iter__(self):
+        return iter(self._db)
+
+    def __len__(self):
+        return len(self._db)
+
+def rebuild_index(db, index):
+    """
+    Index every item of the item database.
+    """
+    count = 0
+    for key in db:
+        if not is_item_key(key):
+            continue
+        index.index_item(db[key], commit=False)
+        count += 1
+    logger.info("Indexed %d items.", count)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the local full-text search index of collected GitHub issues and pull requests.")
+    parser.add_argument("query", nargs="?", default=None, help="FTS5 query, e.g. 'oneDNN AND conv' (substring matching, case-insensitive)")
+    parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
+    parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
+    parser.add_argument("--db-path", type=str, default=None, help="Path to the item database")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the item database before querying")
+    parser.add_argument("--regex", type=str, action="append", default=[], help="Regex that must match (may be given multiple times, any must match)")
+    parser.add_argument("--intel-keywords", action="store_true", help="Match the Intel upstreaming keyword rule")
+    parser.add_argument("--fields", type=str, default="title,description,comments", help="Comma-separated fields to search: title, description, labels, comments")
+    parser.add_argument("--since", type=str, default=None, help="Only items created or commented on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=str, default=None, help="Only items created or commented on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--state", type=str, choices=["open", "closed"], default=None, help="Only items in this state")
+    parser.add_argument("--only-issues", action="store_true", help="Only issues")
+    parser.add_argument("--only-prs", action="store_true", help="Only pull requests")
+    parser.add_argument("--label", type=str, action="append", default=[], help="Only items with a label containing this text")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of results")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--log-level", type=str, default="WARNING", help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    db_path = args.db_path if args.db_path else f"{args.owner}_{args.repo}_db"
+
+    with SearchIndex(index_path(db_path)) as index:
+        if args.rebuild:
+            import item_store
+            with item_store.open_db(db_path, readonly=True) as db:
+                rebuild_index(db, index)
+
+        patterns = list(args.regex)
+        if args.intel_keywords:
+            patterns += intel_upstreaming_key_words
+        kind = 'issue' if args.only_issues else 'pr' if args.only_prs else None
+        until = args.until + "T23:59:59" if args.until else None
+        results = index.search(args.query, patterns=patterns, fields=tuple(args.fields.split(',')), since=args.since,
+                               until=until, state=args.state, kind=kind, labels=args.label, limit=args.limit)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for result in results:
+            print(f"#{result['number']} [{result['kind']}, {result['state']}, {result['created_at'][:10]}] {result['title']}\n    {result['url']}")
+
+if __name__ == "__main__":
+    main()
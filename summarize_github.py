@@ -1,98 +1,178 @@
+# Heavy dependencies (PyGithub, tiktoken, dotenv, sqlite3) are imported in the
+# functions that need them, so that runs which never fetch or summarize start fast.
 import sys
-from github import Github
+import hashlib
 from datetime import datetime
 import os
 import argparse
-import shelve
+import contextlib
+import functools
 import logging
-from dotenv import load_dotenv
-import openai
-import tiktoken
-import sqlite3
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(script_dir)
 
-from mail_util import send_email_with_attachment
-from utils import get_tokens
-
-load_dotenv()
+from utils import get_tokens, is_item_key
+import github_replay
+import instrumentation
+import llm_backends
+import llm_resilience
+import parallel_filter
 
 logger = logging.getLogger(__name__)
 
-llm_keys = {
-    "OpenAI" : "OPENAI_API_KEY",
-    "DeepSeek" : "DEEPSEEK_API_KEY"
-}
+ignored_authors = {"pytorchmergebot", "pytorch-bot[bot]", "facebook-github-bot"}
 
-llm_urls = {
-    "OpenAI" : "https://api.openai.com",
-    "DeepSeek" : "https://api.deepseek.com"
-}
+item_instruction = """
+Summarize the GitHub issue or pull request below within two sentences. Be concise and
+focus on what it changes or reports and its current status. Do not repeat the title.
 
-ignored_authors = {"pytorchmergebot", "pytorch-bot[bot]", "facebook-github-bot"}
+"""
 
 def init_db(db_path):
     """
     Initialize the database.
     """
+    import sqlite3
     return sqlite3.connect(db_path)
 
 def count_tokens(text, encoding_name='gpt2'):
     """
     Counts the number of tokens in a text string using the specified encoding.
     """
-    logger.info(f"Counting tokens for text: {text[:50]}...")
-    encoding = tiktoken.get_encoding(encoding_name)
-    tokens = encoding.encode(text, disallowed_special=())
-    logger.info(f"Token count: {len(tokens)}")
+    logger.debug("Counting tokens for text: %s...", text[:50])
+    with instrumentation.span("count_tokens"):
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        tokens = encoding.encode(text, disallowed_special=())
+    logger.debug("Token count: %d", len(tokens))
     return len(tokens)
 
-def summarize_chunk(client, chunk, prompt_instructions="", max_summary_tokens=None):
-    logger.info(f"Summarizing chunk: {chunk[:50]}...")
-    prompt = f"{prompt_instructions}{chunk}"
+def summarize_chunk(client, chunk, prompt_instructions="", max_summary_tokens=None, backend=None):
+    if backend is None:
+        backend = llm_backends.get_backend("DeepSeek")
+    logger.info("Summarizing chunk: %s...", chunk[:50])
+    # The instruction goes into the system message, so repeated requests share a cacheable prefix
+    summary = llm_resilience.chat(client, backend, chunk, max_summary_tokens, system=prompt_instructions)
+    logger.info("Summary generated: %s...", summary[:50])
+    return summary
+
+def summarize_chunk_or_none(client, chunk, prompt_instructions="", backend=None):
+    """
+    Like summarize_chunk, but an LLMError is logged and counted and None is returned, so that
+    a single failed request does not abort the whole digest.
+    """
     try:
-        response = client.chat.completions.create(
-            model='deepseek-chat',  # You can switch to 'gpt-4' if you have access
-            messages=[{'role': 'user', 'content': prompt}],
-            max_tokens=max_summary_tokens,
-            temperature=0.7,
-        )
-        summary = response.choices[0].message.content.strip()
-        logger.info(f"Summary generated: {summary[:50]}...")
-        return summary
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return ""
+        return summarize_chunk(client, chunk, prompt_instructions, backend=backend)
+    except llm_resilience.LLMError as e:
+        logger.error("Failed to summarize chunk %s...: %s", chunk[:50], e)
+        instrumentation.count("llm_failed_summaries_total", model=backend.model if backend else None)
+        return None
 
-def text_summarize(text_chunks, serving = "DeepSeek", instruction=None, context=None, separator="\n"):
-    _, deep_seek_api_key, openai_api_key = get_tokens()
-    api_key = openai_api_key if serving == "OpenAI" else deep_seek_api_key
-    client = openai.OpenAI(api_key=api_key, base_url=llm_urls[serving])
-    if instruction is None:
-        instruction = "Summarize the text below:\n\n"
-    max_tokens = 32000 * 2  # 64K tokens
-    instruction_num_tokens = count_tokens(instruction)
-    chunk_num_tokens = [count_tokens(chunk) for chunk in text_chunks]
+def create_client(serving="DeepSeek"):
+    """
+    Create an OpenAI-compatible client for the given serving.
+    """
+    return llm_backends.create_client(llm_backends.get_backend(serving))
+
+def pack_chunks(chunk_num_tokens, budget):
+    """
+    Greedily pack consecutive chunks into batches of at most budget tokens. Returns the
+    (start, end) index ranges of the batches. A chunk larger than the budget forms its own batch.
+    """
+    batches = []
     end_id = 0
-    summaries = []
     while end_id < len(chunk_num_tokens):
-        num_tokens = instruction_num_tokens
         start_id = end_id
-        while num_tokens < max_tokens and end_id < len(chunk_num_tokens):
+        num_tokens = chunk_num_tokens[end_id]
+        end_id += 1
+        while end_id < len(chunk_num_tokens) and num_tokens + chunk_num_tokens[end_id] <= budget:
             num_tokens += chunk_num_tokens[end_id]
             end_id += 1
-        assert end_id > start_id
-        if num_tokens > max_tokens:
-            logger.warning(f"Chunk {start_id} is too large to fit in the max_tokens={max_tokens} limit.")
-            text = text_chunks[start_id][:max_tokens - instruction_num_tokens]
+        batches.append((start_id, end_id))
+    return batches
+
+def text_summarize(text_chunks, serving = "DeepSeek", instruction=None, context=None, separator="\n"):
+    backend = llm_backends.get_backend(serving)
+    client = create_client(serving)
+    if instruction is None:
+        instruction = "Summarize the text below:\n\n"
+    # Leave room for the completion in the context window of the backend
+    instruction_num_tokens = count_tokens(instruction)
+    max_tokens = backend.prompt_budget - instruction_num_tokens
+    chunk_num_tokens = [count_tokens(chunk) for chunk in text_chunks]
+    texts = []
+    for start_id, end_id in pack_chunks(chunk_num_tokens, max_tokens):
+        if chunk_num_tokens[start_id] > max_tokens:
+            logger.warning("Chunk %d is too large to fit in the max_tokens=%d limit.", start_id, max_tokens)
+            texts.append(text_chunks[start_id][:max_tokens])
         else:
-            text = separator.join(text_chunks[start_id:end_id])
-        summary = summarize_chunk(client, text, instruction)
-        summaries.append(summary)
+            texts.append(separator.join(text_chunks[start_id:end_id]))
+    # The instruction prefix is only billed in full for the first request, later ones hit the prompt cache
+    estimated_cost = backend.estimate_cost(instruction_num_tokens, sum(chunk_num_tokens), len(texts))
+    logger.info("Packed %d chunks into %d requests to %s, estimated prompt cost $%.4f.", len(text_chunks), len(texts), backend.name, estimated_cost)
+    # Failed requests leave None in their slot, see summarize_chunk_or_none
+    return llm_backends.map_concurrently(backend, lambda text: summarize_chunk_or_none(client, text, instruction, backend=backend), texts)
+
+def item_summary_key(text, instruction):
+    """
+    Hash the rendered item text together with the instruction used to summarize it.
+    """
+    digest = hashlib.sha256()
+    digest.update(instruction.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+def summarize_items_incrementally(items, texts, db_path, serving="DeepSeek", instruction=None):
+    """
+    Summarize each item individually, reusing the summary cached in the database if
+    neither the rendered item text nor the instruction changed since it was generated.
+    Returns the per-item summaries in the order of the given items, None for the items whose
+    summarization failed; those are retried on the next run.
+    """
+    if instruction is None:
+        instruction = item_instruction
+    keys = [item_summary_key(text, instruction) for text in texts]
+    summaries = [item.summary if item.summary_key == key else None for item, key in zip(items, keys)]
+    stale = [i for i, summary in enumerate(summaries) if summary is None]
+    logger.info("Reusing %d cached item summaries, summarizing %d new or changed items.", len(items) - len(stale), len(stale))
+    if not stale:
+        return summaries
+
+    backend = llm_backends.get_backend(serving)
+    client = create_client(serving)
+
+    def summarize(i):
+        summaries[i] = summarize_chunk_or_none(client, texts[i], instruction, backend=backend)
+
+    try:
+        llm_backends.map_concurrently(backend, summarize, stale)
+    finally:
+        # Persist the new summaries alongside the items, also those obtained before an
+        # interruption. Only the summary fields of the stored items are updated: apply_rules strips
+        # bot comments from the in-memory ones, and a collector may be writing new comments
+        # concurrently.
+        import item_store
+        with item_store.open_db(db_path) as db:
+            for i in stale:
+                key = str(items[i].number)
+                if not summaries[i] or key not in db:
+                    continue
+                db.update_fields(key, summary=summaries[i], summary_key=keys[i])
+    failed = sum(1 for i in stale if summaries[i] is None)
+    if failed:
+        logger.warning("Failed to summarize %d items, they are summarized again on the next run.", failed)
     return summaries
 
 class GitHubItem:
+    # Per-item summary cache and the key (see item_summary_key) it was generated for.
+    # Declared on the class so that items pickled before the cache existed still load.
+    summary = None
+    summary_key = None
+    # Last update of the item on GitHub when it was fetched, used by backfill.py to skip unchanged items
+    updated_at = None
+
     def __init__(self, number, title, url, description, submitter, tags, assignees, reviewers, created_at, comments, review_comments, state):
         self.number = number
         self.title = title
@@ -140,6 +220,7 @@ class GitHubItemDB:
         self._db_path = f"{org}_{repo}.db"
 
     def __enter__(self):
+        import sqlite3
         self._db = sqlite3.connect(self._db_path)
         self._cursor = self._db.cursor()
         self._cursor.execute('''
@@ -199,7 +280,7 @@ def refresh_items(repo, start_date, end_date, db):
             logger.info("Reached items outside of date range. Stopping early.")
             break
         if str(item.number) in db:
-            logger.info(f"Item with ID {item.id} found in database, updating fields except comments.")
+            logger.info("Item with ID %s found in database, updating fields except comments.", item.id)
             github_item = db[str(item.number)]
             github_item.title = item.title
             github_item.description = item.body if item.body else "No description available"
@@ -245,33 +326,34 @@ def refresh_item_comments(repo, start_date, db):
             process_item(repo, item, db)
 
 def update_with_new_comment(db, item_id, comment, is_review):
-    github_item = db[item_id]
     new_comment = {
         "author": comment.user.login,
         "body": comment.body,
         "created_at": comment.created_at.isoformat()
     }
-    # Check if the comment already exists
-    existing_comments = github_item.review_comments if is_review else github_item.comments
-    if any(c["created_at"] == new_comment["created_at"] and c["author"] == new_comment["author"] for c in existing_comments):
-        logger.info(f"Comment by {new_comment['author']} on {new_comment['created_at']} already exists, skipping.")
-        return
-
-    if is_review:
-        github_item.review_comments.append(new_comment)
-    else:
-        github_item.comments.append(new_comment)
-    db[item_id] = github_item
+    # Only the new comment row is written, the stored item is not loaded
+    if not db.append_comment(item_id, new_comment, is_review):
+        logger.info("Comment by %s on %s already exists, skipping.", new_comment['author'], new_comment['created_at'])
 
 def process_item(repo, item, db):
-    logger.info(f"Starting to process item '{item.title}' with ID {item.number}")
+    with instrumentation.span("process_item"):
+        _process_item(repo, item, db)
+
+def _process_item(repo, item, db):
+    db[str(item.number)] = fetch_item(repo, item)
+
+def fetch_item(repo, item):
+    """
+    Fetch an issue or pull request with its comments, review comments and reviewers.
+    """
+    logger.info("Starting to process item '%s' with ID %s", item.title, item.number)
     created_at = item.created_at.isoformat()
     comments = []
     review_comments = []
 
     # Fetch normal comments
     for comment in item.get_comments():
-        logger.info(f"Fetching comment by {comment.user.login} created at {comment.created_at.isoformat()}")
+        logger.debug("Fetching comment by %s created at %s", comment.user.login, comment.created_at)
         comments.append({
             "author": comment.user.login,
             "body": comment.body,
@@ -282,7 +364,7 @@ def process_item(repo, item, db):
     if '/pull/' in item.html_url:  # To distinguish pull requests by URL pattern
         pr = repo.get_pull(item.number)
         for review_comment in pr.get_review_comments():
-            logger.info(f"Fetching review comment by {review_comment.user.login} created at {review_comment.created_at.isoformat()}")
+            logger.debug("Fetching review comment by %s created at %s", review_comment.user.login, review_comment.created_at)
             review_comments.append({
                 "author": review_comment.user.login,
                 "body": review_comment.body,
@@ -298,9 +380,9 @@ def process_item(repo, item, db):
 
     if '/pull/' in item.html_url:  # To distinguish pull requests by URL pattern
         reviewers = list(set([review.user.login for review in pr.get_reviews() if review.user]))
-        logger.info(f"Fetching reviewers for PR #{item.number}: {', '.join(reviewers)}")
+        logger.info("Fetching reviewers for PR #%s: %s", item.number, reviewers)
 
-    logger.info(f"Adding or updating item '{item.title}' created by {submitter} on {created_at}")
+    logger.info("Adding or updating item '%s' created by %s on %s", item.title, submitter, created_at)
     github_item = GitHubItem(
         item.number,
         item.title,
@@ -315,37 +397,89 @@ def process_item(repo, item, db):
         review_comments,
         state
     )
-    db[str(item.number)] = github_item
+    github_item.updated_at = item.updated_at.isoformat()
+    return github_item
 
 def load_db(db_path):
     """
     Load the GitHub items from the database.
     """
-    with shelve.open(db_path) as db:
-        items = list(db.values())
+    import item_store
+    # Load from one snapshot, consistent even while a collector is writing
+    with item_store.open_db(db_path, readonly=True) as db, db.snapshot():
+        items = list(iter_items(db))
     return items
 
-def filter_items(items, rules):
+def iter_items(db):
     """
-    Apply filtering rules to the list of GitHub items.
+    Iterate over the GitHub items of the database, skipping the reserved keys (e.g. the
+    backfill checkpoints).
     """
-    filtered_items = []
-    for item in items:
-        if apply_rules(item, rules):
-            filtered_items.append(item)
+    for key in db:
+        if is_item_key(key):
+            yield db[key]
+
+def filter_items(items, rules, workers=1):
+    """
+    Apply filtering rules to the list of GitHub items. With more than one worker (0 for one per
+    CPU core), the rules are evaluated in a process pool.
+    """
+    with instrumentation.span("filter_items"):
+        if parallel_filter.resolve_workers(workers) > 1:
+            decisions = parallel_filter.evaluate(functools.partial(_evaluate_shard, rules), [_compact_item(item) for item in items], workers)
+        else:
+            decisions = [evaluate_rules(item, rules) for item in items]
+        filtered_items = []
+        for item, (keep, _) in zip(items, decisions):
+            if keep:
+                # The workers evaluated copies, strip the bot comments of the kept items here
+                strip_ignored_comments(item)
+                filtered_items.append(item)
+    parallel_filter.record_reasons(decisions)
     return filtered_items
 
+def _compact_comments(comments):
+    return [(comment['author'], comment['created_at'], comment['body']) for comment in comments]
+
+def _compact_item(item):
+    # Only the fields used by the rules, as plain values that pickle compactly
+    return (item.number, item.title, item.description, item.created_at, item.reviewers,
+            _compact_comments(item.comments), _compact_comments(item.review_comments))
+
+def _expand_comments(comments):
+    return [{'author': author, 'created_at': created_at, 'body': body} for author, created_at, body in comments]
+
+def _evaluate_shard(rules, compact_items):
+    decisions = []
+    for number, title, description, created_at, reviewers, comments, review_comments in compact_items:
+        item = GitHubItem(number, title, "", description, "", [], [], reviewers, created_at,
+                          _expand_comments(comments), _expand_comments(review_comments), "")
+        decisions.append(evaluate_rules(item, rules))
+    return decisions
+
+def strip_ignored_comments(item):
+    item.comments = [comment for comment in item.comments if comment['author'] not in ignored_authors]
+    item.review_comments = [review_comment for review_comment in item.review_comments if review_comment['author'] not in ignored_authors]
+
 def apply_rules(item: GitHubItem, rules):
     """
     Check if a GitHub item satisfies the given filtering rules.
     """
+    keep, _ = evaluate_rules(item, rules)
+    return keep
+
+def evaluate_rules(item: GitHubItem, rules):
+    """
+    Evaluate the filtering rules on a GitHub item. Returns whether to keep the item and the
+    reason of the decision.
+    """
     # Rule 1: Filter by start and end dates
     created_at = datetime.fromisoformat(item.created_at.replace('Z', '+00:00')).replace(tzinfo=None)
     comment_dates = [datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00')).replace(tzinfo=None) for comment in item.comments + item.review_comments]
     all_dates = [created_at] + comment_dates
     if not any(rules['start_date'] <= date <= rules['end_date'] for date in all_dates):
-        logger.info(f"Filtering out '{item.title}' because neither its creation time nor any comment time is within the date range.")
-        return False
+        logger.info("Filtering out '%s' because neither its creation time nor any comment time is within the date range.", item.title)
+        return False, "outside date range"
 
     # Rule 2: Comments containing tags of the specified user
     specified_user = rules.get('specified_user', '')
@@ -357,33 +491,56 @@ def apply_rules(item: GitHubItem, rules):
     _not_in_reviewers = lambda : specified_user not in item.reviewers
 
     if specified_user and _not_in_desc() and _not_in_comments() and _not_in_reviewers():
-        logger.info(f"Filtering out '{item.title}' because it does not contain a comment tagging the user '{specified_user}'.")
-        return False
+        logger.info("Filtering out '%s' because it does not contain a comment tagging the user '%s'.", item.title, specified_user)
+        return False, "specified user not involved"
 
     # Rule 3: Filter by the number of CCed users in the description
     if specified_user and not _not_in_desc():
         desc = item.description if item.description else ""
         if desc.count('@') > rules['number_of_ccer']:
-            logger.info(f"Filtering out '{item.title}' because the description contains more than {rules['number_of_ccer']} CCed users.")
-            return False
+            logger.info("Filtering out '%s' because the description contains more than %d CCed users.", item.title, rules['number_of_ccer'])
+            return False, "too many CCed users"
 
     # Rule 4: Ignore titles starting with "DISABLED"
     if item.title.startswith("DISABLED"):
-        logger.info(f"Filtering out '{item.title}' because the title starts with 'DISABLED'.")
-        return False
+        logger.info("Filtering out '%s' because the title starts with 'DISABLED'.", item.title)
+        return False, "DISABLED title"
 
     # Rule 5: Ignore comments tagging or created by specific bots
-    ignored_authors = {"pytorchmergebot", "pytorch-bot[bot]", "facebook-github-bot"}
-    item.comments = [comment for comment in item.comments if comment['author'] not in ignored_authors]
-    item.review_comments = [review_comment for review_comment in item.review_comments if review_comment['author'] not in ignored_authors]
+    strip_ignored_comments(item)
 
     # Rule 5: Filter out items if all comments within the specified date range are created by ignored authors
     filtered_comments = [comment for comment in item.comments + item.review_comments if rules['start_date'] <= datetime.fromisoformat(comment['created_at'].replace('Z', '+00:00')).replace(tzinfo=None) <= rules['end_date']]
     if filtered_comments and all(comment['author'] in ignored_authors for comment in filtered_comments):
-        logger.info(f"Filtering out '{item.title}' because all comments within the specified date range are created by ignored authors.")
-        return False
+        logger.info("Filtering out '%s' because all comments within the specified date range are created by ignored authors.", item.title)
+        return False, "only bot comments"
+
+    return True, "matches all rules"
 
-    return True
+def render_item(item, need_comments=True):
+    return item.full_str(need_comments=need_comments)
+
+def render_clusters(clusters, need_comments=True, render=render_item):
+    """
+    Render the clusters produced by dedup.cluster_items for summarization. Each near-duplicate
+    group is rendered as its first item followed by the URLs of its duplicates, and groups of
+    the same cluster are adjacent and reference each other. render(item, need_comments) renders
+    an item, GitHubItem.full_str by default. Returns the representative items and their
+    rendered texts.
+    """
+    representatives = []
+    texts = []
+    for cluster in clusters:
+        for group in cluster:
+            text = render(group[0], need_comments)
+            if len(group) > 1:
+                text += "\nNear-duplicates: " + ", ".join(item.url for item in group[1:])
+            related_urls = [other[0].url for other in cluster if other is not group]
+            if related_urls:
+                text += "\nRelated: " + ", ".join(related_urls)
+            representatives.append(group[0])
+            texts.append(text)
+    return representatives, texts
 
 def print_items(items, dump_comments=False):
     """
@@ -393,7 +550,7 @@ def print_items(items, dump_comments=False):
         print(item.full_str(need_comments=dump_comments))
         print()
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Fetch, filter, and display GitHub issues and pull requests for a specified repository.")
     parser.add_argument("--owner", type=str, default="pytorch", help="Owner of the GitHub repository")
     parser.add_argument("--repo", type=str, default="pytorch", help="Name of the GitHub repository")
@@ -409,19 +566,59 @@ def main():
     parser.add_argument("--only-prs", action="store_true", help="Dump only pull requests (default: dump both issues and PRs)")
     parser.add_argument("--print-items", action="store_true", help="Print the filtered GitHub items to stdout")
     parser.add_argument("--no-summarize", action="store_true", help="Do not summarize the filtered GitHub items")
-    parser.add_argument("--serving", type=str, choices=["OpenAI", "DeepSeek"], default="DeepSeek", help="Which serving to be called")
+    parser.add_argument("--serving", type=str, choices=list(llm_backends.backends), default="DeepSeek", help="Which serving to be called (backends are configured in llm_backends.py and llm_backends.json)")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="Override the maximum number of concurrent requests to the serving")
+    parser.add_argument("--llm-deadline", type=float, default=llm_resilience.default_policy.deadline, help="Seconds to get a reply for an LLM request, retries included")
+    parser.add_argument("--llm-hedge-after", type=float, default=None, help="Send a hedged LLM request when no reply arrived within this many seconds")
+    parser.add_argument("--no-llm-failover", action="store_true", help="Do not fail over to the fallback serving when the serving is unavailable")
     parser.add_argument("--combine-summaries", action="store_true", help="Combine summaries")
+    parser.add_argument("--dedup", action="store_true", help="Collapse near-duplicate items and group related items before summarization")
+    parser.add_argument("--dedup-max-distance", type=int, default=3, help="Maximum SimHash distance in bits for two items to be near-duplicates")
+    parser.add_argument("--related-min-similarity", type=float, default=0.5, help="Minimum MinHash similarity of titles and labels for two items to be grouped as related")
+    parser.add_argument("--condense", action="store_true", help="Strip template comments, quoted replies and bot commands, and collapse code and log blocks of the items before summarization (see condense.py)")
+    parser.add_argument("--condense-rules", type=str, default=None, help="Comma-separated condensation rules to apply (default: all)")
+    parser.add_argument("--max-comment-tokens", type=int, default=500, help="Approximate token cap per comment with --condense")
+    parser.add_argument("--max-item-tokens", type=int, default=4000, help="Approximate token cap per item with --condense")
+    parser.add_argument("--token-budget", type=int, default=None, help="Rank the items by relevance and only summarize the top ones within this many tokens of item text (of the per-item summaries with --incremental), listing the rest by title (see ranking.py)")
+    parser.add_argument("--cost-budget", type=float, default=None, help="Like --token-budget, with the budget in dollars for the serving. With --incremental, the per-item summary requests are not included")
+    parser.add_argument("--incremental", action="store_true", help="Summarize items individually and reuse the per-item summaries cached in the database, so that only new or changed items are sent to the LLM")
     parser.add_argument("--send-email", action="store_true", help="Send email with the filtered items")
-    args = parser.parse_args()
-
-    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), format='%(asctime)s - %(levelname)s - %(message)s')
+    parser.add_argument("--record", type=str, default=None, help="Record all GitHub API responses of this run to the given archive (see github_replay.py)")
+    parser.add_argument("--replay", type=str, default=None, help="Serve all GitHub API requests from the given archive instead of the network")
+    parser.add_argument("--run-report", type=str, default=None, help="Write a JSON report with per-stage timings, GitHub request counts and LLM token usage to this file")
+    parser.add_argument("--prometheus-textfile", type=str, default=None, help="Write the run metrics to this Prometheus textfile")
+    parser.add_argument("--filter-workers", type=int, default=1, help="Processes evaluating the filtering rules, 0 for one per CPU core (useful for backfills)")
+    parser.add_argument("--backfill", action="store_true", help="Fetch the items with the date-sharded parallel crawler of backfill.py, for long date ranges")
+    parser.add_argument("--backfill-workers", type=int, default=4, help="Number of shards crawled in parallel with --backfill")
+    parser.add_argument("--shard-days", type=int, default=7, help="Number of days per shard with --backfill")
+    parser.add_argument("--no-search-index", action="store_true", help="Do not update the full-text search index (see search_index.py)")
+    parser.add_argument("--export-parquet", type=str, default=None, help="Append the new and changed items to the partitioned Parquet datasets in this directory (see export_parquet.py)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.llm_concurrency is not None:
+        llm_backends.configure_backend(args.serving, max_concurrency=args.llm_concurrency)
+    llm_resilience.configure(deadline=args.llm_deadline, hedge_after=args.llm_hedge_after, failover=not args.no_llm_failover)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), format='%(asctime)s - %(levelname)s - %(message)s', force=True)
 
     if not args.db_path:
         db_path = f"{args.owner}_{args.repo}_db"
     else:
         db_path = args.db_path
 
+    instrumentation.start_run("summarize_github", args.run_report, args.prometheus_textfile)
+
     token, _, _ = get_tokens()
+    if args.record:
+        github_replay.enable_recording(args.record)
+    elif args.replay:
+        github_replay.enable_replay(args.replay)
+        # No token is needed to serve recorded responses
+        token = token or "replay"
+    instrumentation.instrument_github()
     start_date = args.start_date + "T00:00:00Z"
     end_date = args.end_date + "T23:59:59Z"
     cur_date = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
@@ -433,16 +630,40 @@ def main():
     if not token:
         logger.error("Error: GitHub token not found in environment variables.")
     else:
+        import item_store
+        from github import Github
+        from search_index import SearchIndex, IndexedDB, index_path
         g = Github(token)
         repo = g.get_repo(f"{args.owner}/{args.repo}")
 
-        with shelve.open(db_path) as db:
+        index = contextlib.nullcontext() if args.no_search_index else SearchIndex(index_path(db_path))
+        with item_store.open_db(db_path) as db, index:
+            if not args.no_search_index:
+                # Keep the full-text search index up to date with every item written
+                db = IndexedDB(db, index)
             logger.info("Starting to fetch issues and pull requests...")
-            refresh_items(repo, start_date, end_date, db)
-            refresh_item_comments(repo, start_date, db)
+            if args.backfill:
+                import backfill
+                with instrumentation.span("backfill"):
+                    failed = backfill.backfill(lambda: Github(token), f"{args.owner}/{args.repo}", filter_start_date, filter_end_date, db,
+                                               workers=args.backfill_workers, shard_days=args.shard_days)
+                if failed:
+                    logger.error("The backfill is incomplete, not processing partial data. Run again to retry the failed shards.")
+                    sys.exit(1)
+            else:
+                with instrumentation.span("refresh_items"):
+                    refresh_items(repo, start_date, end_date, db)
+                with instrumentation.span("refresh_item_comments"):
+                    refresh_item_comments(repo, start_date, db)
 
             # Load items from the database
-            items = list(db.values())
+            with instrumentation.span("load_items"):
+                items = list(iter_items(db))
+
+        if args.export_parquet:
+            import export_parquet
+            with instrumentation.span("export_parquet"):
+                export_parquet.export_items(items, args.export_parquet, args.owner, args.repo)
 
         if not args.retrieve_only:
             # Define filtering rules
@@ -460,7 +681,7 @@ def main():
                 items = [item for item in items if '/pull/' in item.url]
 
             # Filter items according to the rules
-            filtered_items = filter_items(items, rules)
+            filtered_items = filter_items(items, rules, args.filter_workers)
 
             if args.print_items:
                 # Print filtered items
@@ -518,7 +739,52 @@ Finally, various infrastructure updates ...
 Below is the detailed information for generating the summary:
 
     """
-                summaries = text_summarize([item.full_str(need_comments=args.dump_comments) for item in filtered_items], serving=args.serving, instruction=instruction)
+                render = render_item
+                if args.condense:
+                    import condense
+                    condenser = condense.Condenser(args.condense_rules.split(",") if args.condense_rules else None,
+                                                   max_comment_tokens=args.max_comment_tokens, max_item_tokens=args.max_item_tokens)
+                    render = condenser.render
+                if args.dedup:
+                    with instrumentation.span("dedup"):
+                        from dedup import cluster_items
+                        clusters = cluster_items(filtered_items, max_distance=args.dedup_max_distance, min_similarity=args.related_min_similarity)
+                        summarized_items, item_texts = render_clusters(clusters, need_comments=args.dump_comments, render=render)
+                else:
+                    summarized_items = filtered_items
+                    item_texts = [render(item, args.dump_comments) for item in filtered_items]
+                if args.condense:
+                    condenser.report()
+                if args.incremental:
+                    with instrumentation.span("summarize_items"):
+                        item_summaries = summarize_items_incrementally(summarized_items, item_texts, db_path, serving=args.serving)
+                    # Combine the cached per-item summaries instead of the full item texts, falling back
+                    # to the full text of the items whose summarization failed
+                    item_texts = [
+                        f"Title: {item.title}\nURL: {item.url}\nState: {item.state}\nSummary: {summary}" if summary is not None else text
+                        for item, summary, text in zip(summarized_items, item_summaries, item_texts)
+                    ]
+                # The budget applies to the texts of the digest prompt, i.e. to the per-item summaries
+                # with --incremental
+                briefs = []
+                if args.token_budget is not None or args.cost_budget is not None:
+                    import ranking
+                    budgets = [args.token_budget] if args.token_budget is not None else []
+                    if args.cost_budget is not None:
+                        cost_token_budget = ranking.token_budget_for_cost(llm_backends.get_backend(args.serving), args.cost_budget)
+                        if cost_token_budget is None:
+                            logger.info("The %s serving is free, --cost-budget does not limit the items.", args.serving)
+                        else:
+                            budgets.append(cost_token_budget)
+                    if budgets:
+                        with instrumentation.span("ranking"):
+                            summarized_items, item_texts, briefs = ranking.select(summarized_items, item_texts, rules, min(budgets))
+                if briefs:
+                    item_texts.append("Other items, mention them by title only:\n" + "\n".join(briefs))
+                with instrumentation.span("summarize"):
+                    summaries = text_summarize(item_texts, serving=args.serving, instruction=instruction)
+                failed_parts = summaries.count(None)
+                summaries = [summary for summary in summaries if summary is not None]
                 if args.combine_summaries:
                     combine_instruction = """
 Please combine the summaries of the individual GitHub issues and pull requests into a single blog-style summary.
@@ -529,7 +795,12 @@ Requirements:
 Below are the concatenated summaries:
 
 """
-                    summaries = text_summarize(summaries, instruction=combine_instruction)
+                    with instrumentation.span("combine_summaries"):
+                        combined = text_summarize(summaries, serving=args.serving, instruction=combine_instruction)
+                    # Keep the uncombined summaries rather than losing a part of them
+                    summaries = combined if None not in combined else summaries
+                if failed_parts:
+                    logger.error("%d parts of the digest could not be summarized, see the errors above.", failed_parts)
                 logger.info("Summary of filtered GitHub Items:")
                 for summary in summaries:
                     print(summary)
@@ -549,8 +820,11 @@ Below are the concatenated summaries:
                     f.write(f"Summary of {args.owner}/{args.repo} from {filter_start_date} to {filter_end_date}:\n\n")
                     for summary in summaries:
                         f.writelines(summary)
+                    if failed_parts:
+                        f.write(f"\n\nNote: {failed_parts} parts of the activity could not be summarized.\n")
 
                 if args.send_email:
+                    from mail_util import send_email_with_attachment
                     send_email_with_attachment(
                         file_path=md_file_path,
                         subject=f"{args.owner}/{args.repo} - {cur_file_name}",
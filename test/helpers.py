@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summarize_github import GitHubItem
+
+def make_item(number=1, title=None, description="description", kind="pull", submitter="user", tags=(), assignees=(), reviewers=(),
+              created_at="2024-07-10T08:00:00", comments=(), review_comments=(), state="open"):
+    """
+    Build a GitHubItem of repository o/r for the tests. kind is "pull" or "issues", the title
+    defaults to "Item {number}" and the comments are copied.
+    """
+    return GitHubItem(number, f"Item {number}" if title is None else title, f"https://github.com/o/r/{kind}/{number}", description,
+                      submitter, list(tags), list(assignees), list(reviewers), created_at,
+                      [dict(comment) for comment in comments], [dict(comment) for comment in review_comments], state)
@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backfill
+from summarize_github import GitHubItem
+
+class _Issue:
+    def __init__(self, number, created_at, updated_at):
+        self.number = number
+        self.created_at = datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc)
+        self.updated_at = datetime.fromisoformat(updated_at).replace(tzinfo=timezone.utc)
+
+class _Repo:
+    def __init__(self, issues):
+        self.issues = issues
+        self.since = []
+
+    def get_issues(self, state, since, sort, direction):
+        self.since.append(since)
+        return sorted((issue for issue in self.issues if issue.updated_at.replace(tzinfo=None) >= since), key=lambda issue: issue.updated_at)
+
+class _Github:
+    rate_limiting = (-1, -1)
+    rate_limiting_resettime = 0
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def get_repo(self, name):
+        return self.repo
+
+def _fetch_item(repo, issue):
+    github_item = GitHubItem(issue.number, f"Item {issue.number}", "", "", "user", [], [], [], issue.created_at.isoformat(), [], [], "open")
+    github_item.updated_at = issue.updated_at.isoformat()
+    return github_item
+
+class TestBackfill(unittest.TestCase):
+    def test_date_shards(self):
+        shards = backfill.date_shards(datetime(2024, 1, 1), datetime(2024, 1, 10, 23, 59, 59), 4)
+        self.assertEqual([backfill.shard_key(shard) for shard in shards], [
+            "2024-01-01T00:00:00Z/2024-01-04T23:59:59Z",
+            "2024-01-05T00:00:00Z/2024-01-08T23:59:59Z",
+            "2024-01-09T00:00:00Z/2024-01-10T23:59:59Z",
+        ])
+
+    def test_backfill(self):
+        repo = _Repo([
+            _Issue(1, "2024-01-02T00:00:00", "2024-01-03T00:00:00"),
+            # Created before the range, updated in it
+            _Issue(2, "2023-06-01T00:00:00", "2024-01-06T00:00:00"),
+            # Active in the range, updated again after it
+            _Issue(3, "2024-01-05T00:00:00", "2024-03-01T00:00:00"),
+            # Created after the range
+            _Issue(4, "2024-02-01T00:00:00", "2024-02-02T00:00:00"),
+            # Updated before the range
+            _Issue(5, "2023-12-01T00:00:00", "2023-12-02T00:00:00"),
+        ])
+        db = {}
+        start, end, now = datetime(2024, 1, 1), datetime(2024, 1, 10, 23, 59, 59), datetime(2024, 4, 1)
+        with patch("summarize_github.fetch_item", side_effect=_fetch_item) as fetch_item:
+            failed = backfill.backfill(lambda: _Github(repo), "o/r", start, end, db, workers=2, shard_days=4, now=now)
+            self.assertEqual(failed, [])
+            self.assertEqual(sorted(key for key in db if key != backfill.checkpoint_key), ["1", "2", "3"])
+            # 3 shards of the range and 20 of the 21 tail shards until now
+            self.assertEqual(len(db[backfill.checkpoint_key]), 23)
+
+            # A rerun only crawls the shard reaching into the present and does not fetch the unchanged items again
+            db["1"].summary = "cached summary"
+            repo.since.clear()
+            fetch_item.reset_mock()
+            backfill.backfill(lambda: _Github(repo), "o/r", start, end, db, workers=2, shard_days=4, now=now)
+            self.assertEqual(repo.since, [datetime(2024, 3, 31)])
+            fetch_item.assert_not_called()
+            self.assertEqual(db["1"].summary, "cached summary")
+
+    def test_rate_limit_budget(self):
+        sleeps = []
+        budget = backfill.RateLimitBudget(reserve=10, sleep=sleeps.append)
+        budget.update(50, 0)
+        budget.wait()
+        budget.update(5, 0)
+        budget.wait()
+        budget.wait()
+        self.assertEqual(sleeps, [1.0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import run_benchmarks
+
+class TestRunBenchmarks(unittest.TestCase):
+    def test_small_case_and_baseline(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, "bench_output.json")
+            run_benchmarks.main(["--cases", "apply_rules_summarize", "--sizes", "50", "--output", output])
+            with open(output) as f:
+                report = json.load(f)
+            self.assertEqual({"timestamp", "python", "platform", "cpu_count", "llm_latency", "llm_concurrency"}, set(report["meta"]))
+            [result] = report["results"]
+            self.assertEqual({"case", "size", "items", "ops", "seconds", "throughput", "p50_ms", "p99_ms", "peak_rss_mb",
+                              "peak_children_rss_mb"}, set(result))
+            self.assertEqual(("apply_rules_summarize", 50, 50, 50), (result["case"], result["size"], result["items"], result["ops"]))
+            self.assertGreater(result["throughput"], 0)
+            self.assertGreater(result["peak_rss_mb"], 0)
+
+            self.assertEqual([], run_benchmarks.compare_with_baseline(report["results"], report, 0.2))
+            faster = dict(result, throughput=result["throughput"] * 2)
+            self.assertEqual([("apply_rules_summarize", 50, faster["throughput"], result["throughput"])],
+                             run_benchmarks.compare_with_baseline(report["results"], {"results": [faster]}, 0.2))
+            # cases missing from the baseline are not regressions
+            self.assertEqual([], run_benchmarks.compare_with_baseline(report["results"], {"results": []}, 0.2))
+
+if __name__ == '__main__':
+    unittest.main()
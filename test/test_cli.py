@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_dir)
+
+import cli
+
+class TestCli(unittest.TestCase):
+    def test_entry_points_defer_heavy_imports(self):
+        code = ("import sys; sys.path.insert(0, sys.argv[1]); import cli, summarize_github, highlight_github_activities, llm_summarize; "
+                "print(sorted(m for m in ('github', 'openai', 'tiktoken', 'nltk', 'dotenv') if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code, repo_dir], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_batch_runs_commands_in_one_process(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "db")
+            lines = [
+                "# comment",
+                f"search --db-path {db_path} --json --nonexistent-option",
+                "llm-summarize --help",
+                f"search --db-path {db_path} --json",
+            ]
+            self.assertEqual(cli.run_batch(lines), 1)
+            self.assertTrue(os.path.exists(db_path + ".index"))
+
+    def test_batch_commands_do_not_leak_llm_settings(self):
+        import llm_backends
+        import llm_resilience
+        backend, policy = llm_backends.get_backend("DeepSeek"), llm_resilience.default_policy
+        state = cli._save_state()
+        llm_backends.configure_backend("DeepSeek", max_concurrency=1, base_url="http://127.0.0.1:9")
+        llm_resilience.configure(failover=False)
+        llm_resilience.circuit_breaker(llm_backends.get_backend("DeepSeek")).record_failure()
+        cli._finish_command(state)
+        self.assertIs(llm_backends.get_backend("DeepSeek"), backend)
+        self.assertIs(llm_resilience.default_policy, policy)
+        self.assertEqual(llm_resilience._breakers, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import condense
+from helpers import make_item
+
+_log = "\n".join(f"2024-07-10T08:00:{i:02d} step {i} ok" for i in range(40))
+_description = f"""<!-- Please describe your change -->
+Fix the oneDNN convolution on XPU.
+
+```
+{_log}
+RuntimeError: conv failed
+```
+"""
+
+class TestCondense(unittest.TestCase):
+    def test_rules(self):
+        self.assertEqual(condense.strip_html_comments("a<!-- hint\n more -->b"), "ab")
+        self.assertEqual(condense.strip_quoted_replies("> earlier comment\nI agree"), "I agree")
+        self.assertEqual(condense.strip_bot_commands("@pytorchbot merge\nthanks"), "thanks")
+        collapsed = condense.collapse_blocks(_description)
+        self.assertIn("lines omitted", collapsed)
+        self.assertIn("RuntimeError: conv failed", collapsed)
+        self.assertIn("lines omitted", condense.collapse_log_runs(_log))
+        self.assertEqual(condense.collapse_blank_lines("a  \n\n\n\nb\n"), "a\n\nb")
+
+    def test_render(self):
+        comments = [{"author": "a", "created_at": "2024-07-11", "body": "@pytorchbot rebase"},
+                    {"author": "b", "created_at": "2024-07-12", "body": "> Fix the conv\nLGTM " + "x" * 4000}]
+        condenser = condense.Condenser(max_comment_tokens=100)
+        text = condenser.render(make_item(title="Fix conv", description=_description, tags=["module: xpu"], created_at="2024-07-10T08:00:00Z", comments=comments))
+        self.assertNotIn("Please describe", text)
+        self.assertNotIn("@pytorchbot", text)
+        self.assertIn("LGTM", text)
+        self.assertIn("RuntimeError: conv failed", text)
+        report = condenser.report()
+        self.assertLess(report['tokens_after'], report['tokens_before'] / 2)
+        self.assertIn("comment_cap", report['saved_by_rule'])
+
+    def test_item_cap(self):
+        comments = [{"author": "a", "created_at": str(i), "body": f"comment {i} " + "x" * 200} for i in range(40)]
+        condenser = condense.Condenser(["blank_lines"], max_item_tokens=1000)
+        text = condenser.render(make_item(title="Fix conv", description=_description, tags=["module: xpu"], created_at="2024-07-10T08:00:00Z", comments=comments))
+        self.assertIn("comments omitted", text)
+        self.assertIn("comment 0 ", text)
+        self.assertIn("comment 39 ", text)
+        self.assertLessEqual(condense.estimate_tokens(text), 1000 + 20)
+
+    def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            condense.Condenser(["no_such_rule"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import cluster_items, find_near_duplicates, simhash, tokenize
+
+def _item(title, description, tags=()):
+    return SimpleNamespace(title=title, description=description, tags=list(tags))
+
+class TestNearDuplicates(unittest.TestCase):
+    def test_ids_and_hashes_are_ignored(self):
+        a = tokenize("Revert 3f2a9c1 because test_conv2d_123 failed on line 42")
+        b = tokenize("Revert 9b7e001 because test_conv2d_456 failed on line 7")
+        self.assertEqual(simhash(a), simhash(b))
+
+    def test_groups_near_duplicates_in_order(self):
+        body = " ".join(f"step {chr(97 + i % 26)}{chr(97 + i // 26)} of the failing job printed a warning" for i in range(60))
+        texts = [body + "test_add", "A completely different feature request for the compiler", body + "test_mul"]
+        self.assertEqual(find_near_duplicates(texts), [[0, 2], [1]])
+
+    def test_cluster_items(self):
+        body = "This test is failing on trunk and has been disabled in the CI. " * 10
+        items = [
+            _item("Flaky test_conv2d on XPU", body, ["module: xpu"]),
+            _item("Add oneDNN fusion for linear", "Fuse linear and gelu with oneDNN post ops."),
+            _item("Flaky test_conv2d on XPU", body, ["module: xpu"]),
+            _item("Add oneDNN fusion for linear and relu", "Fuse linear and relu via oneDNN post op."),
+        ]
+        clusters = cluster_items(items, min_similarity=0.5)
+        self.assertEqual(len(clusters), 2)
+        self.assertEqual(clusters[0], [[items[0], items[2]]])
+        self.assertEqual(clusters[1], [[items[1]], [items[3]]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export_parquet
+from helpers import make_item
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+def _make_item(number, state="open", comments=()):
+    return make_item(number, tags=["module: xpu"], reviewers=["reviewer"], created_at="2024-07-10T08:00:00Z", comments=comments, state=state)
+
+_comment = {"author": "a", "body": "looks good", "created_at": "2024-07-11T09:00:00Z"}
+
+class TestExportParquet(unittest.TestCase):
+    def test_item_rows(self):
+        rows = export_parquet.item_rows("o__r", _make_item(1, comments=[_comment, _comment]), None, comments_from=1)
+        self.assertEqual(rows['items'][0]['kind'], 'pr')
+        self.assertEqual(rows['items'][0]['date'], '2024-07-10')
+        self.assertEqual([row['position'] for row in rows['comments']], [1])
+        self.assertEqual(rows['comments'][0]['date'], '2024-07-11')
+        self.assertEqual([row['label'] for row in rows['labels']], ['module: xpu'])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_incremental_export(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            counts = export_parquet.export_items([_make_item(1, comments=[_comment]), _make_item(2)], output_dir, "o", "r")
+            self.assertEqual(counts, {'items': 2, 'comments': 1, 'reviews': 0, 'labels': 2})
+            # Unchanged items are skipped, only the new comment of a changed item is appended
+            counts = export_parquet.export_items([_make_item(1, "closed", comments=[_comment, _comment]), _make_item(2)], output_dir, "o", "r")
+            self.assertEqual(counts, {'items': 1, 'comments': 1, 'reviews': 0, 'labels': 1})
+
+            items = pyarrow.dataset.dataset(os.path.join(output_dir, "items"), partitioning="hive").to_table(columns=["number", "state", "repo", "date"])
+            self.assertEqual(sorted(zip(items["number"].to_pylist(), items["state"].to_pylist())), [(1, "closed"), (1, "open"), (2, "open")])
+            self.assertEqual(set(items["date"].to_pylist()), {"2024-07-10"})
+            comments = pyarrow.dataset.dataset(os.path.join(output_dir, "comments"), partitioning="hive").to_table()
+            self.assertEqual(sorted(comments["position"].to_pylist()), [0, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import github_replay
+from github import Github
+
+class _FakeResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self._headers = headers
+        self._body = body
+
+    def getheaders(self):
+        return self._headers.items()
+
+    def read(self):
+        return self._body
+
+class _FakeConnection:
+    # Serves a fixed repository and counts the requests that reach the "network"
+    requests = []
+
+    def __init__(self, host, port=None, **kwargs):
+        self.protocol = "https"
+        self.host = host
+
+    def request(self, verb, url, input, headers, stream=False):
+        _FakeConnection.requests.append((verb, url))
+
+    def getresponse(self):
+        body = json.dumps({"full_name": "o/r", "name": "r", "url": "https://api.github.com/repos/o/r"})
+        return _FakeResponse(200, {"Content-Type": "application/json", "Set-Cookie": "dropped"}, body)
+
+    def close(self):
+        pass
+
+class TestGithubReplay(unittest.TestCase):
+    def tearDown(self):
+        github_replay.disable()
+
+    def test_record_then_replay(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "run.jsonl.gz")
+            archive = github_replay.enable_recording(path, connection_classes=(_FakeConnection, _FakeConnection))
+            self.assertEqual(Github("token").get_repo("o/r").full_name, "o/r")
+            archive.close()
+            self.assertEqual(_FakeConnection.requests, [("GET", "/repos/o/r")])
+
+            github_replay.enable_replay(path)
+            self.assertEqual(Github().get_repo("o/r").full_name, "o/r")
+            self.assertEqual(len(_FakeConnection.requests), 1)
+            with self.assertRaises(KeyError):
+                Github().get_repo("o/other")
+
+    def test_record_from_threads(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "run.jsonl.gz")
+            archive = github_replay.ReplayArchive(path)
+
+            def record(thread):
+                for i in range(200):
+                    archive.record("GET", f"https://api.github.com/t{thread}", github_replay.RecordedResponse(200, {}, f"{thread}-{i}"))
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(record, range(4)))
+            archive.close()
+
+            # Every response is replayed once, in recording order per request
+            replay = github_replay.ReplayArchive(path)
+            for thread in range(4):
+                bodies = [replay.next_response("GET", f"https://api.github.com/t{thread}").body for _ in range(200)]
+                self.assertEqual(bodies, [f"{thread}-{i}" for i in range(200)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        instrumentation.reset()
+
+    def test_github_endpoint(self):
+        self.assertEqual(instrumentation.github_endpoint("/repos/pytorch/pytorch/pulls/123/reviews?per_page=100"),
+                         "/repos/{owner}/{repo}/pulls/{number}/reviews")
+        self.assertEqual(instrumentation.github_endpoint("https://api.github.com/repos/pytorch/pytorch/issues?since=2024"),
+                         "/repos/{owner}/{repo}/issues")
+        self.assertEqual(instrumentation.github_endpoint("/users/EikanWang"), "/users/{login}")
+        self.assertEqual(instrumentation.github_endpoint("/orgs/intel/members?page=2"), "/orgs/{login}/members")
+        self.assertEqual(instrumentation.github_endpoint("/repos/pytorch/pytorch/commits/1a2b3c4/status"),
+                         "/repos/{owner}/{repo}/commits/{sha}/status")
+        self.assertEqual(instrumentation.github_endpoint("/repos/pytorch/pytorch/compare/main...v2.4.0"),
+                         "/repos/{owner}/{repo}/compare/{sha}")
+        self.assertEqual(instrumentation.github_endpoint("/repos/pytorch/pytorch/git/trees/" + "a" * 40),
+                         "/repos/{owner}/{repo}/git/trees/{sha}")
+        self.assertEqual(instrumentation.github_endpoint("/repos/pytorch/pytorch/pulls/123/commits"),
+                         "/repos/{owner}/{repo}/pulls/{number}/commits")
+
+    def test_report(self):
+        with instrumentation.span("stage"):
+            pass
+        with instrumentation.span("stage"):
+            pass
+        instrumentation.observe_llm_call("model", 0.5, SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+        instrumentation._observe_rate_limit("core", 4990)
+        instrumentation._observe_rate_limit("core", 4980)
+
+        report = instrumentation.report()
+        self.assertEqual(report["stages"]["stage"]["calls"], 2)
+        counters = {(c["name"], tuple(c["labels"].values())): c["value"] for c in report["counters"]}
+        self.assertEqual(counters[("llm_prompt_tokens_total", ("model",))], 100)
+        self.assertEqual(counters[("github_rate_limit_consumed_total", ("core",))], 10)
+        self.assertEqual(report["llm_latency_seconds"]["p50"], 0.5)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "report.json")
+            prom_path = os.path.join(tmp_dir, "metrics.prom")
+            instrumentation.write_json(json_path)
+            instrumentation.write_prometheus(prom_path)
+            with open(json_path) as f:
+                self.assertIn("stages", json.load(f))
+            with open(prom_path) as f:
+                text = f.read()
+        self.assertIn('ai_tools_stage_calls_total{job="unknown",stage="stage"} 2', text)
+        self.assertIn("# TYPE ai_tools_llm_completion_tokens_total counter", text)
+
+if __name__ == "__main__":
+    unittest.main()
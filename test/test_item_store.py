@@ -0,0 +1,129 @@
+import os
+import shelve
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import item_store
+from helpers import make_item
+from search_index import IndexedDB, SearchIndex
+
+_bot_comment = {"author": "pytorch-bot[bot]", "body": "## Helpful Links\n" + "See artifacts and rendered test results at hud.pytorch.org\n" * 20,
+                "created_at": "2024-07-10T08:00:00"}
+
+def _make_item(number, comments=()):
+    return make_item(number, tags=["module: xpu"], reviewers=["reviewer"], comments=comments)
+
+class TestItemStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_roundtrip_and_dedup(self):
+        comment = {"author": "a", "body": "LGTM", "created_at": "2024-07-11T09:00:00"}
+        with item_store.open_db(self.db_path) as db:
+            db["1"] = _make_item(1, [_bot_comment, comment])
+            db["2"] = _make_item(2, [_bot_comment])
+            db["__checkpoints"] = {"shard": "done"}
+            item = db["1"]
+            self.assertEqual(item.comments, [_bot_comment, comment])
+            self.assertEqual(item.tags, ["module: xpu"])
+            self.assertIsNone(item.summary)
+            self.assertEqual(db["__checkpoints"], {"shard": "done"})
+            self.assertEqual(sorted(db), ["1", "2", "__checkpoints"])
+            # The bot comment body is stored once
+            self.assertEqual(db.stats()['blobs'], 2)
+
+            # Only the new comment is written
+            item.comments.append({"author": "b", "body": "merged", "created_at": "2024-07-12T09:00:00"})
+            with mock.patch.object(db, "_encode", wraps=db._encode) as encode:
+                db["1"] = item
+            self.assertEqual(len(db["1"].comments), 3)
+            self.assertEqual(encode.call_count, 1)
+
+            db.update_fields("2", updated_at="2024-07-12T10:00:00")
+            self.assertEqual(db.field_values("updated_at"), {"1": None, "2": "2024-07-12T10:00:00"})
+            self.assertEqual(db.field_values("title"), {"1": "Item 1", "2": "Item 2"})
+
+            del db["2"]
+            self.assertNotIn("2", db)
+            db.compact(train_dictionary=False)
+            self.assertEqual(db.stats()['blobs'], 3)
+            db.vacuum()
+
+        with item_store.open_db(self.db_path, readonly=True) as db:
+            self.assertEqual(db["1"].comments[-1]['body'], "merged")
+
+    @unittest.skipIf(item_store.zstandard is None, "zstandard is not installed")
+    def test_compact_with_dictionary(self):
+        with item_store.open_db(self.db_path) as db:
+            for number in range(200):
+                body = f"Rebase of #{number} failed, see https://github.com/o/r/actions/runs/{number * 7919} for details.\n" * 3
+                db[str(number)] = _make_item(number, [{"author": "pytorchmergebot", "body": body, "created_at": "2024-07-10T08:00:00"}])
+            db.compact()
+            self.assertIsNotNone(db.stats()['dictionary'])
+            self.assertIn("#17 failed", db["17"].comments[0]['body'])
+
+    def test_concurrent_access(self):
+        with item_store.open_db(self.db_path) as db:
+            db["1"] = _make_item(1, [_bot_comment])
+        with item_store.open_db(self.db_path, readonly=True) as reader, item_store.open_db(self.db_path) as writer:
+            with reader.snapshot():
+                self.assertEqual(len(reader["1"].comments), 1)
+                # A write does not block the reader, nor change what its snapshot sees
+                writer["1"] = _make_item(1, [_bot_comment, {"author": "a", "body": "LGTM", "created_at": "2024-07-11T09:00:00"}])
+                writer.update_fields("1", summary="summary")
+                self.assertEqual(len(reader["1"].comments), 1)
+            item = reader["1"]
+            self.assertEqual((len(item.comments), item.summary), (2, "summary"))
+
+        # Concurrent writers wait for each other
+        def write(start):
+            with item_store.open_db(self.db_path) as db:
+                for number in range(start, start + 20):
+                    db[str(number)] = _make_item(number, [_bot_comment])
+        threads = [threading.Thread(target=write, args=(start,)) for start in (100, 200, 300)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with item_store.open_db(self.db_path, readonly=True) as db:
+            self.assertEqual(len(db), 61)
+
+    def test_migrate_from_shelve(self):
+        with shelve.open(self.db_path) as db:
+            db["1"] = _make_item(1, [_bot_comment])
+        with item_store.open_db(self.db_path) as db:
+            self.assertEqual(db["1"].comments, [_bot_comment])
+
+    def test_failed_migration_leaves_no_files(self):
+        with shelve.open(self.db_path) as db:
+            db["1"] = _make_item(1, [_bot_comment])
+        with mock.patch.object(item_store, "migrate", side_effect=RuntimeError("interrupted")):
+            with self.assertRaises(RuntimeError):
+                item_store.open_db(self.db_path)
+        self.assertFalse([name for name in os.listdir(self.tmp_dir.name) if ".sqlite" in name])
+
+    def test_append_comment(self):
+        comment = {"author": "a", "body": "LGTM", "created_at": "2024-07-11T09:00:00"}
+        with item_store.open_db(self.db_path) as db, SearchIndex(":memory:") as index:
+            indexed = IndexedDB(db, index)
+            indexed["1"] = _make_item(1, [_bot_comment])
+            self.assertTrue(indexed.append_comment("1", comment))
+            self.assertFalse(indexed.append_comment("1", dict(comment, body="edited")))
+            self.assertTrue(db.append_comment("1", _bot_comment, is_review=True))
+            item = db["1"]
+            self.assertEqual((item.comments, item.review_comments), ([_bot_comment, comment], [_bot_comment]))
+            self.assertEqual([r["number"] for r in index.search("lgtm")], [1])
+            with self.assertRaises(KeyError):
+                db.append_comment("2", comment)
+
+if __name__ == "__main__":
+    unittest.main()
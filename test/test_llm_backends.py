@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation
+import llm_backends
+import summarize_github
+from mock_llm_server import MockLLMServer
+
+class TestLLMBackends(unittest.TestCase):
+    def test_pack_chunks_respects_budget(self):
+        self.assertEqual(summarize_github.pack_chunks([3, 3, 3, 10, 1], 7), [(0, 2), (2, 3), (3, 4), (4, 5)])
+
+    def test_chat_against_local_server(self):
+        instrumentation.reset()
+        with MockLLMServer(reply="mock summary") as server:
+            backend = llm_backends.LLMBackend(name="Test", base_url=server.url, api_key_name="TEST_LLM_API_KEY", model="test-model",
+                                              context_window=1000, max_output_tokens=100, input_price=1.0, max_concurrency=3)
+            client = llm_backends.create_client(backend)
+            replies = llm_backends.map_concurrently(backend, lambda text: llm_backends.chat(client, backend, text), ["a", "b", "c", "d"])
+        self.assertEqual(replies, ["mock summary"] * 4)
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(server.requests[0]["model"], "test-model")
+        self.assertEqual(server.requests[0]["max_tokens"], 100)
+        counters = {(c["name"], c["labels"].get("model")): c["value"] for c in instrumentation.report()["counters"]}
+        self.assertEqual(counters[("llm_requests_total", "test-model")], 4)
+        self.assertGreater(counters[("llm_cost_usd_total", "test-model")], 0)
+
+    def test_system_prefix_cache_hits_and_coalescing(self):
+        instrumentation.reset()
+        instruction = "Summarize the GitHub activity below. " * 20
+        with MockLLMServer(latency=0.05) as server:
+            backend = llm_backends.LLMBackend(name="TestCache", base_url=server.url, api_key_name="TEST_LLM_API_KEY", model="cache-model",
+                                              context_window=1000, max_output_tokens=100, input_price=1.0, cached_input_price=0.1, max_concurrency=4)
+            client = llm_backends.create_client(backend)
+            texts = ["first text", "second text", "second text", "second text"]
+            replies = llm_backends.map_concurrently(backend, lambda text: llm_backends.chat(client, backend, text, system=instruction), texts)
+        # The identical requests are only sent once
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(replies[1], replies[3])
+        # Only requests in flight are kept
+        self.assertEqual(llm_backends._requests, {})
+        self.assertEqual(server.requests[0]["messages"][0], {"role": "system", "content": instruction})
+        data = instrumentation.report()
+        counters = {c["name"]: c["value"] for c in data["counters"] if c["labels"].get("model") == "cache-model"}
+        self.assertEqual(counters["llm_coalesced_requests_total"], 2)
+        self.assertEqual(counters["llm_cached_prompt_tokens_total"], len(instruction) // 4)
+        self.assertGreater(data["llm_prompt_cache_hit_ratio"], 0)
+        self.assertLess(backend.estimate_cost(100, 50, 3), backend.cost(350, 0))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            llm_backends.get_backend("NoSuchBackend")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_backends
+import llm_resilience
+from mock_llm_server import MockLLMServer
+
+_policy = llm_resilience.ResiliencePolicy(base_delay=0.01, max_delay=0.05, deadline=10.0)
+
+def _backend(name, server, **kwargs):
+    backend = llm_backends.LLMBackend(name=name, base_url=server.url, api_key_name="TEST_LLM_API_KEY", model=f"{name}-model",
+                                      context_window=1000, max_output_tokens=100, timeout=5.0, **kwargs)
+    llm_backends.register_backend(backend)
+    return backend
+
+class TestLLMResilience(unittest.TestCase):
+    def setUp(self):
+        llm_resilience.reset()
+        self.env = mock.patch.dict(os.environ, {"TEST_LLM_API_KEY": "test"})
+        self.env.start()
+        # Count words instead of loading the tiktoken encoding
+        self.tokens = mock.patch.object(llm_resilience, "prompt_tokens", side_effect=lambda messages: sum(len(m['content'].split()) for m in messages))
+        self.tokens.start()
+
+    def tearDown(self):
+        self.tokens.stop()
+        self.env.stop()
+
+    def _chat(self, backend, prompt, policy=_policy):
+        return llm_resilience.chat(llm_backends.create_client(backend), backend, prompt, policy=policy)
+
+    def test_transient_errors_are_retried(self):
+        with MockLLMServer(reply="ok", faults=[500, 429]) as server:
+            backend = _backend("RetryTest", server)
+            self.assertEqual(self._chat(backend, "retried prompt"), "ok")
+        self.assertEqual(len(server.requests), 3)
+
+    def test_permanent_errors_are_raised(self):
+        with MockLLMServer(reply="ok", faults=[400]) as server:
+            backend = _backend("PermanentTest", server)
+            with self.assertRaises(llm_resilience.PermanentLLMError):
+                self._chat(backend, "bad prompt")
+        self.assertEqual(len(server.requests), 1)
+
+    def test_exhausted_retries_are_raised(self):
+        with MockLLMServer(reply="ok", error_rate=1.0) as server:
+            backend = _backend("ExhaustedTest", server, max_retries=2)
+            with self.assertRaises(llm_resilience.TransientLLMError):
+                self._chat(backend, "failing prompt")
+        self.assertEqual(len(server.requests), 3)
+
+    def test_deadline(self):
+        policy = llm_resilience.ResiliencePolicy(base_delay=0.01, deadline=0.3)
+        with MockLLMServer(reply="ok", latency=2.0) as server:
+            backend = _backend("DeadlineTest", server)
+            start = time.monotonic()
+            with self.assertRaises(llm_resilience.TransientLLMError):
+                self._chat(backend, "slow prompt", policy)
+            self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_hedged_request_wins(self):
+        policy = llm_resilience.ResiliencePolicy(hedge_after=0.05, deadline=10.0)
+        with MockLLMServer(reply="ok", faults=[2.0]) as server:
+            backend = _backend("HedgeTest", server)
+            start = time.monotonic()
+            self.assertEqual(self._chat(backend, "hedged prompt", policy), "ok")
+            self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_circuit_breaker_fails_over(self):
+        policy = llm_resilience.ResiliencePolicy(base_delay=0.01, max_delay=0.05, failure_threshold=2, reset_timeout=60.0)
+        with MockLLMServer(reply="primary", error_rate=1.0) as primary_server, MockLLMServer(reply="fallback") as fallback_server:
+            _backend("FallbackTest", fallback_server)
+            primary = _backend("PrimaryTest", primary_server, max_retries=1, fallback="FallbackTest")
+            self.assertEqual(self._chat(primary, "first prompt", policy), "fallback")
+            self.assertEqual(llm_resilience.circuit_breaker(primary).state, "open")
+            # The open circuit breaker sends the next requests straight to the fallback
+            self.assertEqual(self._chat(primary, "second prompt", policy), "fallback")
+        self.assertEqual(len(primary_server.requests), 2)
+        self.assertEqual(len(fallback_server.requests), 2)
+
+    def test_no_failover_to_smaller_prompt_budget(self):
+        with MockLLMServer(reply="primary", error_rate=1.0) as primary_server, MockLLMServer(reply="fallback") as fallback_server:
+            fallback = _backend("SmallFallbackTest", fallback_server)
+            primary = _backend("LargePrimaryTest", primary_server, max_retries=0, fallback="SmallFallbackTest")
+            with mock.patch.object(llm_resilience, "prompt_tokens", return_value=fallback.prompt_budget + 1):
+                with self.assertRaises(llm_resilience.TransientLLMError):
+                    self._chat(primary, "large prompt")
+        self.assertEqual(len(fallback_server.requests), 0)
+
+    def test_permanent_error_does_not_close_the_breaker(self):
+        breaker = llm_resilience.CircuitBreaker("BreakerTest", failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        # A malformed trial request releases the trial, the breaker stays half-open
+        breaker.release()
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+if __name__ == '__main__':
+    unittest.main()
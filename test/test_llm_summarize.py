@@ -0,0 +1,99 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_backends
+import llm_resilience
+import llm_summarize
+from llm_summarize import SummarySpill, iter_chunks, iter_file_blocks, iter_paragraph_blocks, read_file_block
+from mock_llm_server import MockLLMServer
+
+class TestStreamingChunking(unittest.TestCase):
+    def test_blocks_end_at_paragraphs(self):
+        text = "".join(f"Paragraph {i} line one.\nLine two.\n\n" for i in range(100))
+        blocks = list(iter_paragraph_blocks(io.StringIO(text), block_size=128))
+        self.assertEqual("".join(blocks), text)
+        self.assertGreater(len(blocks), 1)
+        for block in blocks[:-1]:
+            self.assertTrue(block.endswith("\n\n"))
+
+    def test_file_blocks_are_byte_ranges(self):
+        text = "".join(f"Paragraph {i} with ünicode.\nLine two.\n\n" for i in range(100)) + "Last line"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "input.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            blocks = list(iter_file_blocks(path, block_size=128))
+            self.assertGreater(len(blocks), 1)
+            self.assertEqual("".join(read_file_block(*block) for block in blocks), text)
+
+    def test_summary_spill(self):
+        with mock.patch.object(llm_summarize, "count_tokens", side_effect=lambda text: len(text.split())):
+            spill = SummarySpill()
+            spill.append("first\nsummary")
+            spill.append("second")
+        self.assertEqual(list(spill), ["first\nsummary", "second"])
+        self.assertEqual(spill.num_tokens, 3)
+        output = io.StringIO()
+        spill.write_to(output)
+        self.assertEqual(output.getvalue(), "first\nsummary second")
+        spill.close()
+
+    def test_chunks_with_overlap(self):
+        sentences = [(f"s{i}.", 10) for i in range(10)]
+        chunks = list(iter_chunks(iter(sentences), max_tokens=30, overlap_tokens=10))
+        self.assertEqual(chunks[0], "s0. s1. s2.")
+        # The last sentence of the previous chunk is repeated at the start of the next one
+        self.assertEqual(chunks[1], "s2. s3. s4.")
+        self.assertEqual(chunks[-1].split()[-1], "s9.")
+
+class _LineTokenizer:
+    def tokenize(self, block):
+        return [line for line in block.split("\n") if line]
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.saved_backends = dict(llm_backends.backends)
+        llm_resilience.reset()
+        # Split lines and count words instead of loading the punkt and tiktoken models
+        word_count = lambda text: len(text.split())
+        self.patches = [
+            mock.patch.object(llm_summarize, "load_punkt", return_value=_LineTokenizer()),
+            mock.patch.object(llm_summarize, "count_tokens", side_effect=word_count),
+            mock.patch.object(llm_resilience, "prompt_tokens", side_effect=lambda messages: sum(word_count(m['content']) for m in messages)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        llm_backends.restore_backends(self.saved_backends)
+        llm_resilience.reset()
+
+    def test_failed_chunk_is_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, MockLLMServer(reply="mock summary", faults=[400]) as server:
+            input_file = os.path.join(tmp_dir, "input.txt")
+            with open(input_file, "w", encoding="utf-8") as f:
+                f.write("".join(f"Sentence {i} has exactly six words.\n" for i in range(9)))
+            output_file = os.path.join(tmp_dir, "summary.txt")
+            combined_file = os.path.join(tmp_dir, "combined.txt")
+            with self.assertRaises(SystemExit) as exit, mock.patch("sys.stdout", new_callable=io.StringIO):
+                llm_summarize.main(["--serving", "Local", "--base-url", server.url, "--llm-concurrency", "1", "--no-llm-failover",
+                                    "--input-file", input_file, "--segment-workers", "1", "--max-chunk-tokens", "18",
+                                    "--overlap-tokens", "0", "--output-file", output_file, "--dump-combined-summary", combined_file])
+            self.assertEqual(exit.exception.code, 1)
+            # The first of the three chunks failed permanently and was not retried
+            self.assertEqual(len(server.requests), 4)
+            with open(combined_file, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "mock summary mock summary")
+            with open(output_file, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "mock summary")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import copy
+import os
+import sys
+import unittest
+from datetime import datetime
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(repo_dir)
+sys.path.append(os.path.join(repo_dir, "benchmarks"))
+
+import highlight_github_activities
+import parallel_filter
+import summarize_github
+import synthetic
+
+_rules = {'start_date': datetime(2024, 7, 10), 'end_date': datetime(2024, 7, 20), 'specified_user': '', 'number_of_ccer': 10}
+
+class TestParallelFilter(unittest.TestCase):
+    def test_summarize_parallel_matches_sequential(self):
+        items = synthetic.summarize_items(parallel_filter.min_parallel_items + 50)
+        sequential = summarize_github.filter_items(copy.deepcopy(items), _rules, workers=1)
+        parallel = summarize_github.filter_items(items, _rules, workers=2)
+        self.assertEqual([item.number for item in parallel], [item.number for item in sequential])
+        self.assertEqual([item.comments for item in parallel], [item.comments for item in sequential])
+
+    def test_highlight_parallel_matches_sequential(self):
+        items = synthetic.highlight_items(parallel_filter.min_parallel_items + 50)
+        sequential = highlight_github_activities.filter_items(items, 0, _rules, workers=1)
+        parallel = highlight_github_activities.filter_items(items, 0, _rules, workers=2)
+        self.assertEqual([item.number for item in parallel], [item.number for item in sequential])
+        self.assertTrue(sequential)
+
+    def test_record_reasons(self):
+        stats = parallel_filter.record_reasons([(True, "a"), (False, "b"), (True, "a")])
+        self.assertEqual(stats, {(True, "a"): 2, (False, "b"): 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_backends
+import ranking
+from helpers import make_item
+
+_rules = {'start_date': datetime(2024, 7, 10), 'end_date': datetime(2024, 7, 10, 23, 59, 59), 'specified_user': 'EikanWang'}
+
+_comment = {"author": "a", "created_at": "2024-07-10T09:00:00", "body": "looks good"}
+
+def _make_item(number, title, **fields):
+    return make_item(number, title, created_at="2024-07-01T08:00:00", **fields)
+
+class TestRanking(unittest.TestCase):
+    def test_score(self):
+        quiet = _make_item(1, "Update docs", state="closed")
+        busy = _make_item(2, "Fix flaky test", reviewers=["r1", "r2"], comments=[_comment] * 10)
+        relevant = _make_item(3, "Enable oneDNN conv on XPU", tags=["module: xpu"], reviewers=["EikanWang"])
+        scores = [ranking.score(item, _rules) for item in (quiet, busy, relevant)]
+        self.assertLess(scores[0], scores[1])
+        self.assertLess(scores[1], scores[2])
+
+    def test_select(self):
+        items = [_make_item(1, "Update docs"), _make_item(2, "Enable XPU", tags=["module: xpu"]), _make_item(3, "Fix typo")]
+        texts = ["x" * 400, "y" * 400, "z" * 400]
+        selected, selected_texts, briefs = ranking.select(items, texts, _rules, token_budget=130)
+        self.assertEqual([item.number for item in selected], [2])
+        self.assertEqual(selected_texts, ["y" * 400])
+        self.assertEqual(len(briefs), 2)
+        self.assertIn("https://github.com/o/r/pull/1", briefs[0])
+
+        # Without room for the brief lines, the remaining items are only counted
+        _, _, briefs = ranking.select(items, texts, _rules, token_budget=5)
+        self.assertEqual(briefs, ["- ... and 3 more items"])
+
+    def test_token_budget_for_cost(self):
+        backend = llm_backends.LLMBackend(name="Test", base_url="", api_key_name="", model="m", context_window=11000, max_output_tokens=1000,
+                                          input_price=1.0, output_price=10.0)
+        # 1 + 1000 * 10 / 10000 = 2 dollars per million tokens
+        self.assertEqual(ranking.token_budget_for_cost(backend, 1.0), 500000)
+        # A free backend is not limited by the cost
+        self.assertIsNone(ranking.token_budget_for_cost(llm_backends.get_backend("Local"), 1.0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import make_item
+from search_index import IndexedDB, SearchIndex, keyword_matches, pattern_literals
+from utils import intel_upstreaming_key_words
+
+def _make_item(number, title, description, kind="issues", **fields):
+    return make_item(number, title, description, kind=kind, created_at="2024-01-01T00:00:00+00:00", **fields)
+
+class TestSearchIndex(unittest.TestCase):
+    def test_pattern_literals(self):
+        self.assertEqual(pattern_literals("ntel.*GPU"), ["ntel", "GPU"])
+        self.assertEqual(pattern_literals("oneDNN"), ["oneDNN"])
+        self.assertIsNone(pattern_literals("a|b"))
+        self.assertIsNone(pattern_literals("ntel.*CI"))
+
+    def test_incremental_index_and_queries(self):
+        with SearchIndex(":memory:") as index:
+            db = IndexedDB({}, index)
+            db["1"] = _make_item(1, "Conv fusion for XPU", "Uses oneDNN primitives.")
+            db["2"] = _make_item(2, "Fix CUDA graph capture", "Unrelated.", kind="pull")
+            db["3"] = _make_item(3, "Dynamo recompiles", "On an Intel Arc GPU.")
+
+            self.assertEqual([r["number"] for r in index.search("onednn")], [1])
+            self.assertEqual(index.match_patterns(intel_upstreaming_key_words), {1, 3})
+            self.assertEqual(index.search("cuda", kind="issue"), [])
+
+            item = db["2"]
+            item.comments.append({"author": "a", "body": "Should this use oneDNN too?", "created_at": "2024-05-02T00:00:00+00:00"})
+            db["2"] = item
+            self.assertEqual(sorted(r["number"] for r in index.search("onednn")), [1, 2])
+            self.assertEqual([r["number"] for r in index.search("onednn", since="2024-05-01", until="2024-05-31")], [2])
+            self.assertEqual(index.match_patterns(["oneDNN"], fields=("title", "description")), {1})
+
+            # An edited comment body is re-indexed
+            item.comments[-1] = dict(item.comments[-1], body="Should this use cuDNN instead?")
+            db["2"] = item
+            self.assertEqual([r["number"] for r in index.search("onednn")], [1])
+            self.assertEqual([r["number"] for r in index.search("cudnn")], [2])
+
+    def test_keyword_matches(self):
+        items = [_make_item(1, "Conv fusion for XPU", "Uses oneDNN primitives."), _make_item(2, "Fix CUDA graph capture", "Unrelated."),
+                 _make_item(3, "Dynamo recompiles", "On an Intel Arc GPU.", tags=["module: mkldnn"])]
+        self.assertEqual(keyword_matches(items, fields=("title", "description", "labels")),
+                         {"title": {1}, "description": {1, 3}, "labels": {3}})
+
+if __name__ == "__main__":
+    unittest.main()
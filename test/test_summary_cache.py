@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import item_store
+import llm_resilience
+import summarize_github
+from helpers import make_item
+from summarize_github import summarize_items_incrementally
+
+def _make_item(number, description):
+    return make_item(number, description=description, kind="issues", created_at="2024-01-01T00:00:00")
+
+class TestIncrementalSummaries(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run(self, items):
+        with item_store.open_db(self.db_path) as db:
+            stored = [db[str(item.number)] for item in items]
+        texts = [item.full_str() for item in stored]
+        with mock.patch.object(summarize_github, "create_client"), \
+             mock.patch.object(summarize_github, "summarize_chunk", side_effect=lambda client, text, instruction, **kwargs: f"summary of {text[:9]}") as summarize:
+            summaries = summarize_items_incrementally(stored, texts, self.db_path)
+        return summaries, summarize.call_count
+
+    def test_only_new_or_changed_items_are_summarized(self):
+        items = [_make_item(1, "first"), _make_item(2, "second")]
+        with item_store.open_db(self.db_path) as db:
+            for item in items:
+                db[str(item.number)] = item
+
+        summaries, calls = self._run(items)
+        self.assertEqual(calls, 2)
+        self.assertEqual(summaries, ["summary of Number: 1", "summary of Number: 2"])
+
+        summaries, calls = self._run(items)
+        self.assertEqual(calls, 0)
+        self.assertEqual(summaries, ["summary of Number: 1", "summary of Number: 2"])
+
+        with item_store.open_db(self.db_path) as db:
+            changed = db["2"]
+            changed.description = "second, edited"
+            db["2"] = changed
+        _, calls = self._run(items)
+        self.assertEqual(calls, 1)
+
+    def test_failed_items_stay_stale(self):
+        items = [_make_item(1, "first"), _make_item(2, "second")]
+        with item_store.open_db(self.db_path) as db:
+            for item in items:
+                db[str(item.number)] = item
+
+        def summarize(client, text, instruction, **kwargs):
+            if text.startswith("Number: 2"):
+                raise llm_resilience.TransientLLMError("unavailable")
+            return f"summary of {text[:9]}"
+        with item_store.open_db(self.db_path) as db:
+            stored = [db[str(item.number)] for item in items]
+        with mock.patch.object(summarize_github, "create_client"), mock.patch.object(summarize_github, "summarize_chunk", side_effect=summarize):
+            summaries = summarize_items_incrementally(stored, [item.full_str() for item in stored], self.db_path)
+        self.assertEqual(summaries, ["summary of Number: 1", None])
+
+        # The successful summary was persisted, only the failed item is summarized again
+        _, calls = self._run(items)
+        self.assertEqual(calls, 1)
+
+    def test_key_depends_on_instruction(self):
+        self.assertNotEqual(summarize_github.item_summary_key("text", "a"), summarize_github.item_summary_key("text", "b"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_profiles import UserProfileCache
+
+class _User:
+    # Stand-in for a PyGithub user stub, counting the lazy profile fetches
+    fetches = 0
+
+    def __init__(self, login, email=None):
+        self.login = login
+        self._email = email
+
+    @property
+    def email(self):
+        _User.fetches += 1
+        return self._email
+
+class TestUserProfileCache(unittest.TestCase):
+    def setUp(self):
+        _User.fetches = 0
+        self.now = 1000.0
+
+    def test_lookup_once_per_ttl(self):
+        profiles = UserProfileCache(ttl=100, clock=lambda: self.now)
+        self.assertEqual(profiles.email(_User("a", "a@intel.com")), "a@intel.com")
+        self.assertEqual(profiles.email(_User("a", "a@intel.com")), "a@intel.com")
+        self.assertEqual(profiles.email(_User("b")), "Unknown")
+        self.assertEqual(profiles.email(None), "Unknown")
+        self.assertEqual(_User.fetches, 2)
+        self.now += 100
+        profiles.email(_User("a", "a@intel.com"))
+        self.assertEqual(_User.fetches, 3)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "profiles.json")
+            with UserProfileCache(path, clock=lambda: self.now) as profiles:
+                profiles.email(_User("a", "a@intel.com"))
+            with UserProfileCache(path, clock=lambda: self.now) as profiles:
+                self.assertEqual(profiles.lookup(_User("a"))['email'], "a@intel.com")
+                self.assertEqual(profiles.email(_User("a")), "a@intel.com")
+            self.assertEqual(_User.fetches, 1)
+
+if __name__ == "__main__":
+    unittest.main()
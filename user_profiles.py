@@ -0,0 +1,86 @@
+# Persistent cache of GitHub user profiles (login -> email).
+#  1. The user objects embedded in issues, comments and reviews only carry the login. Reading
+#     their email makes PyGithub fetch /users/{login}, once per object, so the same
+#     contributors were fetched again for every comment. The cache fetches a profile at most once
+#     per login and TTL, and only reads the email of the embedded object when it does.
+#  2. Profiles are kept in a JSON file (by default user_profiles.json next to this file) shared by
+#     the runs of the collectors. Entries older than the TTL are fetched again on their next use.
+#     Only the fields used by the filtering rules are cached.
+
+import json
+import logging
+import os
+import threading
+import time
+
+import instrumentation
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_profiles.json")
+default_ttl_days = 7
+
+class UserProfileCache:
+    """
+    Login -> profile cache. Use it as a context manager to load the file and save it on exit;
+    without a path, profiles are only cached in memory.
+    """
+    def __init__(self, path=None, ttl=default_ttl_days * 86400, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._dirty = False
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self._profiles = json.load(f)
+            logger.info("Loaded %d user profiles from %s.", len(self._profiles), self.path)
+        return self
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock, atomic_write(self.path) as f:
+            json.dump(self._profiles, f, indent=1, sort_keys=True)
+            self._dirty = False
+
+    def __enter__(self):
+        return self.load()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def lookup(self, user):
+        """
+        Profile of a PyGithub user: {"email", "fetched_at"}. None for a missing user (e.g. a
+        deleted account).
+        """
+        if user is None:
+            return None
+        login = user.login
+        now = self._clock()
+        with self._lock:
+            profile = self._profiles.get(login)
+        if profile is not None and now - profile['fetched_at'] < self.ttl:
+            instrumentation.count("user_profile_lookups_total", status="hit")
+            return profile
+        instrumentation.count("user_profile_lookups_total", status="miss")
+        profile = {
+            'email': user.email,
+            'fetched_at': now,
+        }
+        with self._lock:
+            self._profiles[login] = profile
+            self._dirty = True
+        return profile
+
+    def email(self, user):
+        """
+        Email of a PyGithub user, "Unknown" when it is missing or private.
+        """
+        profile = self.lookup(user)
+        return profile['email'] if profile and profile['email'] else "Unknown"
@@ -8,6 +8,7 @@
 #    }
 #  3. If token.json file is not found, all tokens will be get from the environment variables
 
+import contextlib
 import json
 import os
 
@@ -25,3 +26,38 @@ def get_tokens():
 
     # Return the tokens
     return data.get('GITHUB_TOKEN'), data.get('DEEPSEEK_API_KEY'), data.get('OPENAI_API_KEY')
+
+def get_token(name):
+    # Same lookup as get_tokens for a single token, e.g. the API key of an LLM backend
+    path = os.path.join(os.path.dirname(__file__), 'token_config.json')
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            data = json.load(file)
+        if data.get(name):
+            return data[name]
+    return os.environ.get(name)
+
+
+# Regex patterns (case-insensitive) of the keywords related to Intel upstreaming work
+intel_upstreaming_key_words = ["xpu", "xccl", "gpu_type", "ntel.*GPU", "ntel.*distributed", "ntel.*Triton", "mkl", "oneDNN", "mkldnn"]
+
+
+# Keys of the item database starting with this prefix hold metadata (e.g. backfill checkpoints)
+# rather than GitHub items
+reserved_key_prefix = "__"
+
+def is_item_key(key):
+    return not key.startswith(reserved_key_prefix)
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    # Write to a temporary file and rename it to path, so that an interrupted run or a concurrent
+    # reader never sees a partial file. The temporary file is removed if the write fails.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)